@@ -0,0 +1,131 @@
+import multiprocessing
+import queue
+
+import engine
+import solver
+from engine import PILE_COUNT, TABLEAU_COUNT
+
+# Solver queries (is the game still winnable, what is the next move of a win) run away from the frame loop
+# The solver is pure Python, so a thread would hold the interpreter lock the frame loop needs:
+# the searches run in a worker process, and the frame loop only puts boards in a queue and polls for the answers
+#
+# A board is sent as a frozen snapshot: one bytes object with the 13 pile sizes, the 7 face down counts and the
+# codes of the 52 cards pile after pile (bottom card first)
+# Only the newest request counts: every new board cancels the search of the previous one, the worker checks
+# the shared generation number while it searches and drops the requests that were outdated before they started
+#
+# A service runs one task on its boards: SOLVE answers with a solver.SolveResult, PLAY with the move the
+# computer player (player.py) picks, or None when there is none
+
+BOARD_SIZE = PILE_COUNT + TABLEAU_COUNT + engine.CARD_COUNT
+
+SOLVE = 'solve'
+PLAY = 'play'
+SEEN_LIMIT = 100000  # Boards the player remembers to avoid going back to, forgotten all at once
+
+
+def freeze(state):
+    return (bytes(len(cards) for cards in state.piles) + bytes(state.hidden)
+            + b''.join(bytes(cards) for cards in state.piles))
+
+
+def thaw(board):
+    state = engine.KlondikeState()
+    position = PILE_COUNT + TABLEAU_COUNT
+    for index in range(PILE_COUNT):
+        size = board[index]
+        state.piles[index][:] = board[position: position + size]
+        position += size
+    state.hidden[:] = board[PILE_COUNT: PILE_COUNT + TABLEAU_COUNT]
+    return state
+
+
+def solve(board, budget, cancelled):
+    search = solver.Solver(thaw(board), budget)
+    search.cancelled = cancelled
+    return search.solve()
+
+
+# The player of the worker process and the boards it went through
+_player = None
+_seen = set()
+
+
+# The player needs NumPy, it is only imported by the worker of a PLAY service
+def play(board, budget, cancelled):
+    global _player
+    import player
+    if _player is None:
+        _player = player.Player(budget)
+    state = thaw(board)
+    if len(_seen) >= SEEN_LIMIT:
+        _seen.clear()
+    _seen.add(player.board_key(state))
+    return _player.choose(state, cancelled, _seen)
+
+
+TASKS = {SOLVE: solve, PLAY: play}
+
+
+# The worker process: run the task on the boards as they come until None is received
+def work(requests, results, generation, task, budget):
+    run = TASKS[task]
+    while True:
+        request = requests.get()
+        if request is None:
+            return
+        number, board = request
+        if number != generation.value:
+            continue
+        result = run(board, budget, lambda: generation.value != number)
+        if number == generation.value:
+            results.put((number, board, result))
+
+
+# budget is the node budget of a SOLVE service and the playouts per move of a PLAY service
+class AnalysisService(object):
+    def __init__(self, budget=1000000, task=SOLVE):
+        # Spawned rather than forked, the game process has a display and threads of its own
+        context = multiprocessing.get_context('spawn')
+        self.generation = context.Value('Q', 0, lock=False)  # Number of the newest request
+        self.requests = context.Queue()
+        self.results = context.Queue()
+        self.process = context.Process(target=work, name='analysis', daemon=True,
+                                       args=(self.requests, self.results, self.generation, task, budget))
+        self.process.start()
+        self.board = None  # The board of the newest request (None after a cancel)
+        self.pending = False  # Waiting for the answer of the newest request
+
+    # Analyse a board, the search of any other board is cancelled
+    def submit(self, board):
+        if board == self.board:
+            return
+        self.generation.value += 1
+        self.board = board
+        self.pending = True
+        self.requests.put((self.generation.value, board))
+
+    def cancel(self):
+        if self.board is None:
+            return
+        self.generation.value += 1
+        self.board = None
+        self.pending = False
+
+    # The (board, answer) of the newest request once it is there, never waits for it
+    def poll(self):
+        while self.pending:
+            try:
+                number, board, result = self.results.get_nowait()
+            except queue.Empty:
+                return None
+            if number == self.generation.value:
+                self.pending = False
+                return board, result
+
+    def close(self):
+        self.cancel()
+        self.requests.put(None)
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
@@ -0,0 +1,244 @@
+import argparse
+import csv
+import multiprocessing
+import os
+import struct
+import sys
+import time
+
+import engine
+import solver
+
+# Analyse the deals of a range of RNG seeds on every core
+# Usage: python batch.py START STOP [--mode solve|playout] [--output results.csv] [--workers N]
+# Re-running the same command after an interruption only analyses the seeds missing from the output file
+
+# Result codes (the binary format stores the index, the csv format the name)
+RESULTS = ('loss', 'win', 'unknown', 'no win found')
+LOSS = 0
+WIN = 1
+UNKNOWN = 2
+NO_WIN_FOUND = 3  # The solver tried all but the moves it prunes, the deal may still be winnable
+
+# Binary record: seed, result, moves, nodes
+RECORD = struct.Struct('<QBHI')
+SEED_LIMIT = (1 << 64) - 1
+MOVE_LIMIT = (1 << 16) - 1
+NODE_LIMIT = (1 << 32) - 1
+
+
+def solve_seed(seed, options):
+    result = solver.solve_deal(engine.shuffled_codes(seed), options.node_budget, options.time_budget)
+    if result.status == solver.WINNABLE:
+        code = WIN
+    elif result.status == solver.NOT_WINNABLE:
+        code = LOSS
+    elif result.status == solver.NO_WIN_FOUND:
+        code = NO_WIN_FOUND
+    else:
+        code = UNKNOWN
+    return seed, code, len(result.moves), result.nodes
+
+
+def playout_seed(seed, options):
+    won, moves = solver.greedy_playout(engine.KlondikeState.deal(engine.shuffled_codes(seed)), options.move_limit)
+    return seed, WIN if won else LOSS, moves, 0
+
+
+# Worker entry point: analyse one chunk of seeds, skipping the ones that are already in the output file
+def run_chunk(task):
+    start, stop, done, options = task
+    analyse = solve_seed if options.mode == 'solve' else playout_seed
+    return [analyse(seed, options) for seed in range(start, stop) if seed not in done]
+
+
+class CsvResults(object):
+    def __init__(self, path):
+        self.path = path
+
+    def read(self):
+        with open(self.path, newline='') as handle:
+            for row in csv.reader(handle):
+                if len(row) == 4 and row[0] != 'seed':
+                    yield int(row[0]), RESULTS.index(row[1]), int(row[2]), int(row[3])
+
+    def open(self):
+        new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self.handle = open(self.path, 'a', newline='')
+        self.writer = csv.writer(self.handle)
+        if new:
+            self.writer.writerow(('seed', 'result', 'moves', 'nodes'))
+
+    # A whole chunk is written and flushed at once, so an interruption loses at most the chunks in flight
+    def write(self, rows):
+        self.writer.writerows((seed, RESULTS[code], moves, nodes) for seed, code, moves, nodes in rows)
+        self.handle.flush()
+
+    def close(self):
+        self.handle.close()
+
+
+class BinaryResults(object):
+    def __init__(self, path):
+        self.path = path
+
+    def read(self):
+        with open(self.path, 'rb') as handle:
+            while True:
+                data = handle.read(RECORD.size * 4096)
+                # A trailing partial record comes from an interrupted write and is dropped
+                for record in RECORD.iter_unpack(data[:len(data) - len(data) % RECORD.size]):
+                    yield record
+                if len(data) < RECORD.size * 4096:
+                    break
+
+    def open(self):
+        if os.path.exists(self.path):
+            size = os.path.getsize(self.path)
+            with open(self.path, 'r+b') as handle:
+                handle.truncate(size - size % RECORD.size)
+        self.handle = open(self.path, 'ab')
+
+    def write(self, rows):
+        self.handle.write(b''.join(RECORD.pack(*row) for row in rows))
+        self.handle.flush()
+
+    def close(self):
+        self.handle.close()
+
+
+def results_file(path):
+    if path.endswith('.csv'):
+        return CsvResults(path)
+    return BinaryResults(path)
+
+
+# Running totals, so nothing per deal has to be kept for the whole run
+class Stats(object):
+    def __init__(self):
+        self.counts = [0] * len(RESULTS)
+        self.moves = 0
+
+    def add(self, code, moves):
+        self.counts[code] += 1
+        if code == WIN:
+            self.moves += moves
+
+    def total(self):
+        return sum(self.counts)
+
+    def report(self):
+        total = self.total()
+        wins = self.counts[WIN]
+        lines = ['deals: %d' % total]
+        for name, count in zip(RESULTS, self.counts):
+            lines.append('%s: %d (%.2f%%)' % (name, count, 100.0 * count / total if total else 0.0))
+        if wins:
+            lines.append('average winning moves: %.1f' % (self.moves / float(wins)))
+        return '\n'.join(lines)
+
+
+# Look through an existing output file and count the finished seeds per chunk
+# Returns the stats so far and the finished seeds of every chunk that is only partly done
+def scan_done(results, start, stop, chunk_size):
+    stats = Stats()
+    counts = {}
+    if not os.path.exists(results.path):
+        return stats, {}
+
+    for seed, code, moves, nodes in results.read():
+        if start <= seed < stop:
+            stats.add(code, moves)
+            chunk = (seed - start) // chunk_size
+            counts[chunk] = counts.get(chunk, 0) + 1
+
+    partial = {}
+    for chunk, count in counts.items():
+        size = min(chunk_size, stop - start - chunk * chunk_size)
+        partial[chunk] = None if count >= size else set()
+    if any(done is not None for done in partial.values()):
+        for seed, code, moves, nodes in results.read():
+            if start <= seed < stop:
+                done = partial[(seed - start) // chunk_size]
+                if done is not None:
+                    done.add(seed)
+    return stats, partial
+
+
+def chunk_tasks(start, stop, chunk_size, partial, options):
+    empty = frozenset()
+    for index, first in enumerate(range(start, stop, chunk_size)):
+        done = partial.get(index, empty)
+        if done is None:
+            continue  # The whole chunk is in the output file already
+        yield first, min(first + chunk_size, stop), done, options
+
+
+# argparse type of an integer option from low to high (no upper bound if high is None),
+# so every value fits its field of RECORD and counts like --chunk are at least 1
+def bounded_int(low, high=None):
+    def parse(text):
+        try:
+            value = int(text)
+        except ValueError:
+            raise argparse.ArgumentTypeError('%r is not an integer' % text)
+        if high is None and value < low:
+            raise argparse.ArgumentTypeError('%d is less than %d' % (value, low))
+        if high is not None and not low <= value <= high:
+            raise argparse.ArgumentTypeError('%d is not in %d..%d' % (value, low, high))
+        return value
+    return parse
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Analyse the Klondike deals of a range of seeds')
+    parser.add_argument('start', type=bounded_int(0, SEED_LIMIT), help='first seed')
+    parser.add_argument('stop', type=bounded_int(0, SEED_LIMIT + 1), help='seed after the last one')
+    parser.add_argument('--mode', choices=('solve', 'playout'), default='solve')
+    parser.add_argument('--output', default='results.bin', help='.csv for text output, anything else is binary')
+    parser.add_argument('--workers', type=bounded_int(1), default=multiprocessing.cpu_count())
+    parser.add_argument('--chunk', type=bounded_int(1), default=256, help='seeds per work unit')
+    parser.add_argument('--node-budget', type=bounded_int(1, NODE_LIMIT), default=200000)
+    parser.add_argument('--time-budget', type=float, default=None, help='seconds per deal')
+    parser.add_argument('--move-limit', type=bounded_int(1, MOVE_LIMIT), default=1000,
+                        help='moves per playout (at most %d)' % MOVE_LIMIT)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(sys.argv[1:] if argv is None else argv)
+    results = results_file(options.output)
+    stats, partial = scan_done(results, options.start, options.stop, options.chunk)
+    resumed = stats.total()
+    if resumed:
+        print('resuming, %d deals already analysed' % resumed)
+
+    results.open()
+    begin = time.time()
+    pool = multiprocessing.Pool(options.workers)
+    try:
+        tasks = chunk_tasks(options.start, options.stop, options.chunk, partial, options)
+        for rows in pool.imap_unordered(run_chunk, tasks):
+            results.write(rows)
+            for seed, code, moves, nodes in rows:
+                stats.add(code, moves)
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        print('interrupted, run the same command again to resume')
+    except BaseException:
+        # Anything else stops the workers too, so join cannot hide the error behind 'Pool is still running'
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        results.close()
+
+    elapsed = time.time() - begin
+    analysed = stats.total() - resumed
+    print(stats.report())
+    print('%d deals in %.1fs (%.1f deals/s)' % (analysed, elapsed, analysed / elapsed if elapsed else 0.0))
+
+
+if __name__ == "__main__":
+    main()
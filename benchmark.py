@@ -0,0 +1,319 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+# Run without a window unless told otherwise
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pygame
+from pygame.locals import *
+
+import engine
+import profiler
+import solver
+from main import DoubleClickFunction, Main
+from outlook import WinSet
+
+# Times the hot paths of the game and writes them to a JSON report
+# Usage: python benchmark.py [--output report.json] [--compare baseline.json] [--tolerance 0.2]
+
+REPORT_VERSION = 1
+SEED = 8334
+CACHE_SEED = 0  # A deal the solver cannot finish in CACHE_NODES, so its whole budget goes to the search
+CACHE_NODES = 5000
+SHARED_DEALS = 20  # Deals whose winning lines fill the shared cache of bench_solver_cache
+BACKGROUND = -2  # Offset from the bottom right corner of the window, where there is never a pile
+
+
+def make_game(seed=SEED):
+    game = Main()
+    game.font = pygame.font.SysFont(None, 32)
+    game.start_time = pygame.time.get_ticks()
+    deal(game, seed)
+    return game
+
+
+# Start the deal of a seed, also forgetting any half finished double click
+def deal(game, seed):
+    game.reset(seed)
+    game.double_click = DoubleClickFunction()
+
+
+def click(pos):
+    return [pygame.event.Event(MOUSEBUTTONDOWN, pos=pos, button=1),
+            pygame.event.Event(MOUSEBUTTONUP, pos=pos, button=1)]
+
+
+# The mouse events a player would use for an engine move
+def move_events(game, move):
+    src, dst, count = move
+    piles = game.engine_piles()
+
+    if src == dst or src == engine.STOCK or dst == engine.STOCK:
+        pile = piles[engine.STOCK] if src != dst else piles[src]
+        rect = pile.cards[-1].rect if src == dst else pile.rect
+        return click((rect.x + 2, rect.y + 2))
+
+    card = piles[src].cards[-count]
+    target = piles[dst].cards[-1].rect if piles[dst].cards else piles[dst].rect
+    start = (card.rect.x + 2, card.rect.y + 2)
+    rel = (target.x - card.rect.x, target.y - card.rect.y)
+    end = (start[0] + rel[0], start[1] + rel[1])
+    return [pygame.event.Event(MOUSEBUTTONDOWN, pos=start, button=1),
+            pygame.event.Event(MOUSEMOTION, pos=end, rel=rel, buttons=(1, 0, 0)),
+            pygame.event.Event(MOUSEBUTTONUP, pos=end, button=1)]
+
+
+# Win the first deal from seed on that the solver can win quickly, and keep the events that did it
+# Returns the seed, the events and the board they lead to
+def script_game(game, seed=SEED, node_budget=20000):
+    while True:
+        deal(game, seed)
+        result = solver.solve_deal([card.code for card in game.cards], node_budget)
+        if result.status == solver.WINNABLE:
+            break
+        seed += 1
+
+    events = []
+    for move in result.moves:
+        src, dst, count = move
+        # The solver draws several cards at once, the player clicks once per card
+        steps = [engine.draw_move()] * count if src == engine.STOCK else [move]
+        for step in steps:
+            action = move_events(game, step)
+            # Every move ends with a click on the background, so two moves never count as a double click
+            # (but not once the game is won, as that click would start a new game)
+            for event in action:
+                game.handle_event(event)
+            if not game.winCondition():
+                width, height = game.screen.get_size()
+                background = click((width + BACKGROUND, height + BACKGROUND))
+                for event in background:
+                    game.handle_event(event)
+                action += background
+            events.extend(action)
+    return seed, events, game.snapshot()
+
+
+# Run func number times per sample and keep the time per call of every sample
+def measure(func, number, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number * 1e6)
+    samples.sort()
+    return {'min_us': round(samples[0], 3), 'median_us': round(samples[len(samples) // 2], 3), 'calls': number}
+
+
+# Also reports what a reset allocates (the cards and piles of the game are reused, so nearly nothing)
+def bench_reset(game, repeat):
+    seeds = iter(range(10 ** 9))
+    result = measure(lambda: deal(game, next(seeds)), 20, repeat)
+    result['allocations'] = profiler.allocations(lambda: game.reset(next(seeds)))
+    return result
+
+
+def bench_draw(game, repeat):
+    deal(game, SEED)
+
+    def frame():
+        game.screen.fill((0, 0, 0))
+        game.draw()
+    return measure(frame, 100, repeat)
+
+
+def bench_pile_churn(game, repeat):
+    deal(game, SEED)
+    pile = game.piles[6]
+
+    def churn():
+        for card in pile.takeCards(3):
+            pile.add_single(card)
+    return measure(churn, 1000, repeat)
+
+
+def bench_hit_test(game, repeat):
+    deal(game, SEED)
+    rng = random.Random(SEED)
+    width, height = game.screen.get_size()
+    events = [pygame.event.Event(MOUSEBUTTONDOWN, pos=(rng.randrange(width), rng.randrange(height)), button=1)
+              for _ in range(1000)]
+
+    def hit_test():
+        for event in events:
+            game.clicked_pile(event)
+    result = measure(hit_test, 10, repeat)
+    # Report the time per query
+    for key in ('min_us', 'median_us'):
+        result[key] = round(result[key] / len(events), 3)
+    return result
+
+
+# Every card checked against every tableau and foundation pile, like a drop looking for its pile
+def bench_rule_checks(game, repeat):
+    deal(game, SEED)
+    tableau = game.piles[:engine.TABLEAU_COUNT]
+    foundations = game.piles[-4:]
+    hands = [[card] for card in game.cards]
+
+    def checks():
+        for hand in hands:
+            for pile in tableau:
+                pile.valid_move_cards(hand)
+            for pile in foundations:
+                pile.valid_move_cards(hand, False)
+    result = measure(checks, 20, repeat)
+    # Report the time per check
+    count = len(hands) * (len(tableau) + len(foundations))
+    for key in ('min_us', 'median_us'):
+        result[key] = round(result[key] / count, 4)
+    return result
+
+
+# Share of the boards found in a cache already, with the plain and with the symmetric keys of solver.py
+def cache_hits(states):
+    result = {}
+    for name, key in (('plain', solver.state_hash), ('symmetric', solver.symmetric_hash)):
+        seen = set()
+        hits = 0
+        for state in states:
+            value = key(state)
+            hits += value in seen
+            seen.add(value)
+        result[name] = round(hits / float(len(states)), 4) if states else 0.0
+    return result
+
+
+# The transposition table of one search with either key, and a cache shared by the winning lines of several deals
+# (late boards of different deals often only differ by suit swaps and pile order), times the symmetric search
+def bench_solver_cache(game, repeat):
+    state = engine.KlondikeState.deal(engine.shuffled_codes(CACHE_SEED))
+    result = measure(lambda: solver.Solver(state, CACHE_NODES, symmetric=True).solve(), 1, repeat)
+    for symmetric in (False, True):
+        search = solver.Solver(state, CACHE_NODES, symmetric=symmetric)
+        solved = search.solve()
+        name = 'symmetric' if symmetric else 'plain'
+        result[name + '_hit_rate'] = round(search.hit_rate(), 4)
+        result[name + '_nodes_per_s'] = round(solved.nodes_per_second())
+
+    states = []
+    for seed in range(SEED, SEED + SHARED_DEALS):
+        board = engine.KlondikeState.deal(engine.shuffled_codes(seed))
+        solved = solver.solve_state(board, CACHE_NODES)
+        for move in solved.moves:
+            board.apply(move)
+            states.append(board.copy())
+    for name, rate in cache_hits(states).items():
+        result['shared_%s_hit_rate' % name] = rate
+    result['shared_boards'] = len(states)
+    return result
+
+
+def bench_scripted_game(game, repeat):
+    seed, events, expected = script_game(game)
+    if not expected.won():
+        raise RuntimeError('The scripted game was not won')
+
+    def replay():
+        deal(game, seed)
+        game.full_repaint = True
+        for event in events:
+            game.handle_event(event)
+            game.render_dirty()
+        if game.snapshot() != expected:
+            raise RuntimeError('The replayed game did not end on the scripted board')
+    result = measure(replay, 1, repeat)
+    result['events'] = len(events)
+    return result
+
+
+BENCHMARKS = (
+    ('reset', bench_reset),
+    ('draw_frame', bench_draw),
+    ('pile_churn', bench_pile_churn),
+    ('hit_test', bench_hit_test),
+    ('rule_checks', bench_rule_checks),
+    ('solver_cache', bench_solver_cache),
+    ('scripted_game', bench_scripted_game),
+)
+
+
+def run(names, repeat):
+    game = make_game()
+    results = {}
+    for name, bench in BENCHMARKS:
+        if names and name not in names:
+            continue
+        results[name] = bench(game, repeat)
+    return {
+        'version': REPORT_VERSION,
+        'python': platform.python_version(),
+        'pygame': pygame.version.ver,
+        'video_driver': os.environ.get('SDL_VIDEODRIVER'),
+        'results': results,
+    }
+
+
+# Compare the best times with a saved report (the minimum is the least noisy), returns the names that got slower than the tolerance allows
+def compare(report, baseline, tolerance):
+    regressions = []
+    for name, result in sorted(report['results'].items()):
+        old = baseline.get('results', {}).get(name)
+        if not old:
+            print('%-14s %10.3f us  (no baseline)' % (name, result['min_us']))
+            continue
+        ratio = result['min_us'] / old['min_us'] if old['min_us'] else float('inf')
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = 'REGRESSION'
+            regressions.append(name)
+        elif ratio < 1 - tolerance:
+            flag = 'faster'
+        print('%-14s %10.3f us  baseline %10.3f us  x%.2f %s' % (name, result['min_us'], old['min_us'],
+                                                                 ratio, flag))
+    return regressions
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Benchmark the hot paths of the game without a display')
+    parser.add_argument('names', nargs='*', help='benchmarks to run (all by default): %s'
+                        % ', '.join(name for name, bench in BENCHMARKS))
+    parser.add_argument('--output', help='write the JSON report here')
+    parser.add_argument('--compare', help='JSON report to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown before failing (0.2 = 20%%)')
+    parser.add_argument('--repeat', type=int, default=7, help='samples per benchmark')
+    parser.add_argument('--images', help='directory of the card images (defaults to WinSet.image_path)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(sys.argv[1:] if argv is None else argv)
+    if options.images:
+        WinSet.image_path = options.images
+
+    report = run(options.names, options.repeat)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, 'w') as handle:
+            handle.write(text + '\n')
+
+    if not options.compare:
+        print(text)
+        return 0
+    with open(options.compare) as handle:
+        baseline = json.load(handle)
+    regressions = compare(report, baseline, options.tolerance)
+    if regressions:
+        print('slower than the baseline: %s' % ', '.join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
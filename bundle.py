@@ -0,0 +1,131 @@
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+import pygame
+import pygame.image
+
+from outlook import WinSet
+
+# All the images of the game in one file, read through mmap
+# The images are packed ahead of time into one atlas whose pixels are stored in the byte order of the display
+# (BGRA, the usual 32 bit format with alpha), so loading is mapping the file and nothing is decoded or converted:
+# the pages of an image are only read from the disk the first time it is drawn
+# Layout: header (magic, version, atlas size, image count, stamp of the source files), one index entry per image
+# (name, rect in the atlas), then the atlas pixels
+# The stamp is a checksum of the names, sizes and modification times of the PNG files, so the game can tell a
+# bundle built from other or older files and load the PNG files instead
+# Working it out stats every PNG file, so the game only checks it when asked to (WinSet.check_bundle)
+# Build it from the PNG directory with: python bundle.py [source directory] [output file]
+
+MAGIC = b'SOLB'
+VERSION = 2  # 1 had no stamp and stored the names in lower case
+PIXEL_FORMAT = 'BGRA'
+HEADER = struct.Struct('<4sHHHHI')  # magic, version, atlas width, atlas height, image count, source stamp
+ENTRY = struct.Struct('<HHHH')  # x, y, width, height
+
+
+# Place rects of the given sizes row by row in rows of width pixels
+# Returns the rects and the height used
+def layout(sizes, width):
+    rects = []
+    x = y = row_h = 0
+    for w, h in sizes:
+        if x + w > width:
+            x, y, row_h = 0, y + row_h, 0
+        rects.append(pygame.Rect(x, y, w, h))
+        x += w
+        row_h = max(row_h, h)
+    return rects, y + row_h
+
+
+# The image files of a directory, sorted
+def source_files(source):
+    return sorted(file_name for file_name in os.listdir(source) if file_name.endswith(WinSet.image_type))
+
+
+# Checksum of the names, sizes and modification times of the image files of a directory
+def source_stamp(source):
+    stamp = 0
+    for file_name in source_files(source):
+        info = os.stat(os.path.join(source, file_name))
+        stamp = zlib.crc32(('%s %d %d\n' % (file_name, info.st_size, info.st_mtime_ns)).encode('utf-8'), stamp)
+    return stamp
+
+
+class AssetBundle(object):
+    def __init__(self, path):
+        with open(path, 'rb') as handle:
+            self.data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self.data) < HEADER.size:
+            self.data.close()
+            raise ValueError('%s is too short for an image bundle' % path)
+        magic, version, width, height, count, self.stamp = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            self.data.close()
+            raise ValueError('%s is not a version %d image bundle' % (path, VERSION))
+        self.size = width, height
+
+        self.index = {}  # name -> rect in the atlas
+        position = HEADER.size
+        for _ in range(count):
+            length = self.data[position]
+            name = self.data[position + 1: position + 1 + length].decode('ascii')
+            position += 1 + length
+            self.index[name] = pygame.Rect(ENTRY.unpack_from(self.data, position))
+            position += ENTRY.size
+        self.offset = position
+        if len(self.data) < position + width * height * 4:
+            self.data.close()
+            raise ValueError('%s is a damaged image bundle' % path)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def rect(self, name):
+        return self.index[name]
+
+    # Does the bundle hold all the names, and (with check_stamp) was it built from the image files in source as
+    # they are now
+    def matches(self, source, names, check_stamp=True):
+        if check_stamp and self.stamp != source_stamp(source):
+            return False
+        return all(name in self.index for name in names)
+
+    # A surface reading its pixels straight from the mapped file, it is only valid while the bundle is open
+    def atlas(self):
+        width, height = self.size
+        pixels = memoryview(self.data)[self.offset: self.offset + width * height * 4]
+        return pygame.image.frombuffer(pixels, self.size, PIXEL_FORMAT)
+
+    def close(self):
+        self.data.close()
+
+
+# Pack every image of the source directory into a bundle, under its file name without the extension
+def build(source, output):
+    names = source_files(source)
+    images = [pygame.image.load(os.path.join(source, file_name)) for file_name in names]
+    width = max(surface.get_width() for surface in images) * 13
+    rects, height = layout([surface.get_size() for surface in images], width)
+
+    atlas = pygame.Surface((width, height), pygame.SRCALPHA, 32)
+    index = [HEADER.pack(MAGIC, VERSION, width, height, len(images), source_stamp(source))]
+    for file_name, surface, rect in zip(names, images, rects):
+        name = file_name[:-len(WinSet.image_type)].encode('ascii')
+        atlas.blit(surface, rect)
+        index.append(struct.pack('<B', len(name)) + name + ENTRY.pack(*rect))
+
+    with open(output, 'wb') as handle:
+        handle.write(b''.join(index))
+        handle.write(pygame.image.tobytes(atlas, PIXEL_FORMAT))
+    return len(images)
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else WinSet.image_path
+    output = sys.argv[2] if len(sys.argv) > 2 else os.path.join(source, WinSet.image_bundle)
+    print('%d images written to %s' % (build(source, output), output))
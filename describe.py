@@ -1,17 +1,129 @@
+import bisect
+import collections
 import pygame.image
+import pygame.transform
 import pygame.rect
 import os.path
 
 from pygame import image
 
+import bundle
+import profiler
 from outlook import WinSet
 
 
-def image_loading(name):
+def file_loading(name):
+    profiler.counters['loads'] += 1
     set_image = pygame.image.load(os.path.join(WinSet.image_path, name + WinSet.image_type))
     return set_image.convert_alpha()
 
 
+# Process wide image cache
+# The images in WinSet.image_atlas are packed into a single atlas surface, every other image is kept on its own
+# If the image bundle built by bundle.py exists, its prebuilt atlas is used instead of the PNG files:
+# the whole atlas is one surface over the mapped file, so nothing is read from the disk before it is drawn
+# A bundle that is damaged, missing one of WinSet.image_atlas or (with WinSet.check_bundle) older than the PNG
+# files is left alone
+# When the window is scaled, get returns the images smooth-scaled to the current scale, each image is scaled
+# the first time it is asked for at a scale, and the scaled sets of the last WinSet.sprite_cache_size scales are kept
+# The cached surfaces are shared, so they must never be drawn onto
+class TextureCache(object):
+    atlas = None
+    textures = {}
+    bundle = None  # The opened bundle (False if there is none)
+    scale = 1
+    scaled = collections.OrderedDict()  # scale -> {name: scaled image}, least recently used first
+
+    @staticmethod
+    def open_bundle():
+        if TextureCache.bundle is None:
+            TextureCache.bundle = False
+            path = os.path.join(WinSet.image_path, WinSet.image_bundle)
+            if os.path.exists(path):
+                try:
+                    store = bundle.AssetBundle(path)
+                except (OSError, ValueError):
+                    return False
+                if store.matches(WinSet.image_path, WinSet.image_atlas, WinSet.check_bundle):
+                    TextureCache.bundle = store
+                else:
+                    store.close()
+        return TextureCache.bundle
+
+    # The atlas of the bundle, only converted if the display does not use the pixel format of the bundle
+    @staticmethod
+    def bundle_atlas(store):
+        profiler.counters['loads'] += 1
+        atlas = store.atlas()
+        if atlas.get_masks() != pygame.Surface((1, 1), pygame.SRCALPHA).convert_alpha().get_masks():
+            atlas = atlas.convert_alpha()
+        return atlas
+
+    # Pack the images row by row into one surface, each image is then a subsurface of the atlas
+    @staticmethod
+    def build_atlas(names):
+        loaded = [file_loading(name) for name in names]
+        width = max(surface.get_width() for surface in loaded) * 13
+        rects, height = bundle.layout([surface.get_size() for surface in loaded], width)
+
+        atlas = pygame.Surface((width, height), pygame.SRCALPHA).convert_alpha()
+        for name, surface, rect in zip(names, loaded, rects):
+            atlas.blit(surface, rect)
+            TextureCache.textures[name] = atlas.subsurface(rect)
+        TextureCache.atlas = atlas
+
+    # Images asked for after this are scaled by scale
+    @staticmethod
+    def set_scale(scale):
+        TextureCache.scale = scale
+        if scale == 1:
+            return
+        TextureCache.scaled[scale] = TextureCache.scaled.pop(scale, {})
+        while len(TextureCache.scaled) > WinSet.sprite_cache_size:
+            TextureCache.scaled.popitem(last=False)
+
+    @staticmethod
+    def get(name):
+        if TextureCache.scale == 1:
+            return TextureCache.unscaled(name)
+        sprites = TextureCache.scaled[TextureCache.scale]
+        sprite = sprites.get(name)
+        if sprite is None:
+            texture = TextureCache.unscaled(name)
+            size = (int(round(texture.get_width() * TextureCache.scale)),
+                    int(round(texture.get_height() * TextureCache.scale)))
+            sprite = sprites[name] = pygame.transform.smoothscale(texture, size)
+        return sprite
+
+    @staticmethod
+    def unscaled(name):
+        texture = TextureCache.textures.get(name)
+        if texture is None:
+            store = TextureCache.open_bundle()
+            if store and name in store:
+                if TextureCache.atlas is None:
+                    TextureCache.atlas = TextureCache.bundle_atlas(store)
+                texture = TextureCache.atlas.subsurface(store.rect(name))
+            elif TextureCache.atlas is None and name in WinSet.image_atlas:
+                TextureCache.build_atlas(WinSet.image_atlas)
+                return TextureCache.unscaled(name)
+            else:
+                texture = file_loading(name)
+            TextureCache.textures[name] = texture
+        return texture
+
+    # Needed if the display is created again, as the converted surfaces belong to the old one
+    @staticmethod
+    def clear():
+        TextureCache.atlas = None
+        TextureCache.textures = {}
+        TextureCache.scaled.clear()
+
+
+def image_loading(name):
+    return TextureCache.get(name)
+
+
 # Basic class on which all the other classes will depend
 class DescribeObject(object):
     def __init__(self, name, pos):
@@ -19,6 +131,8 @@ class DescribeObject(object):
         self.name = name
         # set up position and area (starts of as a 0 dimensional rect)
         self.rect = pygame.Rect(pos[0], pos[1], 0, 0)
+        # Called with (source pile, destination pile, card count) when the user's click moves or turns cards
+        self.on_action = None
 
     # check position availability
     def has_position(self, pos):
@@ -40,6 +154,11 @@ class DescribeObject(object):
     def move_position(self, move):
         self.rect.move_ip(move)
 
+    # Report a move made by this object (a pile turning its own top card passes itself twice and no cards)
+    def action(self, src, dst, count):
+        if self.on_action:
+            self.on_action(src, dst, count)
+
 
 # An object that has an image associated with it
 # Can be made invisible
@@ -53,9 +172,16 @@ class DescribeImage(DescribeObject):
 
     # Set up draw function
     def draw(self, screen):
-        if self.visible:
+        image = self.visible_image()
+        if image:
+            profiler.counters['blits'] += 1
             screen.blit(image, self.rect)
 
+    # The surface that is shown for this object right now (None when invisible)
+    def visible_image(self):
+        if self.visible:
+            return self.image
+
     # Each object is associated with an image.
     # As soon as the image is loaded, the self.rect attribute needs to be updated
     def set_image(self, image):
@@ -71,6 +197,11 @@ class DescribePile(DescribeImage):
     def __init__(self, name, pos, image, cards=[]):
         DescribeImage.__init__(self, name, pos, image)
         self.cards = []
+        # Set whenever the pile looks different, painted is the screen area the pile covered when last drawn
+        self.dirty = True
+        self.painted = None
+        # Called without arguments whenever the pile changes (used to keep the hit-testing index up to date)
+        self.on_change = None
         self.addCards(cards)
 
     # Are there any cards in the pile?
@@ -86,9 +217,31 @@ class DescribePile(DescribeImage):
     def allFaceUp(self, boolean):
         for card in self.cards:
             card.face_up = boolean
+        self.mark_dirty()
+
+    # Has to be called by anything that changes how the pile looks
+    def mark_dirty(self):
+        self.dirty = True
+        if self.on_change:
+            self.on_change()
+
+    # The screen areas that need to be repainted since the last call (the old and the new area of the pile)
+    def dirty_rects(self):
+        if not self.dirty:
+            return []
+        self.dirty = False
+        area = self.rect.unionall([card.rect for card in self.cards]) if self.cards else self.rect.copy()
+        rects = [area] if self.painted is None else [self.painted, area]
+        self.painted = area
+        return rects
+
+    # Could drawing the pile change anything inside rect (as of the last call of dirty_rects)
+    def overlaps(self, rect):
+        return self.painted is None or self.painted.colliderect(rect)
 
     # Draws the bottom symbol stored in self.image (generally used to show an empty pile)
     def drawBottom(self, screen):
+        profiler.counters['blits'] += 1
         screen.blit(self.image, self.rect)
 
     # Remove cards from the top of the pile (end of the list)
@@ -97,11 +250,18 @@ class DescribePile(DescribeImage):
         break_point = self.cardNum() - num
         to_take = self.cards[break_point:]  # Cards that are taken
         self.cards = self.cards[: break_point]  # Cards that remain
+        self.mark_dirty()
         return to_take
 
     def takeAll(self):
         return self.takeCards(self.cardNum())
 
+    # Empty the pile in place and move it to pos, so the same pile can show a new deal
+    def clear_pile(self, pos):
+        del self.cards[:]
+        DescribeObject.set_position(self, pos)
+        self.mark_dirty()
+
     # The set_position function moves all the cards, rather than setting the position directly
     # This allows tiled piles to be set correctly, as using set_position directly would make the tiled pile into simple pile
     def set_position(self, pos):
@@ -110,10 +270,12 @@ class DescribePile(DescribeImage):
 
         super(DescribePile, self).set_position(pos)
         for card in self.cards: card.move_position((x_move, y_move))
+        self.mark_dirty()
 
     def movePosition(self, move):
-        super(DescribePile, self).movePosition(move)
+        super(DescribePile, self).move_position(move)
         for card in self.cards: card.move_position(move)
+        self.mark_dirty()
 
     # Simple function that takes cards and puts them back
     def returnCards(self, cards):
@@ -154,6 +316,7 @@ class DescribeSimplePile(DescribePile):
         card.set_position((self.rect.x, self.rect.y))
         card.pile = self
         self.cards.append(card)
+        self.mark_dirty()
 
     # Add cards to this pile
     # If you just want to know if cards could be added by user, run validAddPile
@@ -168,6 +331,11 @@ class DescribeTilePile(DescribePile):
     def __init__(self, name, pos, image, init_space, add_space, cards=[]):
         self.init_space = init_space
         self.add_space = add_space
+        # All the cards drawn into one surface, kept until the pile changes
+        self.composite = None
+        self.composite_pos = None
+        # The y position of every card, kept for hit-testing until the pile changes
+        self.card_tops = None
         DescribePile.__init__(self, name, pos, image, cards)
 
     def draw(self, screen):
@@ -175,8 +343,40 @@ class DescribeTilePile(DescribePile):
             return
         if self.pile_empty():
             self.drawBottom(screen)
+            return
+        if self.composite is None:
+            self.compose()
+        profiler.counters['blits'] += 1
+        screen.blit(self.composite, self.composite_pos)
+
+    def compose(self):
+        area = self.cards[0].rect.unionall([card.rect for card in self.cards[1:]])
+        composite = pygame.Surface(area.size, pygame.SRCALPHA)
         for card in self.cards:
-            card.draw(screen)
+            image = card.visible_image()
+            if image:
+                profiler.counters['blits'] += 1
+                composite.blit(image, (card.rect.x - area.x, card.rect.y - area.y))
+        self.composite = composite
+        self.composite_pos = area.topleft
+
+    # Adding, taking, turning or moving cards all change the composite
+    def mark_dirty(self):
+        super(DescribeTilePile, self).mark_dirty()
+        self.composite = None
+        self.card_tops = None
+
+    # Index of the top most card at that position (-1 if there is none)
+    # The cards are stacked downwards, so only the cards starting above the position have to be checked
+    def card_at(self, pos):
+        if self.card_tops is None:
+            self.card_tops = [card.rect.y for card in self.cards]
+        i = bisect.bisect_right(self.card_tops, pos[1]) - 1
+        while i >= 0 and self.cards[i].rect.bottom > pos[1]:
+            if self.cards[i].has_position(pos):
+                return i
+            i -= 1
+        return -1
 
     # card is not allowed to add
     def validAddCards(self, pile):
@@ -199,6 +399,7 @@ class DescribeTilePile(DescribePile):
         card.pile = self
         self.cards.append(card)
         self.update_area()  # Don't forget to update the new area
+        self.mark_dirty()
 
     # Add cards to this pile
     def addCards(self, cards):
@@ -222,6 +423,10 @@ class DescribeTilePile(DescribePile):
         self.update_area()
         return result
 
+    def clear_pile(self, pos):
+        super(DescribeTilePile, self).clear_pile(pos)
+        self.update_area()
+
 
 # Set up the area for multi-piles
 # It does not have an image by itself, so self.rect has no dimension
@@ -240,6 +445,14 @@ class DescribeMultiPile(DescribeObject):
         new_pile.set_position((self.rect.x + displace, self.rect.y))
         self.piles.append(new_pile)
 
+    # Move to pos and space the piles out again from there (after self.space or their sizes changed)
+    def place(self, pos):
+        DescribeObject.set_position(self, pos)
+        displace = 0
+        for pile in self.piles:
+            pile.set_position((self.rect.x + displace, self.rect.y))
+            displace += pile.rect.width + self.space
+
     # Is a pile located at that position (return None if there is nothing)
     def get_pile(self, pos):
         for pile in self.piles:
@@ -251,7 +464,16 @@ class DescribeMultiPile(DescribeObject):
 
     def movePosition(self, move):
         for pile in self.piles:
-            pile.move_position(move)
+            pile.movePosition(move)
+
+    def dirty_rects(self):
+        rects = []
+        for pile in self.piles:
+            rects.extend(pile.dirty_rects())
+        return rects
+
+    def overlaps(self, rect):
+        return any(pile.overlaps(rect) for pile in self.piles)
 
     def draw(self, screen):
         for pile in self.piles:
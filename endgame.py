@@ -0,0 +1,275 @@
+import argparse
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+import time
+from collections import deque
+
+import batch
+import engine
+import solver
+from engine import FOUNDATION, PILE_COUNT, STOCK, TABLEAU_COUNT, WASTE
+
+# Endgame table: the distance to the win of late boards, looked up instead of searched
+# A board is in the endgame once every tableau card is face up and the talon holds at most TALON_LIMIT cards:
+# nothing is hidden any more, so the rest of the game can be solved exactly
+# The generator solves deals, follows the winning line to its first endgame board, and from there finds every
+# board the endgame moves reach and their distances to the win (a breadth first search back from the won boards)
+# The endgame moves are the moves the solver would try (see endgame_moves), the distances are exact among those
+#
+# Boards are keyed by solver.symmetric_hash, so a board counts for all its suit swaps and pile orders
+# Layout: header, then an open addressing hash table (linear probing, at most half full) of slot count keys
+# (8 bytes, 0 for an empty slot) followed by the distance of every slot (1 byte)
+# Build or grow it with: python endgame.py START STOP [--output endgame.tb] [--workers N]
+
+MAGIC = b'SOLE'
+VERSION = 2  # 1 was keyed by symmetric hashes that mixed up the suit colors
+TALON_LIMIT = 4
+HEADER = struct.Struct('<4sHHII')  # magic, version, talon limit, slot count, entry count
+KEY = struct.Struct('<Q')
+UNWINNABLE = 255  # Distance of a board no endgame move sequence wins
+
+
+def in_endgame(state, talon_limit=TALON_LIMIT):
+    return not any(state.hidden) and len(state.piles[STOCK]) + len(state.piles[WASTE]) <= talon_limit
+
+
+# 0 marks an empty slot of the table
+def table_key(state):
+    return solver.symmetric_hash(state) or 1
+
+
+# The moves of an endgame board the table is made of: the legal moves without taking cards back from the
+# foundations, splitting a run only when the card below can go to a foundation and moving a whole run only to
+# free a pile for a king (the same rules as solver.Solver.ordered_children)
+def endgame_moves(state):
+    piles = state.piles
+    tops = [state.top(pile) for pile in range(FOUNDATION, PILE_COUNT)]
+    king_waiting = None
+    moves = []
+    for move in state.legal_moves():
+        src, dst, count = move
+        if src >= FOUNDATION:
+            continue
+        if src < TABLEAU_COUNT and dst < TABLEAU_COUNT:
+            if count < len(piles[src]):
+                below = piles[src][-count - 1]
+                if not any(engine.can_found(top, below) for top in tops):
+                    continue
+            elif piles[dst]:
+                if king_waiting is None:
+                    king_waiting = (any(engine.can_fill(code) for pile in range(TABLEAU_COUNT)
+                                        for code in piles[pile][1:])
+                                    or any(engine.can_fill(code) for code in piles[STOCK] + piles[WASTE]))
+                if not king_waiting:
+                    continue
+            else:
+                continue  # A whole run onto an empty pile changes nothing
+        moves.append(move)
+    return moves
+
+
+# Every board the endgame moves reach from root, as (table key, distance) pairs
+def solve_endgame(root):
+    index = {solver.canonical_board(root): 0}
+    states = [root]
+    parents = [[]]
+    position = 0
+    while position < len(states):
+        state = states[position]
+        for move in endgame_moves(state):
+            child = state.copy()
+            child.apply(move)
+            board = solver.canonical_board(child)
+            number = index.get(board)
+            if number is None:
+                number = index[board] = len(states)
+                states.append(child)
+                parents.append([])
+            parents[number].append(position)
+        position += 1
+
+    distances = [UNWINNABLE] * len(states)
+    queue = deque(number for number, state in enumerate(states) if state.won())
+    for number in queue:
+        distances[number] = 0
+    while queue:
+        number = queue.popleft()
+        for parent in parents[number]:
+            if distances[parent] == UNWINNABLE:
+                distances[parent] = distances[number] + 1
+                queue.append(parent)
+    return [(table_key(state), distance) for state, distance in zip(states, distances)]
+
+
+# Worker entry point: the endgame boards of the winning lines of a chunk of seeds
+def run_chunk(task):
+    start, stop, node_budget, talon_limit = task
+    entries = []
+    roots = 0
+    for seed in range(start, stop):
+        state = engine.KlondikeState.deal(engine.shuffled_codes(seed))
+        result = solver.solve_state(state, node_budget)
+        for move in result.moves:
+            if in_endgame(state, talon_limit):
+                entries.extend(solve_endgame(state))
+                roots += 1
+                break
+            state.apply(move)
+    return stop - start, roots, entries
+
+
+class EndgameTable(object):
+    def __init__(self, path):
+        with open(path, 'rb') as handle:
+            self.data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # A short or damaged file is refused before anything is read from it
+        if len(self.data) < HEADER.size:
+            self.data.close()
+            raise ValueError('%s is too short for an endgame table' % path)
+        magic, version, self.talon_limit, self.slots, self.count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            self.data.close()
+            raise ValueError('%s is not a version %d endgame table' % (path, VERSION))
+        # The slots are a power of two and never full, or a lookup could run past them or never end
+        if (self.slots < 1 or self.slots & (self.slots - 1) or self.count * 2 > self.slots
+                or len(self.data) != HEADER.size + self.slots * (KEY.size + 1)):
+            self.data.close()
+            raise ValueError('%s is a damaged endgame table' % path)
+        self.distances = HEADER.size + self.slots * KEY.size
+
+    def __len__(self):
+        return self.count
+
+    # The slot of the key, or the empty slot where it would go
+    def slot(self, key):
+        mask = self.slots - 1
+        slot = key & mask
+        while True:
+            found = KEY.unpack_from(self.data, HEADER.size + slot * KEY.size)[0]
+            if found == key or found == 0:
+                return slot, found
+            slot = (slot + 1) & mask
+
+    # Moves to the win of a board (UNWINNABLE if there is none), None if the board is not in the table
+    def distance(self, state):
+        if not self.slots or not in_endgame(state, self.talon_limit):
+            return None
+        slot, found = self.slot(table_key(state))
+        if not found:
+            return None
+        return self.data[self.distances + slot]
+
+    # The first move of a shortest win from the board (None if the table does not know one)
+    def best_move(self, state):
+        distance = self.distance(state)
+        if distance is None or distance == UNWINNABLE or distance == 0:
+            return None
+        for move in endgame_moves(state):
+            child = state.copy()
+            child.apply(move)
+            if self.distance(child) == distance - 1:
+                return move
+
+    # Every (key, distance) in the table
+    def entries(self):
+        for slot in range(self.slots):
+            key = KEY.unpack_from(self.data, HEADER.size + slot * KEY.size)[0]
+            if key:
+                yield key, self.data[self.distances + slot]
+
+    def close(self):
+        self.data.close()
+
+
+# The table of the game, None if there is no usable file
+def load_table(path):
+    try:
+        return EndgameTable(path)
+    except (OSError, ValueError):
+        return None
+
+
+# Write a table of a {key: distance} dict, the file is replaced at once
+def write_table(path, distances, talon_limit=TALON_LIMIT):
+    slots = 1
+    while slots < len(distances) * 2:
+        slots *= 2
+    keys = [0] * slots
+    values = bytearray(slots)
+    for key, distance in distances.items():
+        slot = key & (slots - 1)
+        while keys[slot]:
+            slot = (slot + 1) & (slots - 1)
+        keys[slot] = key
+        values[slot] = distance
+
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as handle:
+        handle.write(HEADER.pack(MAGIC, VERSION, talon_limit, slots, len(distances)))
+        handle.write(struct.pack('<%dQ' % slots, *keys))
+        handle.write(values)
+    os.replace(temporary, path)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Solve the endgames of a range of seeds into the endgame table')
+    parser.add_argument('start', type=batch.bounded_int(0), help='first seed')
+    parser.add_argument('stop', type=batch.bounded_int(0), help='seed after the last one')
+    parser.add_argument('--output', default='endgame.tb', help='table file, created or grown (default %(default)s)')
+    parser.add_argument('--workers', type=batch.bounded_int(1), default=multiprocessing.cpu_count())
+    parser.add_argument('--chunk', type=batch.bounded_int(1), default=16, help='seeds per work unit')
+    parser.add_argument('--node-budget', type=batch.bounded_int(1), default=20000,
+                        help='solver budget for the winning line of a deal')
+    parser.add_argument('--talon', type=batch.bounded_int(0, engine.CARD_COUNT), default=TALON_LIMIT,
+                        help='most talon cards of an endgame board')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(sys.argv[1:] if argv is None else argv)
+    distances = {}
+    if os.path.exists(options.output):
+        table = EndgameTable(options.output)
+        if table.talon_limit != options.talon:
+            sys.exit('%s was built with --talon %d' % (options.output, table.talon_limit))
+        distances.update(table.entries())
+        table.close()
+    known = len(distances)
+
+    begin = time.time()
+    seeds = roots = 0
+    tasks = [(first, min(first + options.chunk, options.stop), options.node_budget, options.talon)
+             for first in range(options.start, options.stop, options.chunk)]
+    pool = multiprocessing.Pool(options.workers)
+    try:
+        for done, found, entries in pool.imap_unordered(run_chunk, tasks):
+            seeds += done
+            roots += found
+            distances.update(entries)
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        print('interrupted, the boards found so far are kept')
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        # The boards found so far are written first, whatever happens after
+        try:
+            write_table(options.output, distances, options.talon)
+        finally:
+            pool.join()
+
+    elapsed = time.time() - begin
+    print('%d seeds, %d endgames in %.1fs, %d boards added, %d in %s (%d bytes)'
+          % (seeds, roots, elapsed, len(distances) - known, len(distances), options.output,
+             os.path.getsize(options.output)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,251 @@
+import random
+
+from outlook import WinSet
+
+# Headless Klondike rules working on small integers instead of Card objects
+# Nothing in here imports pygame, so a deal can be simulated without a display
+
+# A card is encoded as its index in WinSet.image_names (0-51)
+# The names are ordered by number first and suit second, so the number is code // 4 + 1 and the suit is code % 4
+CARD_CODES = dict((name, code) for code, name in enumerate(WinSet.image_names))
+CARD_COUNT = len(CARD_CODES)
+SUITS = ''.join(name[-1] for name in WinSet.image_names[:4])
+RED_SUITS = (SUITS.index('d'), SUITS.index('h'))
+KING = 13
+
+# Pile indices follow the order of Main.piles: seven tableau piles, the talon (draw and discard), four foundations
+TABLEAU_COUNT = 7
+STOCK = 7
+WASTE = 8
+FOUNDATION = 9
+PILE_COUNT = 13
+
+
+# Card attributes and rule checks worked out once for every code, so every check below is a table lookup
+RANKS = bytes((code >> 2) + 1 for code in range(CARD_COUNT))
+SUIT_OF = bytes(code & 3 for code in range(CARD_COUNT))
+RED = bytes((code & 3) in RED_SUITS for code in range(CARD_COUNT))
+# STACKS[lower * CARD_COUNT + upper]: the card upper can be put on the face up tableau card lower
+# (alternate colors, descending numbers)
+STACKS = bytes(RANKS[lower] == RANKS[upper] + 1 and RED[lower] != RED[upper]
+               for lower in range(CARD_COUNT) for upper in range(CARD_COUNT))
+# SUCCESSOR[code]: the card that goes on code on a foundation (same suit, one number higher; NO_CARD after a king)
+NO_CARD = 255
+SUCCESSOR = bytes(code + 4 if RANKS[code] < KING else NO_CARD for code in range(CARD_COUNT))
+
+
+def rank(code):
+    return RANKS[code]
+
+
+def suit(code):
+    return SUIT_OF[code]
+
+
+def is_red(code):
+    return RED[code]
+
+
+# Can the card upper be put on the face up tableau card lower
+def can_stack(lower, upper):
+    return STACKS[lower * CARD_COUNT + upper]
+
+
+# Can the card be put on a foundation pile whose top card is top (None for an empty pile)
+def can_found(top, code):
+    if top is None:
+        return RANKS[code] == 1
+    return SUCCESSOR[top] == code
+
+
+# Only a king can be moved to an empty tableau pile
+def can_fill(code):
+    return RANKS[code] == KING
+
+
+# The deck order of the deal of seed (Main.shuffleCards deals its cards in this order)
+def shuffled_codes(seed):
+    codes = list(range(CARD_COUNT))
+    random.Random(seed).shuffle(codes)
+    return codes
+
+
+# A move is a (src, dst, count) tuple of pile indices
+# STOCK -> WASTE draws count cards one after the other, WASTE -> STOCK with the whole waste recycles the talon
+# Both turn the cards over, so their order is reversed
+# src == dst turns the top card of that tableau pile face up, anything else is a plain card transfer
+def draw_move():
+    return STOCK, WASTE, 1
+
+
+def flip_move(pile):
+    return pile, pile, 0
+
+
+# The complete state of one game
+# piles holds a bytearray of card codes per pile (the last code is the top card)
+# hidden holds the number of face down cards at the bottom of each tableau pile
+class KlondikeState(object):
+    __slots__ = ('piles', 'hidden')
+
+    def __init__(self, piles=None, hidden=None):
+        self.piles = piles if piles is not None else [bytearray() for _ in range(PILE_COUNT)]
+        self.hidden = hidden if hidden is not None else bytearray(TABLEAU_COUNT)
+
+    # Lay out a shuffled deck the same way Main.populatePiles does
+    # Pile i gets i + 1 cards with only the last one face up, the remaining cards go to the talon draw pile
+    @classmethod
+    def deal(cls, codes):
+        state = cls()
+        marker = 0
+        for i in range(TABLEAU_COUNT):
+            state.piles[i][:] = codes[marker: marker + i + 1]
+            state.hidden[i] = i
+            marker += i + 1
+        state.piles[STOCK][:] = codes[marker:]
+        return state
+
+    def copy(self):
+        return KlondikeState([bytearray(pile) for pile in self.piles], bytearray(self.hidden))
+
+    def __eq__(self, other):
+        return isinstance(other, KlondikeState) and self.piles == other.piles and self.hidden == other.hidden
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def top(self, pile):
+        cards = self.piles[pile]
+        if cards:
+            return cards[-1]
+
+    # How many cards lie at the top of a tableau pile face up
+    def face_up_count(self, pile):
+        return len(self.piles[pile]) - self.hidden[pile]
+
+    def foundation_count(self):
+        piles = self.piles
+        return len(piles[9]) + len(piles[10]) + len(piles[11]) + len(piles[12])
+
+    def won(self):
+        return self.foundation_count() == len(CARD_CODES)
+
+    # Check a move against the rules of objects.py (without the rect collision part)
+    def is_legal(self, move):
+        src, dst, count = move
+        piles = self.piles
+
+        if src == dst:
+            return src < TABLEAU_COUNT and 0 < self.hidden[src] == len(piles[src])
+        if src == STOCK:
+            return dst == WASTE and 0 < count <= len(piles[STOCK])
+        if dst == STOCK:
+            return src == WASTE and not piles[STOCK] and 0 < count == len(piles[WASTE])
+        if dst == WASTE or count < 1:
+            return False
+
+        if src < TABLEAU_COUNT:
+            if count > self.face_up_count(src):
+                return False
+        elif count != 1 or not piles[src]:
+            return False
+
+        card = piles[src][-count]
+        if dst >= FOUNDATION:
+            return count == 1 and can_found(self.top(dst), card)
+        if not piles[dst]:
+            return can_fill(card)
+        return self.face_up_count(dst) > 0 and can_stack(piles[dst][-1], card)
+
+    # Apply a move without checking it (please check if the move is valid first)
+    def apply(self, move):
+        src, dst, count = move
+        piles = self.piles
+        if src == dst:
+            self.hidden[src] -= 1
+        elif count == 1:
+            piles[dst].append(piles[src].pop())
+        elif src == STOCK or dst == STOCK:
+            cards = piles[src]
+            piles[dst] += cards[:-count - 1:-1]
+            del cards[-count:]
+        else:
+            cards = piles[src]
+            piles[dst] += cards[-count:]
+            del cards[-count:]
+
+    # Exactly reverses apply, so searches can walk the game tree without copying the state
+    def undo(self, move):
+        src, dst, count = move
+        piles = self.piles
+        if src == dst:
+            self.hidden[src] += 1
+        elif count == 1:
+            piles[src].append(piles[dst].pop())
+        elif src == STOCK or dst == STOCK:
+            cards = piles[dst]
+            piles[src] += cards[:-count - 1:-1]
+            del cards[-count:]
+        else:
+            cards = piles[dst]
+            piles[src] += cards[-count:]
+            del cards[-count:]
+
+    # Checked version of apply
+    def play(self, move):
+        if not self.is_legal(move):
+            raise ValueError('Illegal move %r' % (move,))
+        self.apply(move)
+
+    # Talon click: draw the top card, or take back the whole discard pile when the draw pile is empty
+    def talon_move(self):
+        if self.piles[STOCK]:
+            return STOCK, WASTE, 1
+        if self.piles[WASTE]:
+            return WASTE, STOCK, len(self.piles[WASTE])
+
+    # Every legal move in this state, foundation moves first
+    def legal_moves(self):
+        piles = self.piles
+        hidden = self.hidden
+        moves = []
+        tops = [self.top(f) for f in range(FOUNDATION, PILE_COUNT)]
+
+        # Moves to the foundations (only into the first empty foundation for aces, like the double click does)
+        for src in (WASTE,) + tuple(range(TABLEAU_COUNT)):
+            cards = piles[src]
+            if not cards or (src < TABLEAU_COUNT and hidden[src] == len(cards)):
+                continue
+            for i, top in enumerate(tops):
+                if can_found(top, cards[-1]):
+                    moves.append((src, FOUNDATION + i, 1))
+                    break
+
+        for src in range(TABLEAU_COUNT):
+            if hidden[src] and hidden[src] == len(piles[src]):
+                moves.append((src, src, 0))
+
+        # Moves onto the tableau
+        for dst in range(TABLEAU_COUNT):
+            target = piles[dst]
+            if target and hidden[dst] == len(target):
+                continue
+            for src in range(TABLEAU_COUNT):
+                if src == dst:
+                    continue
+                cards = piles[src]
+                for i in range(hidden[src], len(cards)):
+                    if (can_stack(target[-1], cards[i]) if target else can_fill(cards[i])):
+                        moves.append((src, dst, len(cards) - i))
+                        break
+            for src in (WASTE, FOUNDATION, FOUNDATION + 1, FOUNDATION + 2, FOUNDATION + 3):
+                cards = piles[src]
+                if cards and (can_stack(target[-1], cards[-1]) if target else can_fill(cards[-1])):
+                    moves.append((src, dst, 1))
+
+        talon = self.talon_move()
+        if talon:
+            moves.append(talon)
+        return moves
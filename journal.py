@@ -0,0 +1,46 @@
+import collections
+
+# Undo / redo history of the moves of one game
+# Every move is an engine move (src, dst, count) packed into a single int, so the history stays small,
+# and only the last limit moves are kept
+
+
+def pack(move):
+    src, dst, count = move
+    return src | dst << 4 | count << 8
+
+
+def unpack(packed):
+    return packed & 15, packed >> 4 & 15, packed >> 8
+
+
+class MoveJournal(object):
+    def __init__(self, limit=4096):
+        self.done = collections.deque(maxlen=limit)
+        self.undone = collections.deque(maxlen=limit)
+
+    def clear(self):
+        self.done.clear()
+        self.undone.clear()
+
+    # A new move makes the moves that were undone unreachable
+    def record(self, move):
+        self.done.append(pack(move))
+        self.undone.clear()
+
+    # The move to take back (None if there is nothing to undo)
+    def undo(self):
+        if self.done:
+            packed = self.done.pop()
+            self.undone.append(packed)
+            return unpack(packed)
+
+    # The move to play again (None if there is nothing to redo)
+    def redo(self):
+        if self.undone:
+            packed = self.undone.pop()
+            self.done.append(packed)
+            return unpack(packed)
+
+    def __len__(self):
+        return len(self.done)
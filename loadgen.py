@@ -0,0 +1,127 @@
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+import server
+
+# Load generator for server.py: many sessions playing random legal moves at the same time
+# Usage: python loadgen.py [--sessions 1000] [--connections 100] [--duration 10] [--host 127.0.0.1 --port 8334 | --unix PATH]
+# Without an address it starts a server in the same process
+# Reports the moves played per second and the latency of the requests
+
+
+class Connection(object):
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.latencies = []  # Seconds per request
+
+    async def request(self, **request):
+        start = time.perf_counter()
+        self.writer.write(json.dumps(request, separators=(',', ':')).encode('ascii') + b'\n')
+        response = json.loads(await self.reader.readline())
+        self.latencies.append(time.perf_counter() - start)
+        if not response['ok']:
+            raise RuntimeError('%s failed: %s' % (request['op'], response['error']))
+        return response
+
+
+# Play the sessions of one connection in turn, one request in flight at a time
+# A session asks for its legal moves and plays one of them, a session with nothing left to play is dealt again
+async def play(connection, sessions, rng, stop_at):
+    numbers = []
+    for _ in range(sessions):
+        numbers.append((await connection.request(op='deal', seed=rng.getrandbits(32)))['session'])
+
+    played = 0
+    while time.perf_counter() < stop_at:
+        for number in numbers:
+            legal = (await connection.request(op='moves', session=number))['moves']
+            if not legal:
+                await connection.request(op='deal', session=number, seed=rng.getrandbits(32))
+                continue
+            src, dst, count = rng.choice(legal)
+            response = await connection.request(op='move', session=number, src=src, dst=dst, count=count)
+            played += 1
+            if response['won']:
+                await connection.request(op='deal', session=number, seed=rng.getrandbits(32))
+    return played
+
+
+def percentile(ordered, percent):
+    return ordered[min(len(ordered) - 1, len(ordered) * percent // 100)]
+
+
+async def run(options):
+    game_server = hosted = None
+    if options.unix:
+        address = lambda: asyncio.open_unix_connection(options.unix)
+    elif options.port:
+        address = lambda: asyncio.open_connection(options.host, options.port)
+    else:
+        game_server = server.GameServer()
+        hosted = await game_server.start(options.host, 0)
+        port = hosted.sockets[0].getsockname()[1]
+        address = lambda: asyncio.open_connection(options.host, port)
+
+    connections = [Connection(*await address()) for _ in range(options.connections)]
+    rng = random.Random(options.seed)
+    stop_at = time.perf_counter() + options.duration
+    shares = [options.sessions // options.connections + (index < options.sessions % options.connections)
+              for index in range(options.connections)]
+    start = time.perf_counter()
+    played = await asyncio.gather(*[play(connection, share, random.Random(rng.getrandbits(64)), stop_at)
+                                    for connection, share in zip(connections, shares)])
+    elapsed = time.perf_counter() - start
+    stats = await connections[0].request(op='stats')
+
+    for connection in connections:
+        connection.writer.close()
+        await connection.writer.wait_closed()
+    if hosted:
+        # Let the server see every connection end before it stops
+        while game_server.connections:
+            await asyncio.sleep(0.01)
+        hosted.close()
+        await hosted.wait_closed()
+
+    latencies = sorted(latency for connection in connections for latency in connection.latencies)
+    return {
+        'sessions': stats['sessions'],
+        'connections': options.connections,
+        'seconds': round(elapsed, 3),
+        'requests': len(latencies),
+        'moves': sum(played),
+        'moves_per_second': round(sum(played) / elapsed, 1),
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'server_memory': stats['memory'],
+        'memory_per_session': stats['memory'] // max(1, stats['sessions']),
+    }
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Measure the moves per second and latency of server.py')
+    parser.add_argument('--sessions', type=int, default=1000)
+    parser.add_argument('--connections', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds of play')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, help='server port (a server is started in this process without one)')
+    parser.add_argument('--unix', help='server Unix socket')
+    parser.add_argument('--seed', type=int, default=8334)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(sys.argv[1:] if argv is None else argv)
+    options.connections = max(1, min(options.connections, options.sessions))
+    print(json.dumps(asyncio.run(run(options)), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
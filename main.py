@@ -1,205 +1,764 @@
+import argparse
+import cProfile
+import functools
+import math
 import pygame
 import sys
+import analysis
+import describe
+import endgame
+import engine
+import journal
+import moves
+import profiler
+import replay
+import savegame
+import seedindex
+import solver
+import spatial
 from objects import *
 from outlook import WinSet
 from pygame.locals import *
 import random
 
 
+# Kinds of gesture a release of the left button ends
+CLICK = 'click'
+DOUBLE_CLICK = 'double_click'
+DRAG = 'drag'
+
+
+# Tells clicks, double clicks and drags apart in one pass over the events
+# Everything is decided from the time of each event (not from when it is handled), so a busy frame
+# cannot turn a double click into two clicks or the other way around
+# A double click is two clicks at the same spot with less than WinSet.double_speed ms from the first press to the
+# second release, moving farther than WinSet.drag_distance with the button held makes a drag instead
 class DoubleClickFunction:
     def __init__(self):
-        self.double_click = pygame.time.Clock()
-        self.time = 0  # checking second down click
-        self.first_click = True  # check if this is the first click in the double click
-        self.second_click = False  # check double click
-
-    # limit the time between the two clicks
-    def click_time(self, event):
-        if event.type == MOUSEBUTTONDOWN and event.button == 1:
-            click_time = self.double_click.tick()  # Check how long since last click
-            if not self.first_click:  # If it's the first click, exit function with False
-                # check time gap between two clicks
-                if click_time > WinSet.double_speed:
-                    self.first_click = True
-                else:
-                    self.time = click_time
-
-        if event.type == MOUSEBUTTONUP and event.button == 1:
-            if not self.first_click:  # If it's the second click
-                click_time = self.double_click.tick()  # Get time since last click (the second down click)
-                self.first_click = True  # The next click will again be first
-                if click_time + self.time < WinSet.double_speed:
-                    self.second_click = True
-                    return True
+        self.first_down = None  # Time of the press of a click that can still become a double click
+        self.first_pos = None
+        self.down_pos = None  # Where the button was pressed (None while it is up)
+        self.second = False  # The button is held for the second click of a double click
+        self.dragging = False
+
+    @staticmethod
+    def near(pos, other):
+        return abs(pos[0] - other[0]) <= WinSet.drag_distance and abs(pos[1] - other[1]) <= WinSet.drag_distance
+
+    # Feed an event with its time in ms, returns the gesture a left button release ends (None for other events)
+    def classify(self, event, now):
+        if event.type == MOUSEMOTION:
+            if self.down_pos is not None and not self.near(event.pos, self.down_pos):
+                self.dragging = True
+
+        elif event.type == MOUSEBUTTONDOWN and event.button == 1:
+            self.down_pos = event.pos
+            self.dragging = False
+            self.second = (self.first_down is not None and now - self.first_down < WinSet.double_speed
+                           and self.near(event.pos, self.first_pos))
+            if not self.second:
+                self.first_down, self.first_pos = now, event.pos
+
+        elif event.type == MOUSEBUTTONUP and event.button == 1 and self.down_pos is not None:
+            self.down_pos = None
+            if self.dragging:
+                gesture = DRAG
+                self.first_down = None
+            elif self.second:
+                # A second click that was too slow is a plain click, and too late to start a double click
+                gesture = DOUBLE_CLICK if now - self.first_down < WinSet.double_speed else CLICK
+                self.first_down = None
             else:
-                self.first_click = False
-        #  double click was detected
-        self.second_click = False
-        return False
+                gesture = CLICK
+            self.second = False
+            return gesture
+        return None
+
+
+# Collapse every run of mouse motion events into one event moving by the total of the run
+# Button and key events keep their place, so a motion never jumps over a press or a release
+def coalesce(events):
+    merged = []
+    run = []
+    for event in events + [None]:
+        if event is not None and event.type == MOUSEMOTION:
+            run.append(event)
+            continue
+        if len(run) == 1:
+            merged.append(run[0])
+        elif run:
+            rel = (sum(motion.rel[0] for motion in run), sum(motion.rel[1] for motion in run))
+            merged.append(pygame.event.Event(MOUSEMOTION, dict(run[-1].__dict__, rel=rel)))
+        run = []
+        if event is not None:
+            merged.append(event)
+    return merged
 
 
 class Main:
-    def __init__(self):
+    # Every deal of the session comes from seed (a random one if None), so a session can be played again
+    # deals is a seedindex.SeedIndex to only deal the winnable seeds it holds (None for any seed)
+    def __init__(self, seed=None, deals=None):
         pygame.init()
-        random.seed()
+        self.session_seed = random.getrandbits(32) if seed is None else seed
+        self.rng = random.Random(self.session_seed)  # Only used for deals, see move_motion
+        self.deals = deals
 
         self.screen = self.set_display()
         pygame.display.set_caption("CST8334-GROUP7 SOLITAIRE")
         self.double_click = DoubleClickFunction()  # Double click checker
         self.move_pile = PileMove('PileMove')  # For moving piles
 
-        self.cards = self.loadCards()  # All the cards
-        self.piles = self.populatePiles()  # All the piles
+        # The window can be resized: the layout is WinSet's scaled by scale, and centered with x_offset
+        self.scale = 1
+        self.x_offset = 0
+        self.hit_index = self.grid()
+        self.journal = journal.MoveJournal()  # Undo / redo history
+        self.slots = {}  # Engine pile index of every pile
+        self.moves = None  # Legal moves of the board, kept in step with the piles through record and play_move
+        self.hint_rects = []  # Outlines shown for a hint
+        self.hint_painted = []
+
+        # The cards and piles are made once, every deal after the first reuses them
+        self.deck = self.loadCards()  # All the cards, by engine code
+        self.cards = list(self.deck)  # All the cards, in the order of the deal
+        self.piles = self.buildPiles()  # All the piles
+        self.index_piles()
+        self.seed = self.next_seed()  # Seed of the deal
+        self.shuffleCards(self.seed)
+        state = engine.KlondikeState.deal([card.code for card in self.cards])
+        self.populatePiles(state)
+        self.moves = moves.MoveGenerator(state)
+
+        # Render state: what was drawn last frame
+        self.font = None
+        self.start_time = 0
+        self.timer_string = None
+        self.timer_surface = None
+        self.timer_width = 0
+        self.timer_painted = None
+        self.drag_painted = None
+        self.full_repaint = True
+
+        # Frame profiler, it runs while its overlay is shown (toggled with p) or a trace is recorded
+        self.profiler = profiler.FrameProfiler()
+        self.tracing = False
+        self.show_overlay = False
+        self.overlay_font = None
+        self.overlay_surface = None
+        self.overlay_time = 0
+        self.overlay_painted = None
+
+        # Saving: the writer of the autosave file (None when the game is not saved) and the time already played
+        # by a resumed game
+        self.saver = None
+        self.resume_time = 0
+        self.recorder = None  # Logs the events for replay.py
+        self.replaying = False  # Set by replay.py: the moves of the computer come from the log
+
+        # Solver queries run in the background (analysis.py), the service is started the first time it is needed
+        self.analysis = None
+        self.analysed = None  # The latest (board, solver.SolveResult) answer
+        self.show_analysis = False  # Toggled with w: every new board is checked and the answer shown by the timer
+        self.hint_wanted = False  # A hint was asked for and waits for the answer
+        # Shortest wins of the late boards (endgame.py), None when there is no table file
+        self.endgame = endgame.load_table(WinSet.endgame_table)
+
+        # Attract mode, toggled with d: the computer player (player.py) plays the game, in its own process
+        self.demo = None
+        self.demo_on = False
+        self.demo_answer = None  # The latest (board, move) of the player, played once demo_delay has passed
+        self.demo_time = 0  # When the demo last played a move or found the game over
 
     # The display dimensions are calculated given the wanted margins and card dimensions
     @staticmethod
-    def set_display():
+    def base_size():
         x_dim = (WinSet.margin_space * 2) + (WinSet.image_resolution[0] * 7) + (WinSet.start_space * 6)
         y_dim = WinSet.margin_space + (WinSet.image_resolution[1] * 2) + WinSet.row_space
         y_dim += (WinSet.tile_small_space * 6) + (WinSet.tile_large_space * 12)
-        return pygame.display.set_mode((x_dim, y_dim))
+        return x_dim, y_dim
 
-    # Load the cards (the common card back and the card images)
     @staticmethod
-    def loadCards():
-        Card.back_loading(WinSet.image_back)
-        cards = [Card(x, (0, 0)) for x in WinSet.image_names]
-        random.shuffle(cards)
-        return cards
-
-    # Place the piles (are reset the FoundationPile win number down to 0)
-    def populatePiles(self):
-        piles = []
-        suit_piles = []
-        FoundationPile.total_cards = 0
-
-        marker = 0  # Keeps track of the last card added
-        x = WinSet.margin_space  # The x_position of the pile
-        y = WinSet.margin_space + WinSet.image_resolution[1] + WinSet.row_space
-        for i in range(1, 8):  # Need seven main piles
-            pile_name = 'Main' + str(i)
-            cards = self.cards[marker: i + marker]  # Each pile position also tells me how many cards it needs
-            piles.append(
-                TableauPile(pile_name, (x, y), WinSet.image_bottom, WinSet.tile_small_space, WinSet.tile_large_space,
-                            cards))
+    def set_display():
+        return pygame.display.set_mode(Main.base_size(), pygame.RESIZABLE)
 
-            # The foundation piles are exactly above main piles (starting on the four one)
-            if i > 3: suit_piles.append(FoundationPile('Suit' + str(i - 3), (x, WinSet.margin_space), WinSet.image_bottom))
+    # A WinSet distance at the current scale
+    def metric(self, value):
+        return int(round(value * self.scale))
 
-            # tick along x and marker
-            x += piles[-1].rect.w + WinSet.start_space
-            marker = i + marker
+    # Grid of the pile areas, one cell per layout column and half a card high
+    def grid(self):
+        cell = (self.metric(WinSet.image_resolution[0] + WinSet.start_space),
+                max(1, self.metric(WinSet.image_resolution[1]) // 2))
+        return spatial.SpatialIndex(cell, self.pile_rects)
 
-        # Add the start pile
-        cards = self.cards[marker: 52]  # The remaining cards
-        piles.append(
-            TalonPile('Start', (WinSet.margin_space, WinSet.margin_space), WinSet.start_space, WinSet.image_bottom,
-                      cards))
+    # Load the cards (the common card back and the card images), in the order of their engine codes
+    @staticmethod
+    def loadCards():
+        Card.back_loading(WinSet.image_back)
+        return [Card(x, (0, 0)) for x in WinSet.image_names]
+
+    # The seed of the next deal of the session, picked from the index of winnable seeds when there is one
+    # (no search is needed, an entry of the index is found in constant time)
+    def next_seed(self):
+        if self.deals:
+            return self.deals.seed(self.rng.randrange(len(self.deals)))
+        return self.rng.getrandbits(32)
+
+    # Put the cards in the order of engine.shuffled_codes(seed), in place,
+    # so a seed gives the same deal here as in the solver and batch.py
+    def shuffleCards(self, seed):
+        for position, code in enumerate(engine.shuffled_codes(seed)):
+            self.cards[position] = self.deck[code]
+
+    # The empty piles, they are placed and filled by populatePiles
+    @staticmethod
+    def buildPiles():
+        piles = [TableauPile('Main' + str(i), (0, 0), WinSet.image_bottom, 0, 0) for i in range(1, 8)]
+        piles.append(TalonPile('Start', (0, 0), 0, WinSet.image_bottom))
+        piles.extend(FoundationPile('Suit' + str(i), (0, 0), WinSet.image_bottom) for i in range(1, 5))
+        return piles  # The last four piles always must be the suit piles
+
+    # Place the piles showing an engine state (a new deal, a restored game or the same board at a new size)
+    # The layout of the cards comes from the engine, the piles only display it
+    # The piles and cards are reused: every pile is emptied in place, moved and filled again
+    def populatePiles(self, state):
+        deck = self.deck
+        tableau = self.piles[:engine.TABLEAU_COUNT]
+        talon = self.piles[engine.STOCK]
+        suit_piles = self.piles[engine.STOCK + 1:]
+
+        margin = self.metric(WinSet.margin_space)
+        x = self.x_offset + margin  # The x_position of the pile
+        y = margin + self.metric(WinSet.image_resolution[1] + WinSet.row_space)
+        for i, pile in enumerate(tableau):
+            cards = [deck[code] for code in state.piles[i]]
+            pile.init_space = self.metric(WinSet.tile_small_space)
+            pile.add_space = self.metric(WinSet.tile_large_space)
+            pile.clear_pile((x, y))
+            pile.pile_setup(cards, state.hidden[i])
+            pile.addCards(cards)
 
-        piles.extend(suit_piles)  # The last four piles always must be the suit piles
-        return piles
+            # The foundation piles are exactly above main piles (starting on the four one)
+            if i >= 3: suit_piles[i - 3].clear_pile((x, margin))
+
+            # tick along x
+            x += pile.rect.w + self.metric(WinSet.start_space)
+
+        # The start pile holds the remaining cards
+        for pile in talon.piles:
+            pile.clear_pile((0, 0))
+        talon.space = self.metric(WinSet.start_space)
+        talon.place((self.x_offset + margin, margin))
+        draw_pile = talon.piles[TalonPile.DRAW]
+        draw_pile.addCards([deck[code] for code in state.piles[engine.STOCK]])
+        draw_pile.allFaceUp(False)
+
+        # A game in progress also has cards on the discard pile and the foundations
+        for pile, codes in zip(talon.piles[TalonPile.DISCARD:] + suit_piles, state.piles[engine.WASTE:]):
+            cards = [deck[code] for code in codes]
+            for card in cards:
+                card.face_up = True
+            pile.addCards(cards)
+
+    # Copy the board shown by self.piles into an engine state
+    # Cards that are being dragged still count as part of the pile they were taken from
+    def snapshot(self):
+        state = engine.KlondikeState()
+        dragged = self.move_pile.cards if self.move_pile.hasCards() else []
+
+        for index, pile in enumerate(self.engine_piles()):
+            cards = pile.cards + dragged if pile is self.move_pile.source else pile.cards
+            state.piles[index][:] = [card.code for card in cards]
+            if index < engine.TABLEAU_COUNT:
+                state.hidden[index] = sum(1 for card in cards if not card.face_up)
+        return state
+
+    # The areas a pile can be clicked or dropped on
+    @staticmethod
+    def pile_rects(pile):
+        if isinstance(pile, describe.DescribeMultiPile):
+            return [sub_pile.rect for sub_pile in pile.piles]
+        return [pile.rect.unionall([card.rect for card in pile.cards])]
+
+    # The piles in the order of the engine pile indices (the talon is split into its draw and discard piles)
+    def engine_piles(self):
+        talon = self.piles[engine.STOCK]
+        return self.piles[:engine.TABLEAU_COUNT] + talon.piles + self.piles[engine.STOCK + 1:]
+
+    # Put the piles in the hit-testing index, every change of a pile marks it for an update
+    # The piles also report the moves made by clicking them to the journal
+    # Needed once for the piles and again for every new index (the piles stay the same from deal to deal)
+    def index_piles(self):
+        self.hit_index.clear()
+        for pile in self.piles:
+            self.hit_index.add(pile)
+            pile.on_action = self.record
+            sub_piles = pile.piles if isinstance(pile, describe.DescribeMultiPile) else [pile]
+            for sub_pile in sub_piles:
+                sub_pile.on_change = functools.partial(self.hit_index.invalidate, pile)
+        self.slots = dict((pile, index) for index, pile in enumerate(self.engine_piles()))
+
+    # Remember a move for undo
+    def record(self, src, dst, count):
+        move = (self.slots[src], self.slots[dst], count)
+        self.journal.record(move)
+        self.moves.apply(move)
+        self.hint_rects = []
+        self.autosave()
+
+    # Play a move from the journal on the piles (backwards to undo it)
+    def play_move(self, move, backwards=False):
+        if backwards:
+            self.moves.undo(move)
+        else:
+            self.moves.apply(move)
+        self.hint_rects = []
+        self.autosave()
+
+        src, dst, count = move
+        piles = self.engine_piles()
+        if src == dst:  # Turning the top card of a tableau pile
+            piles[src].cards[-1].face_up = not backwards
+            piles[src].mark_dirty()
+            return
+
+        if backwards:
+            src, dst = dst, src
+        cards = piles[src].takeCards(count)
+        # Moving cards between the talon piles turns them over
+        if engine.STOCK in (src, dst):
+            cards.reverse()
+            for card in cards:
+                card.face_up = dst == engine.WASTE
+        piles[dst].addCards(cards)
+
+    def undo(self):
+        if not self.move_pile.hasCards():
+            move = self.journal.undo()
+            if move:
+                self.play_move(move, True)
+
+    def redo(self):
+        if not self.move_pile.hasCards():
+            move = self.journal.redo()
+            if move:
+                self.play_move(move)
+
+    # Play a move that did not come from the user's clicks and remember it for undo
+    # The log of a recording keeps it, as a replay cannot work it out from the events
+    def play_new_move(self, move):
+        self.journal.record(move)
+        self.play_move(move)
+        self.log(replay.played_event(move))
+
+    # Add an action of the computer to the log of the session being recorded
+    def log(self, event):
+        if self.recorder:
+            self.recorder.record(event, pygame.time.get_ticks())
+
+    # Outline the cards of a good next move and the pile they should go to
+    # The first move of a win found by the analysis or the endgame table is shown if there is one,
+    # the quick guess otherwise
+    def show_hint(self):
+        move = self.winning_move() or self.endgame_move() or self.moves.hint()
+        if not move or self.move_pile.hasCards():
+            return
+        src, dst, count = move
+        piles = self.engine_piles()
+        cards = piles[src].cards[-max(count, 1):]  # A flip has no count but shows the card to turn
+        self.hint_rects = [cards[0].rect.union(cards[-1].rect).inflate(4, 4)]
+        if dst != src:
+            target = piles[dst].cards[-1].rect if piles[dst].cards else piles[dst].rect
+            self.hint_rects.append(target.inflate(4, 4))
+
+    # Show a hint now and have the analysis look for a win, the hint shows its first move once it is found
+    def request_hint(self):
+        self.show_hint()
+        if self.current_analysis() or self.move_pile.hasCards():
+            return
+        self.start_analysis()
+        self.hint_wanted = True
+        self.analysis.submit(analysis.freeze(self.moves.state))
+
+    def start_analysis(self):
+        if self.analysis is None:
+            self.analysis = analysis.AnalysisService(WinSet.analysis_nodes)
+
+    # The answer of the analysis for the board shown (None if there is none yet)
+    def current_analysis(self):
+        if self.analysed and self.analysed[0] == analysis.freeze(self.moves.state):
+            return self.analysed[1]
+
+    def winning_move(self):
+        result = self.current_analysis()
+        if result and result.status == solver.WINNABLE and result.moves:
+            return result.moves[0]
+
+    # The first move of a shortest win of the board from the endgame table (None if the table does not know it)
+    def endgame_move(self):
+        if self.endgame:
+            return self.endgame.best_move(self.moves.state)
+
+    # Keep the analysis on the board shown (while w is on or a hint waits for it) and pick up its answer
+    # Called every frame, it never waits: a search of an older board is cancelled and the answer is polled
+    def update_analysis(self):
+        if self.analysis is None:
+            return
+        board = analysis.freeze(self.moves.state)
+        if board != self.analysis.board:
+            if self.analysis.board is not None:
+                self.hint_wanted = False  # The hint was for an older board
+            self.analysis.cancel()
+            if self.show_analysis and not self.current_analysis():
+                self.analysis.submit(board)
+        answer = self.analysis.poll()
+        if answer:
+            self.analysed = answer
+            if self.hint_wanted:
+                self.hint_wanted = False
+                self.show_hint()
+
+    def toggle_demo(self):
+        self.demo_on = not self.demo_on
+        self.demo_answer = None
+        if self.demo_on and self.demo is None:
+            self.demo = analysis.AnalysisService(WinSet.demo_playouts, analysis.PLAY)
+        elif not self.demo_on and self.demo:
+            self.demo.cancel()
+
+    # Let the player choose the moves of the board shown and play them one every demo_delay
+    # Called every frame, it never waits; a won game or one the player is stuck in is dealt again
+    def update_demo(self, now):
+        if not self.demo_on or self.move_pile.hasCards():
+            return
+        board = analysis.freeze(self.moves.state)
+        answer = self.demo.poll()
+        if answer:
+            self.demo_answer = answer
+        over = self.winCondition() or (self.demo_answer == (board, None))
+        if over:
+            if now - self.demo_time >= WinSet.demo_restart:
+                self.reset()
+                self.log(replay.dealt_event())
+                self.demo_time = now
+            return
+        if board != self.demo.board:
+            self.demo.submit(board)
+        if self.demo_answer and self.demo_answer[0] == board and now - self.demo_time >= WinSet.demo_delay:
+            self.play_new_move(self.demo_answer[1])
+            self.demo_time = now
+
+    # Move every card that can go to the foundations there (turning the tableau cards they uncover),
+    # or finish the game when the endgame table knows the board
+    def auto_play(self):
+        if self.move_pile.hasCards():
+            return
+        move = self.next_auto_move()
+        while move:
+            self.play_new_move(move)
+            move = self.next_auto_move()
+
+    # Once the endgame table knows the board, the game is played to the win
+    def next_auto_move(self):
+        move = self.endgame_move()
+        if move:
+            return move
+        found = self.moves.foundation_moves()
+        if found:
+            return found[0]
+        flips = self.moves.flip_moves()
+        if flips:
+            return flips[0]
 
     # simply gets the pile that was clicked (none if no pile was clicked)
     def clicked_pile(self, event):
-        for pile in self.piles:
+        for pile in self.hit_index.at_point(event.pos):
             if pile.has_position(event.pos):
                 return pile
 
     # The basic idea of the game
     def game(self):
-        font = pygame.font.SysFont(None, 32)
-        start_time = pygame.time.get_ticks()
-        prev_time = None
+        self.font = pygame.font.SysFont(None, self.metric(32))
+        self.start_time = pygame.time.get_ticks() - self.resume_time
+        clock = pygame.time.Clock()
 
         while True:
-            counting_time = pygame.time.get_ticks() - start_time
-
-            # change milliseconds into minutes, seconds, milliseconds
-            counting_minutes = str(round(counting_time/120000)).zfill(2)
-            counting_seconds = str(round( (counting_time%60000)/1000 )).zfill(2)
-            if counting_seconds == '60':
-                counting_seconds = '00'
-
-            counting_string = "%s:%s" % (counting_minutes, counting_seconds)
-
-            counting_text = font.render(str(counting_string), True, (255, 255, 255))
-            counting_rect = counting_text.get_rect(center = self.screen.get_rect().bottomleft)
-            counting_rect.x = counting_rect.x + 50
-            counting_rect.y = counting_rect.y - 20
-
-            self.screen.blit(counting_text, counting_rect)
-            pygame.display.update(counting_rect)
-
+            self.profiler.begin_frame()
+            # Nothing moves on its own unless cards are dragged or the game has been won,
+            # so the dirty renderer can sleep until the next event or the next timer second
+            animating = self.move_pile.hasCards() or self.winCondition()
+            if WinSet.dirty_render and not animating:
+                events = self.wait_events()
+            else:
+                events = pygame.event.get()
+            self.profiler.mark('wait')
 
             if self.winCondition():
                 self.move_motion(2)  # Move the piles around randomly if game has been won
-                start_time = pygame.time.get_ticks()
-
-            for event in pygame.event.get():
-                # Check and store if a double click
-                if (event.type == MOUSEBUTTONUP or event.type == MOUSEBUTTONDOWN) and event.button == 1:
-                    self.double_click.click_time(event)
-
-                # Check if the program is quit
-                if event.type == QUIT:
-                    pygame.quit()
-                    sys.exit()
-
-                # Pressing r resets the program
-                if event.type == KEYUP and event.key == K_r:
-                    self.reset()
-
-                # If the game has been won, reset it with a mouse click
-                if self.winCondition():
-                    if event.type == MOUSEBUTTONUP and event.button == 1:
-                        self.reset()
-
-                # Now for the main meat of the program
-                else:
-                    if event.type == MOUSEBUTTONUP and event.button == 1:
-                        # check card dragging
-                        move_pile_full = self.move_pile.hasCards()
-
-                        if move_pile_full:  # If yes
-                            # This finds the left most pile where the dropped cards are accepted
-                            selected_pile = None
-                            for pile in self.piles:
-                                if pile.valid_move_cards(self.move_pile.cards):
-                                    selected_pile = pile
-                                    break
-
-                            # If a valid pile is found, drop the cards there, otherwise return the cards
-                            if selected_pile:
-                                self.move_pile.add_to_pile(selected_pile)
-                            else:
-                                self.move_pile.returnCards()
-
-                        # double click event
-                        if self.double_click.second_click:
-                            self.onDoubleClick(event)
-
-                        # If the move_pile was empty and no double click, just run a simple on_click on the pile
-                        if not move_pile_full and not self.double_click.second_click:
-                            clicked_pile = self.clicked_pile(event)
-
-                            if clicked_pile:
-                                clicked_pile.on_click(event)
-
-                    # If mouse is held down, move those cards to the self.move_pile
-                    if event.type == MOUSEBUTTONDOWN and event.button == 1:
-                        clicked_pile = self.clicked_pile(event)
-
-                        if clicked_pile:
-                            cards_taken = clicked_pile.on_click(event)
-                            if cards_taken: self.move_pile.addCards(cards_taken)
-
-                    # if the mouse is moved, move the mouse_pile (if it has cards)
-                    if event.type == MOUSEMOTION:
-                        if self.move_pile.hasCards(): self.move_pile.move_position(event.rel)
-
+                self.start_time = pygame.time.get_ticks()
+            self.profiler.mark('win_check')
+
+            # Every event read in this frame gets the time it was read, pygame does not keep the time it happened
+            now = pygame.time.get_ticks()
+            for event in coalesce(events):
+                if self.recorder:
+                    self.recorder.record(event, now)
+                self.handle_event(event, now)
+            self.update_analysis()
+            self.update_demo(now)
+            self.profiler.mark('events')
+
+            if WinSet.dirty_render:
+                self.render_dirty()
+            else:
+                self.render_full()
+            clock.tick(WinSet.frame_rate)
+            self.profiler.mark('sleep')
+            self.profiler.end_frame()
+
+    # Block until there is an event or the timer text has to change
+    def wait_events(self):
+        timeout = 1000 - self.counting_time() % 1000
+        # An answer of the analysis does not wake the loop up, so look for it every few frames while it is awaited
+        # (and while the demo plays)
+        if (self.analysis and self.analysis.pending) or self.demo_on:
+            timeout = min(timeout, 50)
+        event = pygame.event.wait(timeout)
+        if event.type == NOEVENT:
+            return []
+        return [event] + pygame.event.get()
+
+    # now is the time of the event in ms (an event can also bring its own time attribute)
+    def handle_event(self, event, now=None):
+        if now is None:
+            now = pygame.time.get_ticks()
+
+        # The moves and deals of the computer in a log being replayed
+        if event.type == replay.PLAYED:
+            self.play_new_move(event.move)
+            return
+        if event.type == replay.DEALT:
+            self.reset()
+            return
+
+        # The gesture a release of the left button ends decides what the release does
+        gesture = self.double_click.classify(event, getattr(event, 'time', now))
+
+        # Check if the program is quit
+        if event.type == QUIT:
+            self.quit()
+
+        # The window has been resized
+        if event.type == VIDEORESIZE:
+            self.resize(event.size)
+
+        # Pressing r resets the program
+        if event.type == KEYUP and event.key == K_r:
+            self.reset()
+
+        # z takes back the last move, y plays it again
+        if event.type == KEYUP and event.key == K_z:
+            self.undo()
+        if event.type == KEYUP and event.key == K_y:
+            self.redo()
+
+        # A replay plays the moves of the computer from the log, so the keys below do nothing in it
+        if not self.replaying:
+            # h shows a hint, a moves all the cards it can to the foundations
+            if event.type == KEYUP and event.key == K_h:
+                self.request_hint()
+            if event.type == KEYUP and event.key == K_a:
+                self.auto_play()
+
+            # w shows whether the game can still be won (the solver sees the face down cards too)
+            if event.type == KEYUP and event.key == K_w:
+                self.show_analysis = not self.show_analysis
+                if self.show_analysis:
+                    self.start_analysis()
+
+            # d lets the computer play
+            if event.type == KEYUP and event.key == K_d:
+                self.toggle_demo()
+
+        # p turns the frame profiler and its overlay on and off
+        if event.type == KEYUP and event.key == K_p:
+            self.show_overlay = not self.show_overlay
+            self.profiler.enabled = self.show_overlay or self.tracing
+            self.overlay_surface = None
+            self.full_repaint = True
+
+        # The hint goes away with the next click
+        if event.type == MOUSEBUTTONDOWN:
+            self.hint_rects = []
+
+        # If the game has been won, reset it with a mouse click
+        if self.winCondition():
+            if event.type == MOUSEBUTTONUP and event.button == 1:
+                self.reset()
+
+        # Now for the main meat of the program
+        else:
+            if event.type == MOUSEBUTTONUP and event.button == 1:
+                # check card dragging
+                move_pile_full = self.move_pile.hasCards()
+
+                if move_pile_full:  # If yes
+                    # This finds the left most pile where the dropped cards are accepted
+                    selected_pile = None
+                    for pile in self.hit_index.overlapping(self.move_pile.cards[0].rect):
+                        if pile.valid_move_cards(self.move_pile.cards):
+                            selected_pile = pile
+                            break
+
+                    # If a valid pile is found, drop the cards there, otherwise return the cards
+                    if selected_pile:
+                        if selected_pile is not self.move_pile.source:
+                            self.record(self.move_pile.source, selected_pile, len(self.move_pile.cards))
+                        self.move_pile.add_to_pile(selected_pile)
+                    else:
+                        self.move_pile.returnCards()
+
+                # double click event
+                if gesture == DOUBLE_CLICK:
+                    self.onDoubleClick(event)
+
+                # If the move_pile was empty and the release ends a click, just run a simple on_click on the pile
+                # (a drag that picked up no cards does nothing)
+                if not move_pile_full and gesture == CLICK:
+                    clicked_pile = self.clicked_pile(event)
+
+                    if clicked_pile:
+                        clicked_pile.on_click(event)
+
+            # If mouse is held down, move those cards to the self.move_pile
+            if event.type == MOUSEBUTTONDOWN and event.button == 1:
+                clicked_pile = self.clicked_pile(event)
+
+                if clicked_pile:
+                    cards_taken = clicked_pile.on_click(event)
+                    if cards_taken: self.move_pile.addCards(cards_taken)
+
+            # if the mouse is moved, move the mouse_pile (if it has cards)
+            if event.type == MOUSEMOTION:
+                if self.move_pile.hasCards(): self.move_pile.move_position(event.rel)
+
+    def counting_time(self):
+        return pygame.time.get_ticks() - self.start_time
+
+    # The elapsed time text and where it goes on the screen
+    def timer_text(self):
+        counting_time = self.counting_time()
+
+        # change milliseconds into minutes, seconds, milliseconds
+        counting_minutes = str(round(counting_time/120000)).zfill(2)
+        counting_seconds = str(round( (counting_time%60000)/1000 )).zfill(2)
+        if counting_seconds == '60':
+            counting_seconds = '00'
+
+        counting_string = "%s:%s" % (counting_minutes, counting_seconds)
+
+        # While w is on, the answer of the analysis follows the time
+        text = counting_string
+        if self.show_analysis:
+            result = self.current_analysis()
+            text += '   ' + (result.status if result else '...')
+
+        # Only render the text again when it changes
+        if text != self.timer_string:
+            self.timer_string = text
+            self.timer_surface = self.font.render(text, True, (255, 255, 255))
+            self.timer_width = self.font.size(counting_string)[0]
+        counting_rect = self.timer_surface.get_rect(center = self.screen.get_rect().bottomleft)
+        counting_rect.x = 50 - self.timer_width // 2  # The time stays in place when the answer follows it
+        counting_rect.y = counting_rect.y - 20
+        return self.timer_surface, counting_rect
+
+    # The profiler overlay and where it goes on the screen (None while it is hidden)
+    # The text is only rendered again a few times per second
+    def overlay(self):
+        if not self.show_overlay:
+            return None
+        now = pygame.time.get_ticks()
+        if self.overlay_surface is None or now - self.overlay_time >= 250:
+            self.overlay_time = now
+            if self.overlay_font is None:
+                self.overlay_font = pygame.font.SysFont(None, self.metric(20))
+            lines = [self.overlay_font.render(line, True, (255, 255, 0)) for line in self.profiler.summary()]
+            surface = pygame.Surface((max(line.get_width() for line in lines),
+                                      sum(line.get_height() for line in lines)), pygame.SRCALPHA)
+            y = 0
+            for line in lines:
+                surface.blit(line, (0, y))
+                y += line.get_height()
+            self.overlay_surface = surface
+        rect = self.overlay_surface.get_rect(bottomright=self.screen.get_rect().bottomright)
+        rect.move_ip(-10, -10)
+        return self.overlay_surface, rect
+
+    # Repaint the whole screen every frame
+    def render_full(self):
+        timer = self.timer_text()
+        overlay = self.overlay()
+        self.profiler.mark('timer')
+        self.screen.fill((0, 0, 0))
+        self.draw()
+        self.screen.blit(*timer)
+        if overlay:
+            self.screen.blit(*overlay)
+        self.profiler.mark('draw')
+        pygame.display.flip()
+        self.profiler.mark('flip')
+
+    # Repaint only the areas of the piles that changed, the dragged cards and the timer
+    def render_dirty(self):
+        previous_timer = self.timer_string
+        timer_surface, timer_rect = self.timer_text()
+        previous_overlay = self.overlay_surface
+        overlay = self.overlay()
+        self.profiler.mark('timer')
+
+        if self.full_repaint:
+            self.full_repaint = False
+            rects = [self.screen.get_rect()]
+            for pile in self.piles:
+                pile.dirty_rects()
+        else:
+            rects = []
+            for pile in self.piles:
+                rects.extend(pile.dirty_rects())
+            if self.timer_string != previous_timer:
+                rects.append(timer_rect.union(self.timer_painted) if self.timer_painted else timer_rect)
+
+        if self.hint_rects != self.hint_painted:
+            rects.extend(self.hint_painted + self.hint_rects)
+            self.hint_painted = list(self.hint_rects)
+
+        drag = self.move_pile.area()
+        if drag != self.drag_painted:
+            rects.extend(rect for rect in (self.drag_painted, drag) if rect)
+            self.drag_painted = drag
+
+        if overlay and self.overlay_surface is not previous_overlay:
+            rects.append(overlay[1].union(self.overlay_painted) if self.overlay_painted else overlay[1])
+        self.overlay_painted = overlay[1] if overlay else None
+
+        if not rects:
+            return
+        # Each rect only draws what lies in it, so a frame costs the piles the rects touch, not a pass per rect
+        for rect in rects:
+            self.screen.set_clip(rect)
             self.screen.fill((0, 0, 0))
-            self.draw()
-            pygame.display.flip()
+            self.draw(rect)
+            if timer_rect.colliderect(rect):
+                self.screen.blit(timer_surface, timer_rect)
+            if overlay and overlay[1].colliderect(rect):
+                self.screen.blit(*overlay)
+        self.screen.set_clip(None)
+        self.timer_painted = timer_rect
+        self.profiler.mark('draw')
+        pygame.display.update(rects)
+        self.profiler.mark('flip')
 
     #  Double click function
     def onDoubleClick(self, event):
@@ -213,6 +772,7 @@ class Main:
                 for pile in self.piles[-4:]:  # Go through the four suit piles
                     # The False ensures that the card_taken does not have to contact the Suit piles
                     if pile.valid_move_cards(card_taken, False):
+                        self.record(card_taken[0].pile, pile, 1)
                         pile.addCards(card_taken)
                         no_home = False
                         break;
@@ -220,32 +780,190 @@ class Main:
                 if no_home:
                     card_taken[0].pile.addCards(card_taken)
 
-    # Draw is simple, just draw all the piles
-    def draw(self):
+    # Draw is simple, just draw all the piles (only the ones that reach into area, if it is given)
+    def draw(self, area=None):
         for pile in self.piles:
-            pile.draw(self.screen)
+            if area is None or pile.overlaps(area):
+                pile.draw(self.screen)
+
+        for rect in self.hint_rects:
+            if area is None or rect.colliderect(area):
+                pygame.draw.rect(self.screen, (255, 255, 0), rect, 3)
 
-        self.move_pile.draw(self.screen)
+        drag = self.move_pile.area()
+        if drag and (area is None or drag.colliderect(area)):
+            self.move_pile.draw(self.screen)
 
     def start(self):
         self.game()
 
-    # When all the cards are in the suit pile
+    # When all the cards are in the suit piles (counted per game, so several games can exist in one process)
     def winCondition(self):
-        return FoundationPile.total_cards == len(self.cards)
+        return sum(len(pile.cards) for pile in self.piles[-4:]) == len(self.cards)
 
     # Moves the piles randomly in all directions (the length arguement specifies how hard they move)
+    # It runs once per frame, so it must not use self.rng: the next deal would depend on the frame rate
     def move_motion(self, length):
         for pile in self.piles:
             x_move = random.randint(-length, length)
             y_move = random.randint(-length, length)
             pile.movePosition((x_move, y_move))
 
-    def reset(self):
-        self.cards = self.loadCards()
-        self.piles = self.populatePiles()
+    # Start a new deal, the next one of the session unless a seed is given
+    def reset(self, seed=None):
+        self.move_pile.clear()  # Cards being dragged belong to the old deal
+        self.seed = self.next_seed() if seed is None else seed
+        self.shuffleCards(self.seed)
+        state = engine.KlondikeState.deal([card.code for card in self.cards])
+        self.populatePiles(state)
+        self.moves = moves.MoveGenerator(state)
+        self.journal.clear()
+        self.full_repaint = True
+        self.autosave()
+
+    # Save the board in the background (the engine state is always up to date, even in the middle of a drop)
+    def autosave(self):
+        if self.saver:
+            self.saver.submit(savegame.pack(self.moves.state, self.seed, self.counting_time()))
+
+    # Continue a saved game, the cards of this game are laid out again (no image is loaded)
+    def restore(self, state, seed, elapsed):
+        self.move_pile.clear()
+        self.seed = seed
+        self.shuffleCards(seed)
+        self.populatePiles(state)
+        self.moves = moves.MoveGenerator(state)
+        self.journal.clear()
+        self.resume_time = elapsed
+        self.start_time = pygame.time.get_ticks() - elapsed
+        self.full_repaint = True
+
+    # Lay the game out again for a window of that size, keeping the board and the undo history
+    # The cards and piles get the images scaled to the new size, which are only scaled once per scale
+    def resize(self, size):
+        base_w, base_h = self.base_size()
+        scale = min(size[0] / base_w, size[1] / base_h)
+        scale = round(max(1, math.floor(scale / WinSet.scale_step + 1e-9)) * WinSet.scale_step, 4)
+        x_offset = max(0, (size[0] - int(round(base_w * scale))) // 2)
+        self.screen = pygame.display.get_surface()
+        self.full_repaint = True
+        if scale == self.scale and x_offset == self.x_offset:
+            return
+
+        if self.move_pile.hasCards():
+            self.move_pile.returnCards()
+        self.scale = scale
+        self.x_offset = x_offset
+        describe.TextureCache.set_scale(scale)
+        Card.back_loading(WinSet.image_back)
+        for card in self.cards:
+            card.image = card.set_image(card.name)
+        for pile in self.engine_piles():
+            pile.image = pile.set_image(WinSet.image_bottom)
+        self.populatePiles(self.moves.state)
+        self.hit_index = self.grid()
+        self.index_piles()
+
+        self.hint_rects = []
+        self.drag_painted = None
+        self.timer_string = None
+        if self.font:
+            self.font = pygame.font.SysFont(None, self.metric(32))
+        self.overlay_font = None
+        self.overlay_surface = None
+        self.overlay_painted = None
+
+    # Save the game one last time and close the window
+    def quit(self):
+        if self.saver:
+            self.autosave()
+            self.saver.close()
+            self.saver = None
+        if self.recorder:
+            self.recorder.close(self.moves.state)
+            self.recorder = None
+        if self.analysis:
+            self.analysis.close()
+            self.analysis = None
+        if self.demo:
+            self.demo.close()
+            self.demo = None
+        if self.endgame:
+            self.endgame.close()
+            self.endgame = None
+        pygame.quit()
+        sys.exit()
+
+
+# argparse type of --seed, a session seed has to fit the header of a replay log
+def session_seed(text):
+    try:
+        seed = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError('%r is not an integer' % text)
+    if not 0 <= seed <= replay.SEED_LIMIT:
+        raise argparse.ArgumentTypeError('the seed must be from 0 to %d' % replay.SEED_LIMIT)
+    return seed
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Klondike solitaire')
+    parser.add_argument('--trace', help='profile every frame and save the samples to this .csv or .json file on exit')
+    parser.add_argument('--cprofile', help='run the session under cProfile and save the stats to this file')
+    parser.add_argument('--save', default=WinSet.save_file,
+                        help='continue the game saved in this file and save every move to it (default %(default)s)')
+    parser.add_argument('--no-save', action='store_true', help='always start a new game and never save it')
+    parser.add_argument('--seed', type=session_seed, help='seed of the session (its deals), starts a new game')
+    parser.add_argument('--record', help='log the events of the session to this file for replay.py, starts a new game')
+    parser.add_argument('--check-images', action='store_true',
+                        help='load the PNG files if the image bundle was built from other or older files')
+    parser.add_argument('--winnable', nargs='?', const=WinSet.seed_index,
+                        help='only deal the winnable seeds of this index built by seedindex.py (default %s), '
+                             'not used with --record as replay.py deals any seed' % WinSet.seed_index)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(sys.argv[1:] if argv is None else argv)
+    if options.check_images:
+        WinSet.check_bundle = True
+    deals = None
+    if options.winnable and not options.record:
+        try:
+            deals = seedindex.SeedIndex(options.winnable)
+        except (OSError, ValueError) as error:
+            sys.exit('%s, build the index with seedindex.py' % error)
+        # Without a seed to pick, the game would quietly deal any seed
+        if not len(deals):
+            sys.exit('%s holds no winnable seeds, build the index with seedindex.py' % options.winnable)
+        if deals.seed(len(deals) - 1) > savegame.SEED_LIMIT:
+            sys.exit('%s holds seeds above %d that a game cannot save, build it again with seedindex.py'
+                     % (options.winnable, savegame.SEED_LIMIT))
+    g = Main(options.seed, deals)
+    if not options.no_save:
+        # A damaged, old or finished save just means a new game
+        try:
+            state, seed, elapsed = savegame.load(options.save)
+            if not state.won() and options.seed is None and not options.record:
+                g.restore(state, seed, elapsed)
+        except (OSError, ValueError):
+            pass
+        g.saver = savegame.SaveWriter(options.save)
+    if options.record:
+        g.recorder = replay.EventRecorder(options.record, g.session_seed)
+    g.tracing = g.profiler.enabled = bool(options.trace)
+    profile = cProfile.Profile() if options.cprofile else None
+    try:
+        if profile:
+            profile.enable()
+        g.start()
+    finally:
+        if profile:
+            profile.disable()
+            profile.dump_stats(options.cprofile)
+        if options.trace:
+            g.profiler.write_trace(options.trace)
 
 
 if __name__ == "__main__":
-    g = Main()
-    g.start()
+    main()
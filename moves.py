@@ -0,0 +1,134 @@
+import engine
+from engine import STOCK, WASTE, FOUNDATION, PILE_COUNT, TABLEAU_COUNT
+
+# Legal move generation that is kept up to date move by move instead of being recomputed from every pile
+
+CARD_COUNT = engine.CARD_COUNT
+
+# Only two cards can ever be put on a card: one number lower and of the other color
+STACKED_BY = [tuple(upper for upper in range(CARD_COUNT) if engine.can_stack(code, upper))
+              for code in range(CARD_COUNT)]
+KINGS = tuple(code for code in range(CARD_COUNT) if engine.can_fill(code))
+
+
+# Wraps an engine state and knows where every card is (pile and position in it)
+# apply and undo only update the cards that moved, so asking for the moves of a card is a few array lookups
+class MoveGenerator(object):
+    def __init__(self, state):
+        self.state = state
+        self.pile_of = bytearray(CARD_COUNT)
+        self.position = bytearray(CARD_COUNT)
+        self.rebuild()
+
+    def rebuild(self):
+        for pile, cards in enumerate(self.state.piles):
+            for position, code in enumerate(cards):
+                self.pile_of[code] = pile
+                self.position[code] = position
+
+    # The last count cards of a pile have new positions
+    def relocate(self, pile, count):
+        cards = self.state.piles[pile]
+        for position in range(len(cards) - count, len(cards)):
+            code = cards[position]
+            self.pile_of[code] = pile
+            self.position[code] = position
+
+    def apply(self, move):
+        self.state.apply(move)
+        src, dst, count = move
+        if src != dst:
+            self.relocate(dst, count)
+
+    def undo(self, move):
+        self.state.undo(move)
+        src, dst, count = move
+        if src != dst:
+            self.relocate(src, count)
+
+    # Can the card be picked up, and how many cards come with it (0 if it cannot be moved)
+    def movable(self, code):
+        pile = self.pile_of[code]
+        position = self.position[code]
+        size = len(self.state.piles[pile])
+        if pile < TABLEAU_COUNT:
+            if position < self.state.hidden[pile]:
+                return 0
+            return size - position
+        if pile == STOCK or position != size - 1:
+            return 0
+        return 1
+
+    # The foundation the next card of the suit goes to (None if the suit is finished)
+    # Aces go to the first empty foundation
+    def foundation_for(self, suit):
+        ace_pile = self.pile_of[suit]
+        if ace_pile >= FOUNDATION:
+            top = self.state.piles[ace_pile][-1]
+            if top + 4 < CARD_COUNT:
+                return ace_pile, top + 4
+            return None
+        for pile in range(FOUNDATION, PILE_COUNT):
+            if not self.state.piles[pile]:
+                return pile, suit
+
+    def flip_moves(self):
+        state = self.state
+        return [(pile, pile, 0) for pile in range(TABLEAU_COUNT)
+                if state.hidden[pile] and state.hidden[pile] == len(state.piles[pile])]
+
+    def foundation_moves(self):
+        moves = []
+        for suit in range(4):
+            found = self.foundation_for(suit)
+            if found:
+                dst, code = found
+                if self.pile_of[code] < FOUNDATION and self.movable(code) == 1:
+                    moves.append((self.pile_of[code], dst, 1))
+        return moves
+
+    # Moves onto the tableau pile dst
+    def moves_to(self, dst):
+        state = self.state
+        cards = state.piles[dst]
+        if cards:
+            if state.hidden[dst] == len(cards):
+                return []
+            candidates = STACKED_BY[cards[-1]]
+        else:
+            candidates = KINGS
+
+        moves = []
+        for code in candidates:
+            src = self.pile_of[code]
+            if src == dst:
+                continue
+            count = self.movable(code)
+            if count:
+                moves.append((src, dst, count))
+        return moves
+
+    # Every legal move (the same moves as KlondikeState.legal_moves), foundation moves first
+    def legal_moves(self):
+        moves = self.foundation_moves()
+        moves.extend(self.flip_moves())
+        for dst in range(TABLEAU_COUNT):
+            moves.extend(self.moves_to(dst))
+        talon = self.state.talon_move()
+        if talon:
+            moves.append(talon)
+        return moves
+
+    # A good next move for the player: the first move that makes progress, otherwise the talon
+    # Tableau moves only count when they move a whole run off a face down card
+    def hint(self):
+        state = self.state
+        for move in self.foundation_moves() + self.flip_moves():
+            return move
+        for dst in range(TABLEAU_COUNT):
+            for src, dst, count in self.moves_to(dst):
+                if src == WASTE:
+                    return src, dst, count
+                if src < TABLEAU_COUNT and state.hidden[src] and count == state.face_up_count(src):
+                    return src, dst, count
+        return state.talon_move()
@@ -1,4 +1,5 @@
 import describe
+import engine
 from pygame.locals import *
 
 
@@ -21,30 +22,30 @@ class Card(describe.DescribeImage):
         # The name of the card is 01-13[clubs,diamond,heart,spade]
         # Notice that the every card has a specific named image png file
         describe.DescribeImage.__init__(self, name, pos, name)
+        # The integer encoding of the card used by the engine rules
+        self.code = engine.CARD_CODES[name]
 
         # Sometimes it is necessary to keep track of what pile a card is in
         self.pile = None
 
         self.face_up = True
 
+    # The attributes of the card come from the engine tables, looked up by code
     def get_number(self):
-        return int(self.name[:-1])
+        return engine.RANKS[self.code]
 
     def get_suit(self):
-        return self.name[-1]
+        return engine.SUITS[engine.SUIT_OF[self.code]]
 
     def get_color(self):
-        if self.get_suit() == 'h' or self.get_suit() == 'd':
-            return Card.RED
-        return Card.BLACK
+        return Card.RED if engine.RED[self.code] else Card.BLACK
 
     def color_match(self, card):
-        return self.get_color() == card.get_color()
+        return engine.RED[self.code] == engine.RED[card.code]
 
-    def draw(self, screen):
+    def visible_image(self):
         if self.visible:
-            image = self.image if self.face_up else Card.back_of_card
-            screen.blit(image, self.rect)
+            return self.image if self.face_up else Card.back_of_card
 
 
 # Encodes the draw and discard rule for talon and stock
@@ -78,12 +79,15 @@ class TalonPile(describe.DescribeMultiPile):
             take_cards = self.piles[TalonPile.DRAW].takeCards(1)  # If the pile is not empty, get the top card
             take_cards[0].face_up = True
             self.piles[TalonPile.DISCARD].addCards(take_cards)  # Add the card to stock
+            self.action(self.piles[TalonPile.DRAW], self.piles[TalonPile.DISCARD], 1)
 
         else:  # when the talon is empty, click the stock and all the cards will back to talon
             self.piles[TalonPile.DISCARD].allFaceUp(False)
             all_cards = self.piles[TalonPile.DISCARD].takeAll()
             all_cards.reverse()
             self.piles[TalonPile.DRAW].addCards(all_cards)
+            if all_cards:
+                self.action(self.piles[TalonPile.DISCARD], self.piles[TalonPile.DRAW], len(all_cards))
 
     # The action set up to click the talon pile
     def on_click(self, event):
@@ -124,27 +128,22 @@ class TalonPile(describe.DescribeMultiPile):
 
 # Tableau field set up
 class TableauPile(describe.DescribeTilePile):
-    def __init__(self, name, pos, image, init_space, add_space, cards=[]):
-        self.pile_setup(cards)
+    def __init__(self, name, pos, image, init_space, add_space, cards=[], hidden=None):
+        self.pile_setup(cards, hidden)
         describe.DescribeTilePile.__init__(self, name, pos, image, init_space, add_space, cards)
 
-    # All but the last card in the pile is face down
+    # The first hidden cards of the pile are face down, by default all but the last card
     @staticmethod
-    def pile_setup(cards):
-        for card in cards:
-            card.face_up = False
-        if cards:
-            cards[-1].face_up = True
+    def pile_setup(cards, hidden=None):
+        if hidden is None:
+            hidden = len(cards) - 1
+        for position, card in enumerate(cards):
+            card.face_up = position >= hidden
 
     # This function flip the top card from face down to face up when that was clicked
     # If no card was clicked, returns -1
     def top_card_clicked(self, pos):
-        result = -1
-        for i, card in enumerate(self.cards):
-            if card.has_position(pos):
-                result = i
-
-        return result
+        return self.card_at(pos)
 
     def on_click(self, event):
         if not self.visible:
@@ -160,7 +159,10 @@ class TableauPile(describe.DescribeTilePile):
         # If the last card in the pile if face down, an upclick will turn in around
         if event.type == MOUSEBUTTONUP and event.button == 1:
             if not self.pile_empty() and self.cards[-1].has_position(event.pos):
-                self.cards[-1].face_up = True
+                if not self.cards[-1].face_up:
+                    self.cards[-1].face_up = True
+                    self.mark_dirty()
+                    self.action(self, self, 0)
 
     # Returns the last card in the pile if it is faced up and has been clicked
     def double_click(self, event):
@@ -176,14 +178,14 @@ class TableauPile(describe.DescribeTilePile):
     def valid_move_cards(self, cards):
         # Only a king can be added to a spare tableau pile
         if self.pile_empty():
-            if cards[0].get_number() == 13 and self.collision(cards[0]):
+            if engine.can_fill(cards[0].code) and self.collision(cards[0]):
                 return True
         else:
             ref_card = self.cards[-1]  # The top most card of the pile determines validity
             if not ref_card.face_up:  # Card must be face up for validation
                 return False
 
-            if not ref_card.color_match(cards[0]) and ref_card.get_number() == cards[0].get_number() + 1:
+            if engine.can_stack(ref_card.code, cards[0].code):
                 if ref_card.collision(cards[0]):
                     return True
 
@@ -194,8 +196,6 @@ class TableauPile(describe.DescribeTilePile):
 # Only Aces can be moved to an empty foundation pile and add the track ascended
 # The player win the game when all the cards can all move to foundation piles
 class FoundationPile(describe.DescribeSimplePile):
-    total_cards = 0
-
     def __init__(self, name, pos, image):
         describe.DescribeSimplePile.__init__(self, name, pos, image)
 
@@ -207,14 +207,8 @@ class FoundationPile(describe.DescribeSimplePile):
             if not self.collision(cards[0]): return False
         if len(cards) != 1: return False
 
-        if self.pile_empty():
-            if cards[0].get_number() == 1: return True
-            return False
-
-        ref_card = self.cards[-1]
-        if ref_card.get_suit() == cards[0].get_suit() and ref_card.get_number() + 1 == cards[0].get_number():
-            return True
-        return False
+        top = None if self.pile_empty() else self.cards[-1].code
+        return engine.can_found(top, cards[0].code)
 
     # On click
     def on_click(self, event):
@@ -226,16 +220,6 @@ class FoundationPile(describe.DescribeSimplePile):
     def double_click(self, event):
         pass
 
-    # To keep track of the total number of cards in SuitPiles, add and take card function need to be expanded
-    def takeCards(self, num):
-        cards_taken = super(FoundationPile, self).takeCards(num)
-        FoundationPile.total_cards -= num
-        return cards_taken
-
-    def addSingle(self, card):
-        super(FoundationPile, self).addSingle(card)
-        FoundationPile.total_cards += 1
-
 
 # Move the whole pile which is already ranked in the right order
 # It also keeps track of where the cards came from and can return it if necessary
@@ -273,3 +257,8 @@ class PileMove(object):
 
     def move_position(self, move):
         for card in self.cards: card.move_position(move)
+
+    # The screen area covered by the moving cards (None if nothing is moving)
+    def area(self):
+        if self.cards:
+            return self.cards[0].rect.unionall([card.rect for card in self.cards[1:]])
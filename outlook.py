@@ -14,8 +14,14 @@ class WinSet:
     image_names = card_setup()
     image_path = 'resources'
     image_type = '.png'
+    image_bundle = 'cards.bundle'  # Built from the images in image_path by bundle.py
+    check_bundle = False  # Compare the bundle with the image files at startup (main.py --check-images)
+    save_file = 'solitaire.sav'  # The game in progress is kept here between runs
+    seed_index = 'winnable.idx'  # Winnable seeds for main.py --winnable, built by seedindex.py
+    endgame_table = 'endgame.tb'  # Shortest wins of the late boards for hints and auto play, built by endgame.py
     image_back = 'back01'
     image_bottom = 'bottom03'
+    image_atlas = image_names + [image_back, image_bottom]  # Images packed together in one surface
     image_resolution = (75, 122)
     start_space = 10
     row_space = 30
@@ -23,3 +29,12 @@ class WinSet:
     tile_small_space = 5
     tile_large_space = 15
     double_speed = 500
+    drag_distance = 4  # Pixels the mouse can move with the button held before a click becomes a drag
+    frame_rate = 60  # Frames per second cap (0 for no cap)
+    scale_step = 0.05  # The window scale is rounded down to a multiple of this, so a resize reuses scaled images
+    sprite_cache_size = 4  # Sets of scaled images kept for the last window scales
+    dirty_render = True  # Only repaint what changed and sleep while nothing happens
+    analysis_nodes = 1000000  # Budget of the background solver searches behind w and h (see analysis.py)
+    demo_playouts = 256  # Playouts per move of the computer player of the demo (d, see player.py)
+    demo_delay = 400  # Milliseconds between two moves of the demo
+    demo_restart = 3000  # Milliseconds the demo shows a won or stuck game before dealing again
@@ -0,0 +1,223 @@
+import argparse
+import random
+import sys
+import time
+
+import numpy as np
+
+import engine
+import solver
+import vecenv
+from engine import CARD_COUNT, FOUNDATION, PILE_COUNT, STOCK, TABLEAU_COUNT
+
+# Computer player: flat Monte Carlo search over batched playouts
+# Every legal move is tried in the same number of playouts, the move with the best mean score is played
+# A playout plays the move, then up to depth random moves (weighted by MOVE_WEIGHTS), all the playouts of a
+# move choice run together as the rows of one vecenv.VectorKlondike
+# The player does not see the face down cards: the face down tableau cards and the draw pile are shuffled again
+# for every playout, and the same shuffles are used for every move so the moves are compared on equal terms
+# Needs NumPy (like vecenv.py)
+# Usage: python player.py [--seeds 0-4] [--playouts 256] [--depth 60] plays the deals of the seeds and reports
+# how far the player got and the mean playout score of each deal (the lower, the harder the deal)
+
+PLAYOUTS = 256
+DEPTH = 60
+MOVE_LIMIT = 500  # Moves before a game the player cannot finish is given up
+
+# Chance weights of the moves in the playouts: turning and founding cards first, taking cards back from the
+# foundations hardly ever
+# (the keys of the moves are random numbers times the weights, so a heavier move is nearly always picked)
+MOVE_WEIGHTS = np.full((PILE_COUNT, PILE_COUNT), 5.0)
+MOVE_WEIGHTS[:, FOUNDATION:] = 50.0
+MOVE_WEIGHTS[FOUNDATION:, :] = 0.01
+MOVE_WEIGHTS[STOCK, :] = MOVE_WEIGHTS[:, STOCK] = 1.0
+MOVE_WEIGHTS[range(TABLEAU_COUNT), range(TABLEAU_COUNT)] = 1000.0
+# Moves between tableau piles depend on the board: a whole run that uncovers a face down card is worth it,
+# moving part of a run or a run with nothing under it mostly goes back and forth
+UNCOVERING = 20.0
+SHUFFLING = 0.05
+
+FACE_DOWN_AT_DEAL = sum(range(TABLEAU_COUNT))
+
+
+# Chance weights of the legal moves of every board
+def move_weights(env):
+    legal, counts = env.legal_moves()
+    weights = np.broadcast_to(MOVE_WEIGHTS, legal.shape).copy()
+    runs = env.heights[:, :TABLEAU_COUNT] - env.hidden
+    whole = counts[:, :TABLEAU_COUNT, :TABLEAU_COUNT] == runs[:, :, None]
+    uncovers = whole & (env.hidden[:, :, None] > 0)
+    weights[:, :TABLEAU_COUNT, :TABLEAU_COUNT] = np.where(uncovers, UNCOVERING, SHUFFLING)
+    return weights.reshape(env.count, vecenv.ACTION_COUNT)
+
+
+# Playout score of the boards: the cards on the foundations and half a point for every face down card turned
+def scores(env):
+    founded = env.heights[:, FOUNDATION:].sum(axis=1)
+    return founded + (FACE_DOWN_AT_DEAL - env.hidden.sum(axis=1)) / 2.0
+
+
+def board_key(state):
+    return bytes(state.hidden) + b'|'.join(bytes(cards) for cards in state.piles)
+
+
+def after(state, move):
+    state = state.copy()
+    state.apply(move)
+    return state
+
+
+class Player(object):
+    def __init__(self, playouts=PLAYOUTS, depth=DEPTH, seed=None):
+        self.playouts = playouts
+        self.depth = depth
+        self.rng = np.random.default_rng(seed)
+        self.random = random.Random(seed)
+        self.environments = {}  # Rows -> VectorKlondike, kept for the next choice of as many rows
+        # Throughput counters
+        self.played = 0  # Playouts
+        self.steps = 0  # Playout moves, every row of every batch step
+        self.elapsed = 0.0
+
+    def environment(self, rows):
+        env = self.environments.get(rows)
+        if env is None:
+            env = self.environments[rows] = vecenv.VectorKlondike(rows, max_steps=self.depth + 1, auto_reset=False)
+        return env
+
+    # The state with the cards the player cannot see shuffled
+    def determinize(self, state):
+        state = state.copy()
+        hidden = state.hidden
+        unknown = bytearray(state.piles[STOCK])
+        for pile in range(TABLEAU_COUNT):
+            unknown += state.piles[pile][:hidden[pile]]
+        self.random.shuffle(unknown)
+        position = len(state.piles[STOCK])
+        state.piles[STOCK][:] = unknown[:position]
+        for pile in range(TABLEAU_COUNT):
+            state.piles[pile][:hidden[pile]] = unknown[position: position + hidden[pile]]
+            position += hidden[pile]
+        return state
+
+    # The legal moves worth a search as actions: the moves the solver would try (no runs moved back and forth)
+    # and the talon moves (vecenv counts a draw as one card, not several like the solver)
+    # Cards are never taken back from the foundations: the playouts found them again right away, so the search
+    # cannot tell the two boards apart and the card goes back and forth
+    def candidates(self, state):
+        env = self.environment(1)
+        env.load([0], [state])
+        actions = np.flatnonzero(env.legal_mask()[0])
+        tried = {vecenv.action(*child[0][:2]) for child in solver.Solver(state).ordered_children()
+                 if len(child) == 1 and child[0][0] < FOUNDATION}
+        keep = [action for action in actions
+                if action in tried or action // PILE_COUNT == STOCK or action % PILE_COUNT == STOCK]
+        return env, np.array(keep or actions)
+
+    # Mean playout score of every candidate action of the state (None if cancelled() became True)
+    def evaluate(self, state, actions, cancelled=None):
+        start = time.perf_counter()
+        per_action = max(1, self.playouts // len(actions))
+        rows = per_action * len(actions)
+        env = self.environment(rows)
+        env.load(env.rows, [self.determinize(state) for _ in range(per_action)] * len(actions))
+        env.step(np.repeat(actions, per_action))
+
+        for _ in range(self.depth):
+            if cancelled and cancelled():
+                return None
+            mask = env.legal_mask()
+            finished = env.heights[:, FOUNDATION:].sum(axis=1) == CARD_COUNT
+            if finished.all() or not mask.any():
+                break
+            env.step(np.where(finished, vecenv.NOOP, vecenv.random_actions(mask, self.rng, move_weights(env))))
+            self.steps += rows
+
+        self.played += rows
+        self.elapsed += time.perf_counter() - start
+        return scores(env).reshape(len(actions), per_action).mean(axis=1)
+
+    # The engine move to play (None if there is no legal move or cancelled() became True)
+    # Moves back to a board in seen (a set of board keys) are left out while there are others
+    def choose(self, state, cancelled=None, seen=()):
+        probe, actions = self.candidates(state)
+        if seen:
+            fresh = [action for action in actions if board_key(after(state, probe.move(0, action))) not in seen]
+            actions = np.array(fresh or actions)
+        if len(actions) == 0:
+            return None
+        # Turning a card over only shows more, it is played without a search
+        flips = actions[actions // PILE_COUNT == actions % PILE_COUNT]
+        if len(actions) == 1 or len(flips):
+            return probe.move(0, flips[0] if len(flips) else actions[0])
+        means = self.evaluate(state, actions, cancelled)
+        if means is None:
+            return None
+        # Equal scores go to the kind of move the playouts prefer
+        means += move_weights(probe)[0, actions] * 1e-3
+        return probe.move(0, actions[int(np.argmax(means))])
+
+    # Mean playout score from the state with random first moves, the difficulty estimate of a deal
+    def estimate(self, state):
+        probe, actions = self.candidates(state)
+        if len(actions) == 0:
+            return float(scores(probe)[0])
+        return float(self.evaluate(state, actions).mean())
+
+    # Play a game to its end, returns whether it was won and how many moves were played
+    def play(self, state, move_limit=MOVE_LIMIT):
+        moves = 0
+        seen = {board_key(state)}
+        while moves < move_limit and not state.won():
+            move = self.choose(state, seen=seen)
+            if move is None:
+                break
+            state.apply(move)
+            seen.add(board_key(state))
+            moves += 1
+        return state.won(), moves
+
+    def playouts_per_second(self):
+        return self.played / self.elapsed if self.elapsed else 0.0
+
+    def steps_per_second(self):
+        return self.steps / self.elapsed if self.elapsed else 0.0
+
+
+def parse_seeds(text):
+    if '-' in text:
+        first, last = text.split('-')
+        return range(int(first), int(last) + 1)
+    return [int(seed) for seed in text.split(',')]
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Let the computer player play deals and rate their difficulty')
+    parser.add_argument('--seeds', type=parse_seeds, default=range(5), help='deals to play, like 0-9 or 3,7')
+    parser.add_argument('--playouts', type=int, default=PLAYOUTS, help='playouts per move')
+    parser.add_argument('--depth', type=int, default=DEPTH, help='moves per playout')
+    parser.add_argument('--moves', type=int, default=MOVE_LIMIT, help='moves before a game is given up')
+    parser.add_argument('--seed', type=int, default=8334, help='seed of the playouts')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(sys.argv[1:] if argv is None else argv)
+    player = Player(options.playouts, options.depth, options.seed)
+    won = 0
+    for seed in options.seeds:
+        state = engine.KlondikeState.deal(engine.shuffled_codes(seed))
+        estimate = player.estimate(state)
+        start = time.perf_counter()
+        result, moves = player.play(state, options.moves)
+        won += result
+        print('seed %d: %s in %d moves, %d cards founded, estimate %.1f, %.1f s'
+              % (seed, 'won' if result else 'lost', moves, state.foundation_count(), estimate,
+                 time.perf_counter() - start))
+    print('%d of %d won, %.0f playouts/s, %.0f playout moves/s'
+          % (won, len(options.seeds), player.playouts_per_second(), player.steps_per_second()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
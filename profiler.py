@@ -0,0 +1,114 @@
+import collections
+import csv
+import gc
+import json
+import time
+import tracemalloc
+
+# Timing of the phases of every frame of the main loop, and counters of the drawing work done in them
+# Phases are timed lap by lap: mark(phase) charges the time since the previous mark to that phase
+
+# Phases of a frame, in the order they run
+PHASES = ('wait', 'events', 'win_check', 'timer', 'draw', 'flip', 'sleep')
+# Phases that are not work (blocked on the event queue or the frame rate cap), left out of the frame time
+IDLE_PHASES = ('wait', 'sleep')
+
+# Work counted everywhere in the game, whether the profiler is on or not (it only looks at the changes)
+counters = collections.Counter()  # 'blits', 'loads'
+
+PERCENTILES = (50, 90, 99)
+
+
+class FrameProfiler(object):
+    def __init__(self, enabled=False, keep=100000):
+        self.enabled = enabled
+        self.samples = collections.deque(maxlen=keep)  # One dict per frame
+        self.frame = None
+        self.last = 0.0
+        self.counted = collections.Counter()
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        self.frame = dict.fromkeys(PHASES, 0.0)
+        self.counted = collections.Counter(counters)
+        self.last = time.perf_counter()
+
+    def mark(self, phase):
+        if self.frame is None:
+            return
+        now = time.perf_counter()
+        self.frame[phase] += (now - self.last) * 1000
+        self.last = now
+
+    def end_frame(self):
+        frame = self.frame
+        if frame is None:
+            return
+        frame['frame'] = sum(frame[phase] for phase in PHASES if phase not in IDLE_PHASES)
+        for name in ('blits', 'loads'):
+            frame[name] = counters[name] - self.counted[name]
+        self.samples.append(frame)
+        self.frame = None
+
+    # Frame time (ms) at each of the percentiles, over the last count frames
+    def percentiles(self, count=None):
+        times = [frame['frame'] for frame in self.samples]
+        if count:
+            times = times[-count:]
+        if not times:
+            return {}
+        times.sort()
+        return dict((percent, times[min(len(times) - 1, len(times) * percent // 100)]) for percent in PERCENTILES)
+
+    # The text lines of the on-screen overlay
+    def summary(self, count=120):
+        lines = ['frame ' + '  '.join('p%d %.2f' % item for item in sorted(self.percentiles(count).items()))]
+        if self.samples:
+            last = self.samples[-1]
+            lines.append('  '.join('%s %.2f' % (phase, last[phase]) for phase in PHASES
+                                   if phase not in IDLE_PHASES))
+            lines.append('blits %d  loads %d' % (last['blits'], last['loads']))
+        return lines
+
+    # Save the samples, as csv or json depending on the file extension
+    def write_trace(self, path):
+        fields = ('frame',) + PHASES + ('blits', 'loads')
+        with open(path, 'w', newline='') as handle:
+            if path.endswith('.json'):
+                json.dump({'fields': fields, 'frames': [[frame[field] for field in fields]
+                                                        for frame in self.samples]}, handle)
+            else:
+                writer = csv.writer(handle)
+                writer.writerow(fields)
+                for frame in self.samples:
+                    writer.writerow(['%.4f' % frame[field] if isinstance(frame[field], float) else frame[field]
+                                     for field in fields])
+
+
+# Memory allocated by calling func, per call, measured with tracemalloc
+# bytes and blocks are what the calls leave allocated, peak_bytes the most they held at once
+# The garbage collector is off meanwhile, so objects that only a collection would free (reference cycles) count too
+def allocations(func, number=20):
+    enabled = gc.isenabled()
+    gc.collect()
+    gc.disable()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        start = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        for _ in range(number):
+            func()
+        peak = tracemalloc.get_traced_memory()[1] - start
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+        if enabled:
+            gc.enable()
+    # Leave out the snapshots themselves
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    stats = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), 'filename')
+    return {'bytes': max(0, sum(stat.size_diff for stat in stats)) // number,
+            'blocks': max(0, sum(stat.count_diff for stat in stats)) // number,
+            'peak_bytes': peak}
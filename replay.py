@@ -0,0 +1,205 @@
+import argparse
+import os
+import struct
+import sys
+import time
+
+import pygame
+from pygame.locals import *
+
+import savegame
+from outlook import WinSet
+
+# Input logs: the events a game handled, to play the same session again without a player
+# Record with: python main.py --record game.log
+# Replay with: python replay.py game.log [more.log ...] [--repeat N]
+# The replay skips the frame pacing and the drawing, checks that the piles end like they did when recording,
+# and reports how many events per second the event handling gets through
+#
+# Layout: header (magic, version, session seed), then one record per event: time in ms since the recording
+# started, kind, and the fields of that kind; the log ends with END and the saved game of the final board
+#
+# The moves and deals of the computer (the demo and auto play) come from timers, background processes and the
+# endgame table, not from the events, so they are logged as events of their own (PLAYED and DEALT)
+# A replay plays them from the log and never lets the computer search or play by itself
+
+MAGIC = b'SOLR'
+VERSION = 2  # 1 did not log the moves of the computer
+HEADER = struct.Struct('<4sB3xQ')
+SEED_LIMIT = (1 << 64) - 1  # The session seed is kept in the 8 bytes of the header
+EVENT = struct.Struct('<IB')  # time, kind
+END = 255
+PLAYED = USEREVENT + 1  # A move of the computer, move is its (src, dst, count)
+DEALT = USEREVENT + 2  # The demo dealt the next game of the session
+
+# kind -> pygame event type, fields of the record, the event attributes they hold
+KINDS = {
+    1: (MOUSEBUTTONDOWN, struct.Struct('<hhB'), ('pos', 'button')),
+    2: (MOUSEBUTTONUP, struct.Struct('<hhB'), ('pos', 'button')),
+    3: (MOUSEMOTION, struct.Struct('<hhhhB'), ('pos', 'rel', 'buttons')),
+    4: (KEYDOWN, struct.Struct('<i'), ('key',)),
+    5: (KEYUP, struct.Struct('<i'), ('key',)),
+    6: (QUIT, struct.Struct(''), ()),
+    7: (VIDEORESIZE, struct.Struct('<HH'), ('size',)),
+    8: (PLAYED, struct.Struct('<BBB'), ('move',)),
+    9: (DEALT, struct.Struct(''), ()),
+}
+KIND_OF = dict((event_type, kind) for kind, (event_type, fields, names) in KINDS.items())
+
+
+def encode(event):
+    kind = KIND_OF[event.type]
+    if event.type == MOUSEMOTION:
+        buttons = sum(1 << index for index, pressed in enumerate(event.buttons[:8]) if pressed)
+        values = event.pos + event.rel + (buttons,)
+    elif event.type in (MOUSEBUTTONDOWN, MOUSEBUTTONUP):
+        values = event.pos + (event.button,)
+    elif event.type in (KEYDOWN, KEYUP):
+        values = (event.key,)
+    elif event.type == VIDEORESIZE:
+        values = event.size
+    elif event.type == PLAYED:
+        values = event.move
+    else:
+        values = ()
+    return kind, KINDS[kind][1].pack(*values)
+
+
+def decode(kind, values):
+    event_type, fields, names = KINDS[kind]
+    if event_type == MOUSEMOTION:
+        attributes = {'pos': values[0:2], 'rel': values[2:4], 'buttons': tuple(values[4] >> index & 1 for index in range(3))}
+    elif event_type in (MOUSEBUTTONDOWN, MOUSEBUTTONUP):
+        attributes = {'pos': values[0:2], 'button': values[2]}
+    elif event_type == VIDEORESIZE:
+        attributes = {'size': values, 'w': values[0], 'h': values[1]}
+    elif event_type == PLAYED:
+        attributes = {'move': values}
+    else:
+        attributes = dict(zip(names, values))
+    return pygame.event.Event(event_type, attributes)
+
+
+def played_event(move):
+    return pygame.event.Event(PLAYED, move=tuple(move))
+
+
+def dealt_event():
+    return pygame.event.Event(DEALT)
+
+
+# Writes the events to the log as they are handled
+class EventRecorder(object):
+    def __init__(self, path, seed):
+        self.handle = open(path, 'wb')
+        self.handle.write(HEADER.pack(MAGIC, VERSION, seed))
+        self.start = None
+
+    # Only the events that can change the game are kept
+    def record(self, event, now):
+        if event.type not in KIND_OF:
+            return
+        if self.start is None:
+            self.start = now
+        kind, fields = encode(event)
+        self.handle.write(EVENT.pack(now - self.start, kind) + fields)
+
+    # End the log with the board the events led to
+    def close(self, state):
+        self.handle.write(EVENT.pack(0, END) + savegame.pack(state, 0, 0))
+        self.handle.close()
+
+
+# Returns the session seed, the (time, event) pairs and the final engine state (None if the log was cut short)
+# Raises ValueError for a file that is not an input log or is damaged
+def read_log(path):
+    with open(path, 'rb') as handle:
+        data = handle.read()
+    if len(data) < HEADER.size:
+        raise ValueError('%s is a damaged input log' % path)
+    magic, version, seed = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('%s is not a version %d input log' % (path, VERSION))
+
+    events = []
+    final = None
+    position = HEADER.size
+    while position + EVENT.size <= len(data):
+        now, kind = EVENT.unpack_from(data, position)
+        position += EVENT.size
+        if kind == END:
+            # A final board cut short was never written whole, one that is whole has to read back
+            if position + savegame.SIZE <= len(data):
+                try:
+                    final = savegame.unpack(data[position: position + savegame.SIZE])[0]
+                except ValueError:
+                    raise ValueError('%s is a damaged input log' % path)
+            break
+        if kind not in KINDS:
+            raise ValueError('%s is a damaged input log' % path)
+        fields = KINDS[kind][1]
+        if position + fields.size > len(data):
+            break
+        events.append((now, decode(kind, fields.unpack_from(data, position))))
+        position += fields.size
+    return seed, events, final
+
+
+# A new game of the recorded session, playing the moves of the computer from the log only
+# (Main is imported here, as main.py imports this module)
+def new_game(seed):
+    from main import Main
+    game = Main(seed)
+    game.replaying = True
+    return game
+
+
+# Feed the events to the game as fast as they can be handled
+# The QUIT at the end is not fed, it would close the game
+def play(game, events):
+    for now, event in events:
+        if event.type == QUIT:
+            break
+        game.handle_event(event, now)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Replay input logs recorded with main.py --record')
+    parser.add_argument('logs', nargs='+')
+    parser.add_argument('--repeat', type=int, default=1, help='replays of every log (the fastest is reported)')
+    parser.add_argument('--images', help='directory of the card images (defaults to WinSet.image_path)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(sys.argv[1:] if argv is None else argv)
+    # Replays never open a window
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    if options.images:
+        WinSet.image_path = options.images
+
+    failed = 0
+    for path in options.logs:
+        seed, events, final = read_log(path)
+        best = None
+        for _ in range(max(1, options.repeat)):
+            game = new_game(seed)
+            start = time.perf_counter()
+            play(game, events)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        if final is None:
+            verdict = 'no final board in the log'
+        elif game.snapshot() == final:
+            verdict = 'ok'
+        else:
+            verdict = 'MISMATCH'
+            failed += 1
+        print('%s: %d events in %.1f ms (%.0f events/s) %s' % (path, len(events), best * 1000,
+                                                               len(events) / best if best else 0, verdict))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
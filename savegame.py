@@ -0,0 +1,99 @@
+import os
+import struct
+import threading
+import zlib
+
+import engine
+
+# Saved games: one fixed layout record of 90 bytes
+# magic, version, seed of the deal, elapsed time in ms, the size of the 13 engine piles, the face down count of the
+# 7 tableau piles, the 52 card codes pile after pile (bottom card first), then a CRC32 of everything before it
+
+MAGIC = b'SOLS'
+VERSION = 1
+BODY = struct.Struct('<4sBxII13s7s52s')
+CHECKSUM = struct.Struct('<I')
+SIZE = BODY.size + CHECKSUM.size
+SEED_LIMIT = (1 << 32) - 1  # Deal seeds are kept in 4 bytes
+
+
+def pack(state, seed, elapsed):
+    sizes = bytes(len(cards) for cards in state.piles)
+    body = BODY.pack(MAGIC, VERSION, seed, max(0, int(elapsed)), sizes, bytes(state.hidden),
+                     b''.join(bytes(cards) for cards in state.piles))
+    return body + CHECKSUM.pack(zlib.crc32(body))
+
+
+# Returns the engine state, the seed and the elapsed time, raises ValueError for anything but a valid save
+def unpack(data):
+    if len(data) != SIZE:
+        raise ValueError('a saved game is %d bytes, not %d' % (SIZE, len(data)))
+    body = data[:BODY.size]
+    if CHECKSUM.unpack_from(data, BODY.size)[0] != zlib.crc32(body):
+        raise ValueError('the saved game is damaged')
+    magic, version, seed, elapsed, sizes, hidden, codes = BODY.unpack(body)
+    if magic != MAGIC:
+        raise ValueError('not a saved game')
+    if version != VERSION:
+        raise ValueError('saved game version %d is not supported' % version)
+    if sorted(codes) != list(range(len(engine.CARD_CODES))) or sum(sizes) != len(codes):
+        raise ValueError('the saved game does not hold every card once')
+
+    state = engine.KlondikeState()
+    position = 0
+    for index, size in enumerate(sizes):
+        state.piles[index][:] = codes[position: position + size]
+        position += size
+    state.hidden[:] = hidden
+    if any(state.hidden[index] > sizes[index] for index in range(engine.TABLEAU_COUNT)):
+        raise ValueError('the saved game hides more cards than a pile holds')
+    return state, seed, elapsed
+
+
+def load(path):
+    with open(path, 'rb') as handle:
+        return unpack(handle.read(SIZE + 1))
+
+
+# Write the file in one piece: a crash while saving leaves the previous save
+def write(path, data):
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as handle:
+        handle.write(data)
+    os.replace(temporary, path)
+
+
+# Saves the game on a background thread, so saving after every move never holds up a frame
+# Only the newest save matters: a save that is still waiting when a newer one comes is dropped
+class SaveWriter(object):
+    def __init__(self, path):
+        self.path = path
+        self.pending = None
+        self.written = 0
+        self.condition = threading.Condition()
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, name='save-writer', daemon=True)
+        self.thread.start()
+
+    def submit(self, data):
+        with self.condition:
+            self.pending = data
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self.closed:
+                    self.condition.wait()
+                data, self.pending = self.pending, None
+                if data is None:
+                    return
+            write(self.path, data)
+            self.written += 1
+
+    # Write what is still waiting and stop the thread
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
@@ -0,0 +1,265 @@
+import argparse
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+import time
+
+import batch
+import savegame
+
+# Index of the RNG seeds whose deals are known to be winnable, for the "winnable deals only" mode of the game
+# The game maps the file and picks a random entry without any search: an entry is found by a lookup in the block
+# table and decoding at most BLOCK_SIZE entries
+# Layout: header, the checked seed ranges (start, stop), the block table (first seed of the block and where its
+# entries start), then the entries in seed order as unsigned LEB128 varints: the seed minus the one before it
+# (left out for the first entry of a block), the moves of the solution and the nodes the solver needed
+# The ranges remember every seed that was looked at, won or not, so a build only solves the seeds not seen before
+# Build or grow it with: python seedindex.py START STOP [--index winnable.idx] [--workers N]
+
+MAGIC = b'SOLW'
+VERSION = 1
+BLOCK_SIZE = 64  # Entries per block
+HEADER = struct.Struct('<4sHHIII')  # magic, version, block size, entry count, range count, block count
+RANGE = struct.Struct('<QQ')
+BLOCK = struct.Struct('<QI')
+
+
+def write_varint(out, value):
+    while value > 0x7f:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+# The value at position in data and the position after it
+def read_varint(data, position):
+    result = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, position
+        shift += 7
+
+
+# Join overlapping and touching (start, stop) ranges
+def merge_ranges(ranges):
+    merged = []
+    for start, stop in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+# The parts of [start, stop) outside the ranges
+def missing_ranges(start, stop, ranges):
+    missing = []
+    for first, last in merge_ranges(ranges):
+        if last <= start or first >= stop:
+            continue
+        if first > start:
+            missing.append((start, first))
+        start = max(start, last)
+    if start < stop:
+        missing.append((start, stop))
+    return missing
+
+
+class SeedIndex(object):
+    def __init__(self, path):
+        with open(path, 'rb') as handle:
+            self.data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # A short or damaged file is refused before anything is read from it
+        if len(self.data) < HEADER.size:
+            self.data.close()
+            raise ValueError('%s is too short for a seed index' % path)
+        magic, version, self.block_size, self.count, range_count, block_count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            self.data.close()
+            raise ValueError('%s is not a version %d seed index' % (path, VERSION))
+        position = HEADER.size
+        if (self.block_size < 1 or block_count != -(-self.count // self.block_size)
+                or len(self.data) < position + range_count * RANGE.size + block_count * BLOCK.size):
+            self.data.close()
+            raise ValueError('%s is a damaged seed index' % path)
+        self.ranges = [RANGE.unpack_from(self.data, position + i * RANGE.size) for i in range(range_count)]
+        position += range_count * RANGE.size
+        self.blocks = position  # The block table is read from the mapped file as it is needed
+        self.block_count = block_count
+        self.offset = position + block_count * BLOCK.size
+        # Every entry takes at least a byte per varint, so the last block has to fit in what is left
+        if block_count:
+            last = self.block(block_count - 1)[1]
+            entries = self.count - (block_count - 1) * self.block_size
+            if last + entries * 3 - 1 > len(self.data):
+                self.data.close()
+                raise ValueError('%s is a damaged seed index' % path)
+
+    def __len__(self):
+        return self.count
+
+    # The first seed of a block and where its entries start in the file
+    def block(self, number):
+        seed, offset = BLOCK.unpack_from(self.data, self.blocks + number * BLOCK.size)
+        return seed, self.offset + offset
+
+    # The (seed, moves, nodes) of the entries of a block, the first skip entries are only decoded
+    def block_entries(self, block, skip=0):
+        seed, position = self.block(block)
+        data = self.data
+        for i in range(min(self.block_size, self.count - block * self.block_size)):
+            if i:
+                delta, position = read_varint(data, position)
+                seed += delta
+            moves, position = read_varint(data, position)
+            nodes, position = read_varint(data, position)
+            if i >= skip:
+                yield seed, moves, nodes
+
+    # The (seed, moves, nodes) of the entry, entries are in seed order
+    def entry(self, number):
+        if not 0 <= number < self.count:
+            raise IndexError('seed index entry %d out of range' % number)
+        block, skip = divmod(number, self.block_size)
+        return next(self.block_entries(block, skip))
+
+    def seed(self, number):
+        return self.entry(number)[0]
+
+    # Every (seed, moves, nodes) in seed order
+    def entries(self):
+        for block in range(self.block_count):
+            for entry in self.block_entries(block):
+                yield entry
+
+    # The entry number of a winnable seed (None if the seed is not in the index)
+    def find(self, seed):
+        # Binary search for the last block starting at or before the seed
+        low, high = 0, self.block_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.block(middle)[0] <= seed:
+                low = middle + 1
+            else:
+                high = middle
+        if low == 0:
+            return None
+        for number, entry in enumerate(self.block_entries(low - 1), (low - 1) * self.block_size):
+            if entry[0] >= seed:
+                return number if entry[0] == seed else None
+        return None
+
+    def checked(self, seed):
+        return any(start <= seed < stop for start, stop in self.ranges)
+
+    def close(self):
+        self.data.close()
+
+
+# Write an index of the (seed, moves, nodes) entries (any order) and the checked ranges
+# The file is replaced at once, a reader never sees half of it
+def write_index(path, entries, ranges, block_size=BLOCK_SIZE):
+    entries = sorted(entries)
+    ranges = merge_ranges(ranges)
+    data = bytearray()
+    blocks = []
+    previous = None
+    for number, (seed, moves, nodes) in enumerate(entries):
+        if number % block_size == 0:
+            blocks.append(BLOCK.pack(seed, len(data)))
+        else:
+            write_varint(data, seed - previous)
+        write_varint(data, moves)
+        write_varint(data, nodes)
+        previous = seed
+
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as handle:
+        handle.write(HEADER.pack(MAGIC, VERSION, block_size, len(entries), len(ranges), len(blocks)))
+        handle.write(b''.join(RANGE.pack(start, stop) for start, stop in ranges))
+        handle.write(b''.join(blocks))
+        handle.write(data)
+    os.replace(temporary, path)
+    return len(entries)
+
+
+def read_index(path):
+    if not os.path.exists(path):
+        return [], []
+    index = SeedIndex(path)
+    try:
+        return list(index.entries()), list(index.ranges)
+    finally:
+        index.close()
+
+
+# The batch.py work units for the seeds of [start, stop) that are not in the checked ranges
+def index_tasks(start, stop, ranges, options):
+    for first, last in missing_ranges(start, stop, ranges):
+        for chunk in range(first, last, options.chunk):
+            yield chunk, min(chunk + options.chunk, last), frozenset(), options
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Solve a range of seeds and add the winnable ones to the index')
+    # The game saves the seed of a deal in 4 bytes, so the index only holds seeds it can save
+    parser.add_argument('start', type=batch.bounded_int(0, savegame.SEED_LIMIT), help='first seed')
+    parser.add_argument('stop', type=batch.bounded_int(0, savegame.SEED_LIMIT + 1), help='seed after the last one')
+    parser.add_argument('--index', default='winnable.idx', help='index file, created or grown (default %(default)s)')
+    parser.add_argument('--workers', type=batch.bounded_int(1), default=multiprocessing.cpu_count())
+    parser.add_argument('--chunk', type=batch.bounded_int(1), default=64, help='seeds per work unit')
+    parser.add_argument('--node-budget', type=int, default=200000)
+    parser.add_argument('--time-budget', type=float, default=None, help='seconds per deal')
+    parser.add_argument('--save-every', type=float, default=60.0, help='seconds between two writes of the index')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(sys.argv[1:] if argv is None else argv)
+    options.mode = 'solve'  # The work units are batch.py's
+    entries, ranges = read_index(options.index)
+    known = len(entries)
+    tasks = list(index_tasks(options.start, options.stop, ranges, options))
+    print('%d winnable seeds in the index, %d seeds to check' % (known, sum(task[1] - task[0] for task in tasks)))
+
+    begin = saved = time.time()
+    checked = 0
+    pool = multiprocessing.Pool(options.workers)
+    try:
+        # The ranges of the chunks come back with their results, so an interrupted build keeps what it finished
+        for rows in pool.imap_unordered(batch.run_chunk, tasks):
+            if rows:
+                ranges.append((rows[0][0], rows[-1][0] + 1))
+            checked += len(rows)
+            entries.extend((seed, moves, nodes) for seed, code, moves, nodes in rows if code == batch.WIN)
+            if time.time() - saved >= options.save_every:
+                write_index(options.index, entries, ranges)
+                saved = time.time()
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        print('interrupted, run the same command again to check the rest')
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        # The seeds checked so far are written first, whatever happens after
+        try:
+            count = write_index(options.index, entries, ranges)
+        finally:
+            pool.join()
+
+    elapsed = time.time() - begin
+    print('%d seeds checked in %.1fs, %d winnable added, %d in %s (%d bytes)'
+          % (checked, elapsed, count - known, count, options.index, os.path.getsize(options.index)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,287 @@
+import argparse
+import asyncio
+import json
+import random
+import sys
+
+import engine
+import journal
+import moves
+
+# Klondike as a service: many independent games in one process, played over a line delimited JSON protocol
+# Usage: python server.py [--host 127.0.0.1] [--port 8334] [--unix PATH]
+#
+# Every request is one JSON object on one line, every response is one line too, in the order of the requests:
+#   {"op": "deal", "seed": 5}                                   -> {"ok": true, "session": 1, "seed": 5}
+#   {"op": "move", "session": 1, "src": 8, "dst": 2, "count": 1} -> {"ok": true, "won": false}
+#   {"op": "draw", "session": 1}                                -> {"ok": true, "move": [7, 8, 1], "won": false}
+#   {"op": "undo" | "redo", "session": 1}                       -> {"ok": true, "move": [...]} (move is null if none)
+#   {"op": "moves", "session": 1}                               -> {"ok": true, "moves": [[src, dst, count], ...]}
+#   {"op": "state", "session": 1}                               -> {"ok": true, "piles": [...], "won": false, ...}
+#   {"op": "close", "session": 1}                               -> {"ok": true}
+#   {"op": "stats"}                                             -> {"ok": true, "sessions": 1, "memory": 2048}
+# Piles use the engine indices: 0-6 tableau, 7 draw pile, 8 discard pile, 9-12 foundations
+# Cards are the engine codes (index in WinSet.image_names), face down cards are null
+# A request can carry an "id", which is copied into its response
+# Errors are {"ok": false, "error": "..."}, the connection stays open
+
+HISTORY_LIMIT = 512  # Moves each session can undo
+
+
+class ProtocolError(Exception):
+    pass
+
+
+# The integer field of a request (JSON true and false are not integers here, neither are 1.5 or "1")
+def integer_field(request, name):
+    value = request.get(name)
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise ProtocolError('%s must be an integer' % name)
+    return value
+
+
+# One game: the board, its legal moves kept up to date and its undo history
+# The rules are the ones of the game window (objects.py and engine.py share them)
+class Session(object):
+    __slots__ = ('number', 'seed', 'state', 'moves', 'journal')
+
+    def __init__(self, number, seed):
+        self.number = number
+        self.seed = seed
+        self.state = engine.KlondikeState.deal(engine.shuffled_codes(seed))
+        self.moves = moves.MoveGenerator(self.state)
+        self.journal = journal.MoveJournal(HISTORY_LIMIT)
+
+    def play(self, move):
+        if not self.state.is_legal(move):
+            raise ProtocolError('illegal move %s' % list(move))
+        self.moves.apply(move)
+        self.journal.record(move)
+
+    def draw(self):
+        move = self.state.talon_move()
+        if move is None:
+            raise ProtocolError('the talon is empty')
+        self.play(move)
+        return move
+
+    def undo(self):
+        move = self.journal.undo()
+        if move:
+            self.moves.undo(move)
+        return move
+
+    def redo(self):
+        move = self.journal.redo()
+        if move:
+            self.moves.apply(move)
+        return move
+
+    # The board as the player sees it
+    def view(self):
+        state = self.state
+        piles = []
+        for index, cards in enumerate(state.piles):
+            hidden = state.hidden[index] if index < engine.TABLEAU_COUNT else 0
+            if index == engine.STOCK:
+                hidden = len(cards)
+            piles.append([None] * hidden + list(cards[hidden:]))
+        return {'piles': piles, 'won': state.won(), 'history': len(self.journal)}
+
+    # Bytes held by the session (the objects it owns, not the code and tables shared by every session)
+    def memory(self):
+        size = sys.getsizeof(self)
+        for owner in (self.state, self.moves, self.journal):
+            size += sys.getsizeof(owner)
+        size += sys.getsizeof(self.state.piles) + sum(sys.getsizeof(cards) for cards in self.state.piles)
+        size += sys.getsizeof(self.state.hidden)
+        size += sys.getsizeof(self.moves.pile_of) + sys.getsizeof(self.moves.position)
+        for history in (self.journal.done, self.journal.undone):
+            size += sys.getsizeof(history) + sum(sys.getsizeof(packed) for packed in history)
+        return size
+
+
+LINE_TOO_LONG = b'{"ok":false,"error":"line too long"}\n'
+
+
+# The next line of a connection (empty at the end of the stream)
+# A line longer than the limit of the stream is skipped up to its end and read as None
+async def read_line(reader):
+    try:
+        return await reader.readuntil(b'\n')
+    except asyncio.IncompleteReadError as error:
+        return error.partial
+    except asyncio.LimitOverrunError as error:
+        consumed = error.consumed
+    while True:
+        await reader.readexactly(consumed)
+        try:
+            await reader.readuntil(b'\n')
+            return None
+        except asyncio.IncompleteReadError:
+            return None
+        except asyncio.LimitOverrunError as error:
+            consumed = error.consumed
+
+
+class GameServer(object):
+    def __init__(self, max_sessions=100000):
+        self.max_sessions = max_sessions
+        self.sessions = {}
+        self.counter = 0
+        self.requests = 0
+        self.connections = 0
+        self.handlers = {
+            'deal': self.op_deal,
+            'move': self.op_move,
+            'draw': self.op_draw,
+            'undo': self.op_undo,
+            'redo': self.op_redo,
+            'moves': self.op_moves,
+            'state': self.op_state,
+            'close': self.op_close,
+            'stats': self.op_stats,
+        }
+
+    def session(self, request):
+        number = integer_field(request, 'session')
+        session = self.sessions.get(number)
+        if session is None:
+            raise ProtocolError('no session %d' % number)
+        return session
+
+    def op_deal(self, request):
+        if request.get('seed') is None:
+            seed = random.getrandbits(32)
+        else:
+            seed = integer_field(request, 'seed')
+        if request.get('session') is not None:
+            number = self.session(request).number
+        elif len(self.sessions) >= self.max_sessions:
+            raise ProtocolError('too many sessions')
+        else:
+            self.counter += 1
+            number = self.counter
+        self.sessions[number] = Session(number, seed)
+        return {'session': number, 'seed': seed}
+
+    def op_move(self, request):
+        session = self.session(request)
+        move = integer_field(request, 'src'), integer_field(request, 'dst'), integer_field(request, 'count')
+        if not (0 <= move[0] < engine.PILE_COUNT and 0 <= move[1] < engine.PILE_COUNT and move[2] >= 0):
+            raise ProtocolError('illegal move %s' % list(move))
+        session.play(move)
+        return {'won': session.state.won()}
+
+    def op_draw(self, request):
+        session = self.session(request)
+        return {'move': list(session.draw()), 'won': session.state.won()}
+
+    def op_undo(self, request):
+        move = self.session(request).undo()
+        return {'move': list(move) if move else None}
+
+    def op_redo(self, request):
+        move = self.session(request).redo()
+        return {'move': list(move) if move else None}
+
+    def op_moves(self, request):
+        return {'moves': [list(move) for move in self.session(request).moves.legal_moves()]}
+
+    def op_state(self, request):
+        session = self.session(request)
+        response = session.view()
+        response['seed'] = session.seed
+        return response
+
+    def op_close(self, request):
+        del self.sessions[self.session(request).number]
+        return {}
+
+    def op_stats(self, request):
+        return {'sessions': len(self.sessions), 'requests': self.requests, 'connections': self.connections,
+                'memory': sum(session.memory() for session in self.sessions.values())}
+
+    # Answer one request (a dict), the answer is a dict as well
+    def handle(self, request):
+        self.requests += 1
+        if not isinstance(request, dict):
+            response = {'ok': False, 'error': 'a request must be a JSON object'}
+        else:
+            try:
+                op = request.get('op')
+                handler = self.handlers.get(op) if isinstance(op, str) else None
+                if handler is None:
+                    raise ProtocolError('unknown op %s' % json.dumps(op))
+                response = handler(request)
+                response['ok'] = True
+            except ProtocolError as error:
+                response = {'ok': False, 'error': str(error)}
+            if 'id' in request:
+                response['id'] = request['id']
+        return response
+
+    # Answer one line of the protocol
+    def handle_line(self, line):
+        # Nesting deeper than the stack of the decoder raises RecursionError
+        try:
+            request = json.loads(line)
+        except (ValueError, RecursionError):
+            response = {'ok': False, 'error': 'invalid JSON'}
+        else:
+            response = self.handle(request)
+        return json.dumps(response, separators=(',', ':')).encode('ascii') + b'\n'
+
+    async def serve_connection(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                line = await read_line(reader)
+                if line is None:
+                    writer.write(LINE_TOO_LONG)
+                    await writer.drain()
+                    continue
+                if not line:
+                    break
+                if line.strip():
+                    writer.write(self.handle_line(line))
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=8334, unix=None):
+        if unix:
+            return await asyncio.start_unix_server(self.serve_connection, unix)
+        return await asyncio.start_server(self.serve_connection, host, port)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Host many Klondike games over a line delimited JSON protocol')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8334)
+    parser.add_argument('--unix', help='listen on this Unix socket instead of TCP')
+    parser.add_argument('--max-sessions', type=int, default=100000)
+    return parser.parse_args(argv)
+
+
+async def serve(options):
+    server = await GameServer(options.max_sessions).start(options.host, options.port, options.unix)
+    print('listening on %s' % (options.unix or '%s:%d' % (options.host, options.port)))
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    options = parse_args(sys.argv[1:] if argv is None else argv)
+    try:
+        asyncio.run(serve(options))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,492 @@
+import random
+import time
+
+import engine
+from engine import STOCK, WASTE, FOUNDATION, PILE_COUNT, TABLEAU_COUNT
+
+# Answers of the solver
+WINNABLE = 'winnable'
+NOT_WINNABLE = 'not winnable'
+NO_WIN_FOUND = 'no win found'
+UNKNOWN = 'unknown'
+
+# Longest a pile can get (6 face down cards plus a full king to ace run, or the whole talon)
+MAX_DEPTH = 32
+
+# Zobrist keys for every (card, pile, position in pile) and for every face down count of a tableau pile
+# The seed is fixed so hashes are comparable between runs
+_keys = random.Random(8334)
+CARD_KEYS = [_keys.getrandbits(64) for _ in range(len(engine.CARD_CODES) * PILE_COUNT * MAX_DEPTH)]
+HIDDEN_KEYS = [_keys.getrandbits(64) for _ in range(TABLEAU_COUNT * MAX_DEPTH)]
+del _keys
+
+
+def card_key(code, pile, position):
+    return CARD_KEYS[(code * PILE_COUNT + pile) * MAX_DEPTH + position]
+
+
+# Full (non incremental) hash of a state, the solver only uses it once at the root
+def state_hash(state):
+    result = 0
+    for pile, cards in enumerate(state.piles):
+        for position, code in enumerate(cards):
+            result ^= card_key(code, pile, position)
+    for pile, hidden in enumerate(state.hidden):
+        result ^= HIDDEN_KEYS[pile * MAX_DEPTH + hidden]
+    return result
+
+
+# Boards that only differ by swapping the two red suits and/or the two black suits, by the order of the tableau
+# piles or by the order of the foundations play the same, the symmetric keys give them all the same key
+# The suit each suit becomes in the four suit swaps (the codes are rank * 4 + suit, in the order of engine.SUITS)
+def suit_swaps():
+    reds = engine.RED_SUITS
+    blacks = tuple(suit for suit in range(len(engine.SUITS)) if suit not in reds)
+    swaps = []
+    for swapped_reds in (reds, reds[::-1]):
+        for swapped_blacks in (blacks, blacks[::-1]):
+            suits = [0] * len(engine.SUITS)
+            for pair, swapped in ((reds, swapped_reds), (blacks, swapped_blacks)):
+                for suit, into in zip(pair, swapped):
+                    suits[suit] = into
+            swaps.append(tuple(suits))
+    return tuple(swaps)
+
+
+SUIT_SWAPS = suit_swaps()
+# Piles in the same group are interchangeable: the tableau, the draw pile, the discard pile and the foundations
+PILE_GROUPS = (0,) * TABLEAU_COUNT + (1, 2) + (3,) * (PILE_COUNT - FOUNDATION)
+GROUP_COUNT = 4
+MASK = (1 << 64) - 1
+
+# Zobrist keys per (card, pile group, position in pile), one table per suit swap with the cards swapped,
+# and per face down count of a tableau pile
+_keys = random.Random(8335)
+_group_keys = [_keys.getrandbits(64) for _ in range(len(engine.CARD_CODES) * GROUP_COUNT * MAX_DEPTH)]
+SWAPPED_CARD_KEYS = tuple([_group_keys[((code & ~3 | suits[code & 3]) * GROUP_COUNT + group) * MAX_DEPTH + position]
+                           for code in range(len(engine.CARD_CODES)) for group in range(GROUP_COUNT)
+                           for position in range(MAX_DEPTH)]
+                          for suits in SUIT_SWAPS)
+GROUP_HIDDEN_KEYS = [_keys.getrandbits(64) for _ in range(MAX_DEPTH)]
+del _keys, _group_keys
+
+
+# Scramble a pile hash before it is added to the others, so the sum does not depend on which pile holds which cards
+# the way a plain XOR or sum of the card keys would (splitmix64 finalizer)
+def mix(value):
+    value = (value ^ (value >> 30)) * 0xbf58476d1ce4e5b9 & MASK
+    value = (value ^ (value >> 27)) * 0x94d049bb133111eb & MASK
+    return value ^ (value >> 31)
+
+
+# The hash of every pile of a state for every suit swap
+def pile_hashes(state):
+    hashes = []
+    for keys in SWAPPED_CARD_KEYS:
+        row = []
+        for pile, cards in enumerate(state.piles):
+            base = PILE_GROUPS[pile] * MAX_DEPTH
+            result = GROUP_HIDDEN_KEYS[state.hidden[pile]] if pile < TABLEAU_COUNT else 0
+            for position, code in enumerate(cards):
+                result ^= keys[code * GROUP_COUNT * MAX_DEPTH + base + position]
+            row.append(result)
+        hashes.append(row)
+    return hashes
+
+
+# The piles are added up (so their order does not count), the smallest sum of the suit swaps is the key
+def symmetric_hash(state):
+    return min(sum(mix(value) for value in row) & MASK for row in pile_hashes(state))
+
+
+# The same symmetries as symmetric_hash, as an exact bytes key (no collisions, but slower)
+def canonical_board(state):
+    boards = []
+    for suits in SUIT_SWAPS:
+        piles = [bytes(code & ~3 | suits[code & 3] for code in cards) for cards in state.piles]
+        tableau = sorted(bytes((hidden, len(cards))) + cards for hidden, cards in zip(state.hidden, piles))
+        foundations = sorted(bytes((len(cards),)) + cards for cards in piles[FOUNDATION:])
+        talon = [bytes((len(cards),)) + cards for cards in piles[STOCK: FOUNDATION]]
+        boards.append(b''.join(tableau + talon + foundations))
+    return min(boards)
+
+
+# What the solver found out about a deal
+class SolveResult(object):
+    def __init__(self, status, moves, nodes, elapsed):
+        self.status = status
+        # The winning move sequence (engine move tuples) when status is WINNABLE
+        self.moves = moves
+        self.nodes = nodes
+        self.elapsed = elapsed
+
+    def nodes_per_second(self):
+        if self.elapsed <= 0:
+            return 0.0
+        return self.nodes / self.elapsed
+
+    def __repr__(self):
+        return 'SolveResult(%s, %d moves, %d nodes, %.3fs)' % (self.status, len(self.moves), self.nodes,
+                                                               self.elapsed)
+
+
+# Depth first search for a winning line from an engine state
+# Flips and safe foundation moves are played without branching, the remaining moves are tried foundation first
+# Tableau runs are only split when the card below can go to a foundation, whole runs only move to uncover a card
+# or free a pile for a king and foundation cards only come back when something can go onto them
+# Those rules can drop the only winning move, so a search that ran out of moves answers NOT_WINNABLE only if
+# it dropped none of them (every legal move was tried), and NO_WIN_FOUND otherwise
+# With symmetric on, the transposition table is keyed by symmetric_hash: a board is searched once for all its
+# suit swaps and pile orders. It is off by default: one deal hardly ever reaches a swapped copy of its own boards
+# (benchmark.py solver_cache), so the table gains almost nothing for keys that cost about twice as much
+class Solver(object):
+    def __init__(self, state, node_budget=2000000, time_budget=None, table_size=1 << 20, symmetric=False):
+        self.state = state.copy()
+        self.node_budget = node_budget
+        self.time_budget = time_budget
+        self.table_size = table_size
+        self.symmetric = symmetric
+        if symmetric:
+            # Pile hashes and their mixed sum for every suit swap, kept up to date by play
+            self.pile_hashes = pile_hashes(self.state)
+            self.sums = [sum(mix(value) for value in row) & MASK for row in self.pile_hashes]
+        else:
+            self.hash = state_hash(self.state)
+        self.nodes = 0
+        self.lookups = 0  # Transposition table lookups, and how many found a board searched already
+        self.hits = 0
+        self.pruned = False  # Set once ordered_children leaves out a move that could matter
+        # Asked now and then during the search, which stops (UNKNOWN) once it returns True
+        self.cancelled = None
+        # Two generation transposition table, the older half is dropped when the newer one fills up
+        self.seen = set()
+        self.old_seen = set()
+
+    def hit_rate(self):
+        return self.hits / float(self.lookups) if self.lookups else 0.0
+
+    def key(self):
+        if self.symmetric:
+            return min(self.sums)
+        return self.hash
+
+    # Remember a state, returns False if it has been searched already
+    def visit(self):
+        key = self.key()
+        self.lookups += 1
+        if key in self.seen or key in self.old_seen:
+            self.hits += 1
+            return False
+        if len(self.seen) >= self.table_size // 2:
+            self.old_seen = self.seen
+            self.seen = set()
+        self.seen.add(key)
+        return True
+
+    # XOR the cards from position start to the top of a pile in or out of the hash
+    def toggle(self, pile, start):
+        cards = self.state.piles[pile]
+        if self.symmetric:
+            base = PILE_GROUPS[pile] * MAX_DEPTH
+            for keys, row in zip(SWAPPED_CARD_KEYS, self.pile_hashes):
+                result = row[pile]
+                for position in range(start, len(cards)):
+                    result ^= keys[cards[position] * GROUP_COUNT * MAX_DEPTH + base + position]
+                row[pile] = result
+            return
+        base = pile * MAX_DEPTH
+        result = self.hash
+        for position in range(start, len(cards)):
+            result ^= CARD_KEYS[cards[position] * PILE_COUNT * MAX_DEPTH + base + position]
+        self.hash = result
+
+    # Add the mixed hashes of the piles to the sums of the suit swaps, or take them out (sign -1)
+    def add_piles(self, piles, sign):
+        for index, row in enumerate(self.pile_hashes):
+            total = self.sums[index]
+            for pile in piles:
+                total += sign * mix(row[pile])
+            self.sums[index] = total & MASK
+
+    # Apply (or undo) a move, keeping the hash up to date
+    def play(self, move, undo=False):
+        src, dst, count = move
+        state = self.state
+        changed_piles = (src,) if src == dst else (src, dst)
+        if self.symmetric:
+            self.add_piles(changed_piles, -1)
+        if src == dst:
+            hidden = state.hidden[src]
+            changed = hidden + 1 if undo else hidden - 1
+            if self.symmetric:
+                flip = GROUP_HIDDEN_KEYS[hidden] ^ GROUP_HIDDEN_KEYS[changed]
+                for row in self.pile_hashes:
+                    row[src] ^= flip
+            else:
+                self.hash ^= HIDDEN_KEYS[src * MAX_DEPTH + hidden] ^ HIDDEN_KEYS[src * MAX_DEPTH + changed]
+        else:
+            if undo:
+                keep_src, keep_dst = len(state.piles[src]), len(state.piles[dst]) - count
+            else:
+                keep_src, keep_dst = len(state.piles[src]) - count, len(state.piles[dst])
+            self.toggle(src, keep_src)
+            self.toggle(dst, keep_dst)
+        if undo:
+            state.undo(move)
+        else:
+            state.apply(move)
+        if src != dst:
+            self.toggle(src, keep_src)
+            self.toggle(dst, keep_dst)
+        if self.symmetric:
+            self.add_piles(changed_piles, 1)
+
+    # A card can always go to the foundation when both cards of the other color one number lower are there already
+    def safe_to_found(self, code):
+        number = engine.rank(code)
+        if number <= 2:
+            return True
+        red = engine.is_red(code)
+        found = 0
+        for pile in range(FOUNDATION, PILE_COUNT):
+            top = self.state.top(pile)
+            if top is not None and engine.is_red(top) != red and engine.rank(top) >= number - 1:
+                found += 1
+        return found == 2
+
+    # The next flip or safe foundation move (None if there is nothing to play)
+    def forced_move(self):
+        state = self.state
+        piles = state.piles
+        for src in range(TABLEAU_COUNT):
+            if state.hidden[src] and state.hidden[src] == len(piles[src]):
+                return src, src, 0
+        for src in (WASTE,) + tuple(range(TABLEAU_COUNT)):
+            cards = piles[src]
+            if not cards or (src < TABLEAU_COUNT and state.hidden[src] == len(cards)):
+                continue
+            code = cards[-1]
+            if not self.safe_to_found(code):
+                continue
+            for dst in range(FOUNDATION, PILE_COUNT):
+                if engine.can_found(state.top(dst), code):
+                    return src, dst, 1
+
+    # Is there a king that could make use of an empty tableau pile
+    def king_waiting(self):
+        state = self.state
+        for pile in range(TABLEAU_COUNT):
+            cards = state.piles[pile]
+            for i in range(max(state.hidden[pile], 1), len(cards)):
+                if engine.can_fill(cards[i]):
+                    return True
+        return any(engine.can_fill(code) for code in state.piles[STOCK] + state.piles[WASTE])
+
+    # Is there a card that could be put onto this card if it was on the tableau
+    def wanted(self, code):
+        state = self.state
+        for pile in range(TABLEAU_COUNT):
+            cards = state.piles[pile]
+            for i in range(state.hidden[pile], len(cards)):
+                if engine.can_stack(code, cards[i]):
+                    return True
+        return any(engine.can_stack(code, card) for card in state.piles[STOCK] + state.piles[WASTE])
+
+    # The moves worth trying, best first
+    # Each child is a tuple of moves played together, so drawing from the talon and playing the drawn card
+    # is one step of the search instead of one node per draw
+    def ordered_children(self):
+        state = self.state
+        piles = state.piles
+        hidden = state.hidden
+        scored = []
+        empty_seen = False
+        for move in state.legal_moves():
+            src, dst, count = move
+            if src == STOCK or dst == STOCK:
+                continue  # The talon is handled below
+            if dst >= FOUNDATION:
+                score = 0
+            elif src < TABLEAU_COUNT:
+                run = len(piles[src]) - hidden[src]
+                if count == run:
+                    # Moving a whole run only helps if it uncovers a card or frees a pile for a king
+                    if hidden[src]:
+                        score = 1 - hidden[src] / 10.0
+                    elif piles[dst] and self.king_waiting():
+                        score = 3
+                    else:
+                        # Onto an empty pile the board only changes its pile order
+                        if piles[dst]:
+                            self.pruned = True
+                        continue
+                else:
+                    below = piles[src][-count - 1]
+                    if not any(engine.can_found(state.top(f), below) for f in range(FOUNDATION, PILE_COUNT)):
+                        self.pruned = True
+                        continue
+                    score = 4
+                if not piles[dst]:
+                    # The empty tableau piles are interchangeable, only the first one is tried
+                    if empty_seen:
+                        continue
+                    empty_seen = True
+            elif src == WASTE:
+                score = 2
+            elif self.wanted(piles[src][-1]):
+                score = 6
+            else:
+                self.pruned = True
+                continue  # Taking a card back from a foundation only helps if something can go onto it
+            scored.append((score, (move,)))
+
+        # Every card of the draw pile can be reached by drawing, try playing each of them
+        stock = piles[STOCK]
+        tops = [state.top(f) for f in range(FOUNDATION, PILE_COUNT)]
+        empty = [dst for dst in range(TABLEAU_COUNT) if not piles[dst]][:1]
+        open_piles = [dst for dst in range(TABLEAU_COUNT) if piles[dst] and hidden[dst] < len(piles[dst])]
+        for depth in range(1, len(stock) + 1):
+            code = stock[-depth]
+            draw = (STOCK, WASTE, depth)
+            for i, top in enumerate(tops):
+                if engine.can_found(top, code):
+                    scored.append((0.5, (draw, (WASTE, FOUNDATION + i, 1))))
+                    break
+            for dst in open_piles:
+                if engine.can_stack(piles[dst][-1], code):
+                    scored.append((2.5, (draw, (WASTE, dst, 1))))
+            if engine.can_fill(code):
+                for dst in empty:
+                    scored.append((2.5, (draw, (WASTE, dst, 1))))
+
+        # The cards already in the discard pile need the talon to be turned over first
+        waste = len(piles[WASTE])
+        if waste and stock:
+            scored.append((5, ((STOCK, WASTE, len(stock)), (WASTE, STOCK, waste + len(stock)))))
+        elif waste:
+            scored.append((5, ((WASTE, STOCK, waste),)))
+
+        scored.sort(key=lambda item: item[0])
+        return [child for score, child in scored]
+
+    def out_of_budget(self, start):
+        if self.node_budget is not None and self.nodes >= self.node_budget:
+            return True
+        if self.nodes & 255:
+            return False
+        if self.cancelled and self.cancelled():
+            return True
+        return self.time_budget is not None and time.perf_counter() - start >= self.time_budget
+
+    # Play forced moves from the current state, returns how many were played
+    def play_forced(self, path):
+        played = 0
+        move = self.forced_move()
+        while move:
+            self.play(move)
+            path.append(move)
+            played += 1
+            move = self.forced_move()
+        return played
+
+    def unwind(self, path, count):
+        for _ in range(count):
+            self.play(path.pop(), True)
+
+    def solve(self):
+        start = time.perf_counter()
+        path = []
+        # Each frame holds the number of forced moves played on entering the node, its children and the next child
+        frames = []
+        entering = True
+        status = NOT_WINNABLE
+
+        while True:
+            if entering:
+                entering = False
+                forced = self.play_forced(path)
+                if self.state.won():
+                    status = WINNABLE
+                    break
+                if self.visit():
+                    frames.append([forced, self.ordered_children(), 0])
+                else:
+                    self.unwind(path, forced)
+                    self.leave(frames, path)
+
+            if not frames:
+                break
+            frame = frames[-1]
+            if frame[2] < len(frame[1]):
+                if self.out_of_budget(start):
+                    status = UNKNOWN
+                    break
+                child = frame[1][frame[2]]
+                frame[2] += 1
+                for move in child:
+                    self.play(move)
+                    path.append(move)
+                self.nodes += 1
+                entering = True
+            else:
+                frames.pop()
+                self.unwind(path, frame[0])
+                self.leave(frames, path)
+
+        if status == NOT_WINNABLE and self.pruned:
+            status = NO_WIN_FOUND
+        moves = list(path) if status == WINNABLE else []
+        return SolveResult(status, moves, self.nodes, time.perf_counter() - start)
+
+    # Take back the child of the parent frame that led to the current node
+    def leave(self, frames, path):
+        if frames:
+            parent = frames[-1]
+            self.unwind(path, len(parent[1][parent[2] - 1]))
+
+
+# Solve a deck given in the Main.loadCards order (a list of card codes)
+def solve_deal(codes, node_budget=2000000, time_budget=None, table_size=1 << 20):
+    return solve_state(engine.KlondikeState.deal(codes), node_budget, time_budget, table_size)
+
+
+def solve_state(state, node_budget=2000000, time_budget=None, table_size=1 << 20):
+    return Solver(state, node_budget, time_budget, table_size).solve()
+
+
+# Play a deal with a fixed strategy instead of searching: foundation moves, flips, tableau moves that uncover
+# a card, discard to tableau, and only then the talon
+# Returns whether the game was won and how many moves were played
+def greedy_playout(state, move_limit=1000):
+    state = state.copy()
+    piles = state.piles
+    hidden = state.hidden
+    played = 0
+    idle = 0  # Talon moves since the last real move
+
+    while played < move_limit and not state.won():
+        chosen = None
+        for move in state.legal_moves():
+            src, dst, count = move
+            if src == STOCK or dst == STOCK or src >= FOUNDATION:
+                continue
+            if src < TABLEAU_COUNT and dst < TABLEAU_COUNT:
+                # Only moves of a whole run that uncover a face down card make progress
+                if not hidden[src] or count != len(piles[src]) - hidden[src]:
+                    continue
+            chosen = move
+            break
+
+        if chosen:
+            idle = 0
+        else:
+            chosen = state.talon_move()
+            idle += 1
+            # Gone through the whole talon without anything to play
+            if not chosen or idle > len(piles[STOCK]) + len(piles[WASTE]) + 1:
+                break
+
+        state.apply(chosen)
+        played += 1
+
+    return state.won(), played
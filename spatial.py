@@ -0,0 +1,79 @@
+import pygame
+
+
+# Uniform grid over the screen for finding what lies under a point or a rect without scanning every object
+# Every item is stored in the cells its rects touch
+# rects_of(item) gives the current rects of an item, items that changed are reported with invalidate
+# and their cells are recomputed lazily before the next query
+class SpatialIndex(object):
+    def __init__(self, cell_size, rects_of):
+        self.cell_w, self.cell_h = cell_size
+        self.rects_of = rects_of
+        self.cells = {}
+        self.items = {}  # item -> (insertion order, rects, cells)
+        self.stale = set()
+        self.counter = 0
+
+    def clear(self):
+        self.cells = {}
+        self.items = {}
+        self.stale = set()
+
+    def add(self, item):
+        self.counter += 1
+        self.items[item] = (self.counter, [], [])
+        self.refresh(item)
+
+    def remove(self, item):
+        order, rects, cells = self.items.pop(item)
+        for cell in cells:
+            self.cells[cell].remove(item)
+        self.stale.discard(item)
+
+    # The item has been moved or changed size
+    def invalidate(self, item):
+        if item in self.items:
+            self.stale.add(item)
+
+    def cell_range(self, rect):
+        return (range(rect.left // self.cell_w, (rect.right - 1) // self.cell_w + 1),
+                range(rect.top // self.cell_h, (rect.bottom - 1) // self.cell_h + 1))
+
+    def refresh(self, item):
+        order, old_rects, old_cells = self.items[item]
+        for cell in old_cells:
+            self.cells[cell].remove(item)
+
+        rects = [pygame.Rect(rect) for rect in self.rects_of(item)]
+        cells = set()
+        for rect in rects:
+            columns, rows = self.cell_range(rect)
+            cells.update((column, row) for column in columns for row in rows)
+        for cell in cells:
+            self.cells.setdefault(cell, []).append(item)
+        self.items[item] = (order, rects, list(cells))
+
+    def update(self):
+        while self.stale:
+            self.refresh(self.stale.pop())
+
+    def sort(self, items):
+        return sorted(items, key=lambda item: self.items[item][0])
+
+    # Items with a rect containing the point, in the order they were added
+    def at_point(self, pos):
+        self.update()
+        candidates = self.cells.get((pos[0] // self.cell_w, pos[1] // self.cell_h), [])
+        return self.sort(item for item in candidates
+                         if any(rect.collidepoint(pos) for rect in self.items[item][1]))
+
+    # Items with a rect overlapping the rect, in the order they were added
+    def overlapping(self, rect):
+        self.update()
+        columns, rows = self.cell_range(rect)
+        found = set()
+        for column in columns:
+            for row in rows:
+                found.update(self.cells.get((column, row), []))
+        return self.sort(item for item in found
+                         if any(rect.colliderect(item_rect) for item_rect in self.items[item][1]))
@@ -0,0 +1,43 @@
+import os
+import random
+import signal
+import sys
+
+import pytest
+
+# The modules of the game are flat files at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# pygame runs without a window
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import engine  # noqa: E402
+
+
+# Boards from the middle of games: random legal moves played from random deals
+def random_boards(count, seed=8334, moves=60):
+    rng = random.Random(seed)
+    boards = []
+    for _ in range(count):
+        state = engine.KlondikeState.deal(engine.shuffled_codes(rng.getrandbits(32)))
+        for _ in range(rng.randrange(moves)):
+            legal = state.legal_moves()
+            if not legal:
+                break
+            state.apply(rng.choice(legal))
+        boards.append(state)
+    return boards
+
+
+@pytest.fixture
+def boards():
+    return random_boards(40)
+
+
+# Worker pools are stopped with SIGTERM, which the SDL of an initialised pygame catches in every forked worker
+@pytest.fixture
+def terminable_workers():
+    previous = signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    yield
+    if previous is not None:
+        signal.signal(signal.SIGTERM, previous)
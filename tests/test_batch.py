@@ -0,0 +1,47 @@
+import pytest
+
+import batch
+
+
+@pytest.mark.parametrize('suffix', ['.bin', '.csv'])
+def test_results_round_trip_at_the_limits(tmp_path, suffix):
+    rows = [(0, batch.LOSS, 0, 0), (batch.SEED_LIMIT, batch.WIN, batch.MOVE_LIMIT, batch.NODE_LIMIT),
+            (7, batch.NO_WIN_FOUND, 12, 3400)]
+    results = batch.results_file(str(tmp_path / ('results' + suffix)))
+    results.open()
+    results.write(rows)
+    results.close()
+    assert list(results.read()) == rows
+
+
+@pytest.mark.parametrize('argv', [
+    ['0', '10', '--move-limit', str(batch.MOVE_LIMIT + 1)],
+    ['0', '10', '--move-limit', '0'],
+    ['0', '10', '--node-budget', str(batch.NODE_LIMIT + 1)],
+    ['-1', '10'],
+    ['0', 'ten'],
+])
+def test_options_outside_the_record_fields_are_refused(argv):
+    with pytest.raises(SystemExit):
+        batch.parse_args(argv)
+
+
+def test_options_at_the_record_limits_are_taken():
+    options = batch.parse_args(['0', str(batch.SEED_LIMIT + 1), '--move-limit', str(batch.MOVE_LIMIT)])
+    assert options.move_limit == batch.MOVE_LIMIT and options.stop == batch.SEED_LIMIT + 1
+
+
+@pytest.mark.parametrize('option', ['--chunk', '--workers'])
+def test_counts_below_one_are_refused(option):
+    with pytest.raises(SystemExit):
+        batch.parse_args(['0', '10', option, '0'])
+
+
+# An error while the results come in reaches the caller, not the 'Pool is still running' of join
+def test_errors_stop_the_workers_and_come_through(tmp_path, monkeypatch, terminable_workers):
+    def fail(stats, code, moves):
+        raise RuntimeError('stats failed')
+    monkeypatch.setattr(batch.Stats, 'add', fail)
+    with pytest.raises(RuntimeError, match='stats failed'):
+        batch.main(['0', '4', '--mode', 'playout', '--workers', '1', '--chunk', '2',
+                    '--output', str(tmp_path / 'results.bin')])
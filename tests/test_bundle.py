@@ -0,0 +1,83 @@
+import os
+import shutil
+
+import pygame
+import pytest
+
+import bundle
+import describe
+from outlook import WinSet
+
+RESOURCES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'resources')
+
+
+@pytest.fixture
+def images(tmp_path, monkeypatch):
+    source = tmp_path / 'images'
+    shutil.copytree(RESOURCES, str(source))
+    monkeypatch.setattr(WinSet, 'image_path', str(source))
+    monkeypatch.setattr(describe.TextureCache, 'bundle', None)
+    yield source
+    if describe.TextureCache.bundle:
+        describe.TextureCache.bundle.close()
+
+
+def build(source):
+    return bundle.build(str(source), str(source / WinSet.image_bundle))
+
+
+# Every name the game asks for has a file of exactly that name, as the PNG files are read without a bundle
+def test_every_atlas_image_has_its_file():
+    files = set(bundle.source_files(RESOURCES))
+    assert [name for name in WinSet.image_atlas if name + WinSet.image_type not in files] == []
+
+
+def test_a_bundle_holds_the_images_of_its_files(images):
+    assert build(images) == len(bundle.source_files(str(images)))
+    store = describe.TextureCache.open_bundle()
+    assert store and store.matches(str(images), WinSet.image_atlas)
+    expected = pygame.image.load(str(images / (WinSet.image_back + WinSet.image_type)))
+    rect = store.rect(WinSet.image_back)
+    assert rect.size == expected.get_size()
+    atlas = store.atlas()
+    assert atlas.get_at(rect.move(3, 5).topleft) == expected.get_at((3, 5))
+
+
+def touch_back(images):
+    back = str(images / (WinSet.image_back + WinSet.image_type))
+    info = os.stat(back)
+    os.utime(back, ns=(info.st_atime_ns, info.st_mtime_ns + 10 ** 9))
+
+
+def test_a_bundle_older_than_its_files_is_not_used_when_checked(images, monkeypatch):
+    build(images)
+    touch_back(images)
+    monkeypatch.setattr(WinSet, 'check_bundle', True)
+    assert describe.TextureCache.open_bundle() is False
+
+
+# Without the check the image files are not looked at when the game starts
+def test_a_bundle_older_than_its_files_is_used_unless_checked(images):
+    build(images)
+    touch_back(images)
+    assert describe.TextureCache.open_bundle()
+
+
+def test_a_bundle_without_an_atlas_image_is_not_used(images, monkeypatch):
+    build(images)
+    monkeypatch.setattr(WinSet, 'image_atlas', WinSet.image_atlas + ['Back01'])
+    assert describe.TextureCache.open_bundle() is False
+
+
+@pytest.mark.parametrize('data', [b'', b'SOLB\x02\x00', b'SOLB\x01\x00' + bytes(16)])
+def test_a_damaged_bundle_is_not_used(images, data):
+    (images / WinSet.image_bundle).write_bytes(data)
+    assert describe.TextureCache.open_bundle() is False
+
+
+def test_a_cut_bundle_is_refused(images):
+    build(images)
+    path = images / WinSet.image_bundle
+    path.write_bytes(path.read_bytes()[:-100])
+    with pytest.raises(ValueError):
+        bundle.AssetBundle(str(path))
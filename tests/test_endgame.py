@@ -0,0 +1,107 @@
+import pytest
+
+import endgame
+import engine
+import solver
+
+
+# The first endgame board of the winning line of a deal
+def endgame_root(seed):
+    state = engine.KlondikeState.deal(engine.shuffled_codes(seed))
+    for move in solver.solve_state(state, 20000).moves:
+        if endgame.in_endgame(state):
+            return state
+        state.apply(move)
+
+
+@pytest.fixture
+def table(tmp_path):
+    root = endgame_root(2)
+    path = str(tmp_path / 'endgame.tb')
+    endgame.write_table(path, dict(endgame.solve_endgame(root)))
+    table = endgame.EndgameTable(path)
+    yield root, table
+    table.close()
+
+
+def test_best_moves_win_in_the_stored_distance(table):
+    state, table = table
+    distance = table.distance(state)
+    assert 0 < distance < endgame.UNWINNABLE
+    for played in range(1, distance + 1):
+        move = table.best_move(state)
+        assert state.is_legal(move)
+        state.apply(move)
+        assert table.distance(state) == distance - played
+    assert state.won() and table.best_move(state) is None
+
+
+def test_boards_outside_the_table_are_unknown(table):
+    root, table = table
+    assert table.distance(engine.KlondikeState.deal(engine.shuffled_codes(2))) is None
+    other = endgame_root(3)
+    assert table.distance(other) is None
+
+
+def test_entries_round_trip(table, tmp_path):
+    root, table = table
+    entries = dict(table.entries())
+    path = str(tmp_path / 'copy.tb')
+    endgame.write_table(path, entries)
+    copy = endgame.EndgameTable(path)
+    assert dict(copy.entries()) == entries and len(copy) == len(table) == len(entries)
+    copy.close()
+
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'SOLE\x02\x00\x04\x00\x01\x00',  # 10 bytes, shorter than the header
+    endgame.HEADER.pack(endgame.MAGIC, 1, endgame.TALON_LIMIT, 1, 0) + bytes(9),  # The old keys
+    endgame.HEADER.pack(endgame.MAGIC, endgame.VERSION, endgame.TALON_LIMIT, 4, 1) + bytes(9),  # Cut short
+    endgame.HEADER.pack(endgame.MAGIC, endgame.VERSION, endgame.TALON_LIMIT, 3, 1) + bytes(27),  # Not a power of 2
+    endgame.HEADER.pack(endgame.MAGIC, endgame.VERSION, endgame.TALON_LIMIT, 1, 1) + bytes(9),  # Full
+    b'SOLW' + bytes(40),
+])
+def test_bad_files_are_no_table(tmp_path, data):
+    path = tmp_path / 'bad.tb'
+    path.write_bytes(data)
+    assert endgame.load_table(str(path)) is None
+
+
+def test_missing_file_is_no_table(tmp_path):
+    assert endgame.load_table(str(tmp_path / 'missing.tb')) is None
+
+
+def test_empty_table_knows_nothing(tmp_path):
+    path = str(tmp_path / 'empty.tb')
+    endgame.write_table(path, {})
+    table = endgame.EndgameTable(path)
+    assert len(table) == 0 and table.distance(endgame_root(2)) is None
+    table.close()
+
+
+@pytest.mark.parametrize('argv', [['-1', '4'], ['0', '4', '--chunk', '0'], ['0', '4', '--workers', '0'],
+                                  ['0', '4', '--talon', '53']])
+def test_options_out_of_range_are_refused(argv):
+    with pytest.raises(SystemExit):
+        endgame.parse_args(argv)
+
+
+SOLVE_CHUNK = endgame.run_chunk
+
+
+# Worker that solves the chunk of seed 2 and fails on the next one
+def failing_chunk(task):
+    if task[0] == 2:
+        return SOLVE_CHUNK(task)
+    raise RuntimeError('chunk failed')
+
+
+def test_an_error_keeps_the_boards_found_so_far(tmp_path, monkeypatch, terminable_workers):
+    monkeypatch.setattr(endgame, 'run_chunk', failing_chunk)
+    path = str(tmp_path / 'endgame.tb')
+    with pytest.raises(RuntimeError, match='chunk failed'):
+        endgame.main(['2', '4', '--output', path, '--workers', '1', '--chunk', '1'])
+    table = endgame.EndgameTable(path)
+    assert table.distance(endgame_root(2)) is not None
+    table.close()
@@ -0,0 +1,91 @@
+import random
+
+import pytest
+
+import engine
+from engine import FOUNDATION, PILE_COUNT, STOCK, TABLEAU_COUNT, WASTE
+
+
+def test_codes_follow_the_image_names():
+    for name, code in engine.CARD_CODES.items():
+        assert engine.rank(code) == int(name[:2]) and engine.SUITS[engine.suit(code)] == name[-1]
+        assert bool(engine.is_red(code)) == (name[-1] in 'dh')
+
+
+def test_cards_stack_on_the_next_rank_of_the_other_color():
+    codes = engine.CARD_CODES
+    assert engine.can_stack(codes['08s'], codes['07h']) and engine.can_stack(codes['08d'], codes['07c'])
+    assert not engine.can_stack(codes['08s'], codes['07c']) and not engine.can_stack(codes['08h'], codes['07d'])
+    assert not engine.can_stack(codes['08s'], codes['06h']) and not engine.can_stack(codes['07h'], codes['08s'])
+    assert engine.can_found(None, codes['01h']) and not engine.can_found(None, codes['02h'])
+    assert engine.can_found(codes['01h'], codes['02h']) and not engine.can_found(codes['01h'], codes['02d'])
+    assert not engine.can_found(codes['13h'], codes['01h'])
+    assert engine.can_fill(codes['13c']) and not engine.can_fill(codes['12c'])
+
+
+def shuffled(seed):
+    codes = list(range(len(engine.CARD_CODES)))
+    random.Random(seed).shuffle(codes)
+    return codes
+
+
+def test_a_deal_lays_out_every_card_once():
+    state = engine.KlondikeState.deal(shuffled(7))
+    assert [len(state.piles[pile]) for pile in range(TABLEAU_COUNT)] == list(range(1, 8))
+    assert list(state.hidden) == list(range(7))
+    assert len(state.piles[STOCK]) == 24 and not state.piles[WASTE]
+    assert sorted(code for cards in state.piles for code in cards) == list(range(len(engine.CARD_CODES)))
+    assert not state.won() and state.foundation_count() == 0
+
+
+def test_legal_moves_are_legal_and_undo_reverses_them(boards):
+    for state in boards:
+        before = state.copy()
+        moves = state.legal_moves()
+        assert len(set(moves)) == len(moves)
+        for move in moves:
+            assert state.is_legal(move)
+            state.apply(move)
+            state.undo(move)
+            assert state == before
+
+
+# A move legal_moves leaves out is a copy of one it keeps (a flip with a count, the same card onto another empty
+# foundation, a draw of more than one card) or moves an ace from one foundation to another
+def test_every_legal_move_has_a_kept_equivalent(boards):
+    for state in boards:
+        kept = set(state.legal_moves())
+        for src in range(PILE_COUNT):
+            for dst in range(PILE_COUNT):
+                for count in range(len(engine.CARD_CODES)):
+                    move = src, dst, count
+                    if move in kept or not state.is_legal(move):
+                        continue
+                    if src == dst:
+                        assert (src, src, 0) in kept
+                    elif src == STOCK:
+                        assert (STOCK, WASTE, 1) in kept
+                    else:
+                        assert dst >= FOUNDATION and not state.piles[dst]
+                        assert src >= FOUNDATION or any(other[0] == src and other[1] >= FOUNDATION for other in kept)
+
+
+def test_talon_moves_turn_the_cards_over():
+    state = engine.KlondikeState()
+    state.piles[STOCK][:] = bytes((1, 2, 3))
+    state.play(state.talon_move())
+    state.play(state.talon_move())
+    assert list(state.piles[STOCK]) == [1] and list(state.piles[WASTE]) == [3, 2]
+    state.play(state.talon_move())
+    assert state.talon_move() == (WASTE, STOCK, 3)
+    state.play(state.talon_move())
+    assert list(state.piles[STOCK]) == [1, 2, 3] and not state.piles[WASTE]
+
+
+def test_play_refuses_illegal_moves():
+    state = engine.KlondikeState.deal(shuffled(7))
+    before = state.copy()
+    for move in [(0, 0, 0), (WASTE, 0, 1), (STOCK, 0, 1), (1, 2, 2), (STOCK, WASTE, 25)]:
+        with pytest.raises(ValueError):
+            state.play(move)
+    assert state == before
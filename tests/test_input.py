@@ -0,0 +1,63 @@
+import os
+
+import pygame
+import pytest
+from pygame.locals import MOUSEBUTTONDOWN, MOUSEBUTTONUP, MOUSEMOTION
+
+import benchmark
+import engine
+import main
+from describe import TextureCache
+from outlook import WinSet
+
+RESOURCES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'resources')
+
+
+def press(pos, time):
+    return pygame.event.Event(MOUSEBUTTONDOWN, pos=pos, button=1, time=time)
+
+
+def release(pos, time):
+    return pygame.event.Event(MOUSEBUTTONUP, pos=pos, button=1, time=time)
+
+
+def motion(pos, rel, time):
+    return pygame.event.Event(MOUSEMOTION, pos=pos, rel=rel, buttons=(1, 0, 0), time=time)
+
+
+def gestures(events):
+    classifier = main.DoubleClickFunction()
+    found = [classifier.classify(event, event.time) for event in events]
+    return [gesture for gesture in found if gesture]
+
+
+def test_clicks_double_clicks_and_drags_are_told_apart():
+    assert gestures([press((10, 10), 0), release((10, 10), 50)]) == [main.CLICK]
+    assert gestures([press((10, 10), 0), release((10, 10), 50), press((11, 10), 150), release((11, 10), 200)]) \
+        == [main.CLICK, main.DOUBLE_CLICK]
+    slow = WinSet.double_speed + 10
+    assert gestures([press((10, 10), 0), release((10, 10), 50), press((10, 10), 150), release((10, 10), slow)]) \
+        == [main.CLICK, main.CLICK]
+    assert gestures([press((10, 10), 0), motion((60, 10), (50, 0), 20), release((60, 10), 50)]) == [main.DRAG]
+
+
+@pytest.fixture
+def game(monkeypatch):
+    monkeypatch.setattr(WinSet, 'image_path', RESOURCES)
+    TextureCache.bundle = None
+    TextureCache.clear()
+    return benchmark.make_game()
+
+
+# The release acts on the gesture it ends: a click on the stock draws, a drag back to the stock does not
+def test_only_a_click_on_the_stock_draws(game):
+    rect = game.engine_piles()[engine.STOCK].rect
+    start = (rect.x + 2, rect.y + 2)
+    stock = len(game.moves.state.piles[engine.STOCK])
+    for event in [press(start, 0), motion((start[0] + 80, start[1]), (80, 0), 20),
+                  motion(start, (-80, 0), 40), release(start, 60)]:
+        game.handle_event(event)
+    assert len(game.moves.state.piles[engine.STOCK]) == stock
+    for event in [press(start, 2000), release(start, 2050)]:
+        game.handle_event(event)
+    assert len(game.moves.state.piles[engine.STOCK]) == stock - 1
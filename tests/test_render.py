@@ -0,0 +1,48 @@
+import os
+
+import pygame
+import pytest
+
+import benchmark
+import engine
+import profiler
+import solver
+from describe import TextureCache
+from outlook import WinSet
+
+RESOURCES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'resources')
+
+
+@pytest.fixture
+def game(monkeypatch):
+    monkeypatch.setattr(WinSet, 'image_path', RESOURCES)
+    TextureCache.bundle = None
+    TextureCache.clear()
+    game = benchmark.make_game()
+    game.counting_time = lambda: 0  # The timer would tick between the two frames that are compared
+    game.full_repaint = True
+    game.render_dirty()
+    return game
+
+
+# Frames painted from the dirty rects look the same as frames painted whole, with the cards picked up and
+# dragged half way (the drop is checked by the next move)
+def test_dirty_frames_match_full_frames(game):
+    result = solver.solve_deal([card.code for card in game.cards], 20000)
+    assert result.status == solver.WINNABLE
+    blits = frames = 0
+    for move in result.moves[:20]:
+        steps = [engine.draw_move()] * move[2] if move[0] == engine.STOCK else [move]
+        for step in steps:
+            action = benchmark.move_events(game, step)
+            for event in action:
+                game.handle_event(event)
+                before = profiler.counters['blits']
+                game.render_dirty()
+                blits += profiler.counters['blits'] - before
+                frames += 1
+                dirty = pygame.surfarray.array3d(game.screen)
+                game.render_full()
+                assert (pygame.surfarray.array3d(game.screen) == dirty).all()
+    # A whole pass over the piles alone takes more blits than this
+    assert blits / float(frames) < 13
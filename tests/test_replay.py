@@ -0,0 +1,126 @@
+import argparse
+import os
+
+import pygame
+import pytest
+from pygame.locals import K_a, K_h, KEYDOWN, KEYUP, MOUSEBUTTONDOWN, MOUSEBUTTONUP, MOUSEMOTION, QUIT, VIDEORESIZE
+
+import engine
+import replay
+from describe import TextureCache
+from outlook import WinSet
+
+RESOURCES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'resources')
+
+EVENTS = [
+    (0, pygame.event.Event(MOUSEBUTTONDOWN, pos=(120, 40), button=1)),
+    (16, pygame.event.Event(MOUSEMOTION, pos=(130, 52), rel=(10, 12), buttons=(1, 0, 0))),
+    (33, pygame.event.Event(MOUSEBUTTONUP, pos=(130, 52), button=1)),
+    (50, pygame.event.Event(KEYDOWN, key=pygame.K_h)),
+    (70, pygame.event.Event(VIDEORESIZE, size=(800, 600), w=800, h=600)),
+    (90, pygame.event.Event(QUIT)),
+]
+
+
+# The type of an event and the attributes a log keeps of it
+def fields(event):
+    return [event.type] + [getattr(event, name) for name in replay.KINDS[replay.KIND_OF[event.type]][2]]
+
+
+def record(path, seed, events, state):
+    recorder = replay.EventRecorder(str(path), seed)
+    for now, event in events:
+        recorder.record(event, 1000 + now)
+    recorder.close(state)
+
+
+@pytest.mark.parametrize('seed', [0, 8334, replay.SEED_LIMIT])
+def test_a_log_reads_back_as_it_was_recorded(tmp_path, seed):
+    state = engine.KlondikeState.deal(engine.shuffled_codes(4))
+    record(tmp_path / 'game.log', seed, EVENTS, state)
+    read_seed, events, final = replay.read_log(str(tmp_path / 'game.log'))
+    assert read_seed == seed and final == state
+    assert [now for now, event in events] == [now for now, event in EVENTS]
+    assert [fields(event) for now, event in events] == [fields(event) for now, event in EVENTS]
+
+
+def test_a_log_cut_short_has_no_final_board(tmp_path):
+    path = tmp_path / 'game.log'
+    record(path, 5, EVENTS, engine.KlondikeState.deal(engine.shuffled_codes(4)))
+    data = path.read_bytes()
+    path.write_bytes(data[:replay.HEADER.size + 20])
+    seed, events, final = replay.read_log(str(path))
+    assert seed == 5 and final is None and len(events) < len(EVENTS)
+
+
+def test_other_files_are_refused(tmp_path):
+    path = tmp_path / 'game.log'
+    path.write_bytes(b'SOLX' + bytes(replay.HEADER.size))
+    with pytest.raises(ValueError):
+        replay.read_log(str(path))
+
+
+def damaged(data):
+    kind = replay.HEADER.size + replay.EVENT.size - 1
+    final = len(data) - 5
+    return [
+        data[:replay.HEADER.size - 1],  # short header
+        data[:kind] + b'\x63' + data[kind + 1:],  # unknown kind
+        data[:final] + bytes([data[final] ^ 0xff]) + data[final + 1:],  # final board fails its checksum
+    ]
+
+
+@pytest.mark.parametrize('case', range(3))
+def test_damaged_logs_are_refused(tmp_path, case):
+    path = tmp_path / 'game.log'
+    record(path, 5, EVENTS, engine.KlondikeState.deal(engine.shuffled_codes(4)))
+    path.write_bytes(damaged(path.read_bytes())[case])
+    with pytest.raises(ValueError, match='damaged input log'):
+        replay.read_log(str(path))
+
+
+@pytest.mark.parametrize('text', ['-1', str(replay.SEED_LIMIT + 1), 'seven'])
+def test_session_seeds_outside_the_log_header_are_refused(text):
+    import main
+    with pytest.raises(argparse.ArgumentTypeError):
+        main.session_seed(text)
+    with pytest.raises(SystemExit):
+        main.parse_args(['--seed', text])
+
+
+def test_session_seeds_in_the_log_header_are_taken():
+    import main
+    assert main.parse_args(['--seed', str(replay.SEED_LIMIT)]).seed == replay.SEED_LIMIT
+    assert main.parse_args(['--seed', '0']).seed == 0
+
+
+# The moves of the demo and of auto play come from the log: a replay ends on the board of the recording,
+# and the keys that let the computer search or play do nothing in it
+def test_a_session_played_by_the_computer_replays_to_its_board(tmp_path, monkeypatch):
+    monkeypatch.setattr(WinSet, 'image_path', RESOURCES)
+    TextureCache.bundle = None
+    TextureCache.clear()
+    path = str(tmp_path / 'game.log')
+    game = replay.new_game(8334)
+    game.replaying = False
+    game.recorder = replay.EventRecorder(path, game.session_seed)
+
+    # The demo plays a few moves and deals the next game, then auto play is asked for
+    for _ in range(6):
+        game.play_new_move(game.moves.legal_moves()[0])
+    game.reset()
+    game.log(replay.dealt_event())
+    for _ in range(6):
+        game.play_new_move(game.moves.legal_moves()[0])
+    auto = pygame.event.Event(KEYUP, key=K_a)
+    game.recorder.record(auto, pygame.time.get_ticks())
+    game.handle_event(auto)
+    game.recorder.record(pygame.event.Event(KEYUP, key=K_h), pygame.time.get_ticks())
+    game.recorder.close(game.moves.state)
+
+    seed, events, final = replay.read_log(path)
+    assert replay.DEALT in [event.type for now, event in events]
+    copy = replay.new_game(seed)
+    replay.play(copy, events)
+    assert copy.snapshot() == final
+    assert copy.analysis is None and copy.demo is None
@@ -0,0 +1,69 @@
+import struct
+import zlib
+
+import pytest
+
+import engine
+import savegame
+
+
+def saved_board():
+    state = engine.KlondikeState.deal(engine.shuffled_codes(11))
+    for _ in range(3):
+        state.apply(state.legal_moves()[0])
+    return state
+
+
+# A saved seed names the same deal here, in the solver and in batch.py
+def test_a_seed_names_one_deal():
+    codes = engine.shuffled_codes(11)
+    assert codes == engine.shuffled_codes(11) != engine.shuffled_codes(12)
+    assert sorted(codes) == list(range(len(engine.CARD_CODES)))
+
+
+def test_a_save_is_one_record_that_reads_back():
+    state = saved_board()
+    data = savegame.pack(state, 11, 65432.7)
+    assert len(data) == savegame.SIZE == 90
+    assert savegame.unpack(data) == (state, 11, 65432)
+
+
+def test_negative_time_is_saved_as_zero():
+    assert savegame.unpack(savegame.pack(saved_board(), 0, -5))[2] == 0
+
+
+# A record with a valid checksum around the given body fields
+def resealed(data, **fields):
+    names = ('magic', 'version', 'seed', 'elapsed', 'sizes', 'hidden', 'codes')
+    values = dict(zip(names, savegame.BODY.unpack(data[:savegame.BODY.size])))
+    values.update(fields)
+    body = savegame.BODY.pack(*[values[name] for name in names])
+    return body + savegame.CHECKSUM.pack(zlib.crc32(body))
+
+
+@pytest.mark.parametrize('damage', [
+    lambda data: data[:-1],
+    lambda data: data + b'\0',
+    lambda data: data[:20] + bytes((data[20] ^ 1,)) + data[21:],
+    lambda data: data[:-4] + struct.pack('<I', zlib.crc32(data[:-4]) ^ 1),
+    lambda data: resealed(data, magic=b'SOLX'),
+    lambda data: resealed(data, version=savegame.VERSION + 1),
+    lambda data: resealed(data, codes=bytes(52)),
+    lambda data: resealed(data, sizes=bytes(13)),
+    lambda data: resealed(data, hidden=bytes((9,)) + bytes(6)),
+])
+def test_damaged_saves_are_refused(damage):
+    with pytest.raises(ValueError):
+        savegame.unpack(damage(savegame.pack(saved_board(), 11, 1000)))
+
+
+def test_the_writer_leaves_the_newest_save(tmp_path):
+    path = str(tmp_path / 'save.bin')
+    writer = savegame.SaveWriter(path)
+    saves = [savegame.pack(saved_board(), seed, seed * 1000) for seed in range(20)]
+    for data in saves:
+        writer.submit(data)
+    writer.close()
+    assert 1 <= writer.written <= len(saves)
+    assert savegame.load(path)[1:] == (19, 19000)
+    assert not (tmp_path / 'save.bin.tmp').exists()
@@ -0,0 +1,134 @@
+import random
+
+import pytest
+
+import engine
+import savegame
+import seedindex
+
+
+@pytest.fixture
+def entries():
+    rng = random.Random(5)
+    seeds = rng.sample(range(10 ** 6), 500) + [0, 2 ** 63]
+    return [(seed, rng.randrange(80, 200), rng.randrange(10 ** 6)) for seed in seeds]
+
+
+def test_varints_round_trip():
+    data = bytearray()
+    values = [0, 1, 127, 128, 300, 2 ** 32, 2 ** 64 - 1]
+    for value in values:
+        seedindex.write_varint(data, value)
+    position = 0
+    for value in values:
+        read, position = seedindex.read_varint(data, position)
+        assert read == value
+    assert position == len(data)
+
+
+def test_ranges_merge_and_leave_the_missing_parts():
+    assert seedindex.merge_ranges([(5, 8), (0, 2), (2, 4), (7, 10)]) == [(0, 4), (5, 10)]
+    assert seedindex.missing_ranges(0, 20, [(2, 4), (5, 10)]) == [(0, 2), (4, 5), (10, 20)]
+    assert seedindex.missing_ranges(3, 7, [(0, 20)]) == []
+    assert seedindex.missing_ranges(3, 7, []) == [(3, 7)]
+
+
+@pytest.mark.parametrize('block_size', [1, 7, seedindex.BLOCK_SIZE])
+def test_an_index_finds_its_entries(tmp_path, entries, block_size):
+    path = str(tmp_path / 'winnable.idx')
+    assert seedindex.write_index(path, entries, [(0, 10 ** 6), (2 ** 63, 2 ** 63 + 1)], block_size) == len(entries)
+    index = seedindex.SeedIndex(path)
+    try:
+        expected = sorted(entries)
+        assert len(index) == len(expected) and list(index.entries()) == expected
+        for number, entry in enumerate(expected):
+            assert index.entry(number) == entry and index.find(entry[0]) == number
+        known = set(seed for seed, moves, nodes in entries)
+        for seed in (1, 999999, 10 ** 6 + 1):
+            if seed not in known:
+                assert index.find(seed) is None
+        assert index.checked(999999) and not index.checked(10 ** 6)
+        with pytest.raises(IndexError):
+            index.entry(len(expected))
+    finally:
+        index.close()
+    assert seedindex.read_index(path) == (expected, [(0, 10 ** 6), (2 ** 63, 2 ** 63 + 1)])
+
+
+def test_an_empty_index_knows_nothing(tmp_path):
+    path = str(tmp_path / 'winnable.idx')
+    seedindex.write_index(path, [], [])
+    index = seedindex.SeedIndex(path)
+    assert len(index) == 0 and list(index.entries()) == [] and index.find(5) is None
+    index.close()
+    assert seedindex.read_index(str(tmp_path / 'missing.idx')) == ([], [])
+
+
+def damaged(data):
+    return [
+        b'',
+        data[:10],
+        b'SOLX' + data[4:],
+        data[:seedindex.HEADER.size + 20],
+        data[:len(data) - 200],
+    ]
+
+
+@pytest.mark.parametrize('case', range(5))
+def test_damaged_files_are_refused(tmp_path, entries, case):
+    path = tmp_path / 'winnable.idx'
+    seedindex.write_index(str(path), entries, [(0, 10 ** 6)])
+    path.write_bytes(damaged(path.read_bytes())[case])
+    with pytest.raises(ValueError):
+        seedindex.SeedIndex(str(path))
+
+
+@pytest.mark.parametrize('argv', [
+    ['-1', '10'],
+    [str(savegame.SEED_LIMIT + 1), str(savegame.SEED_LIMIT + 2)],
+    ['0', str(savegame.SEED_LIMIT + 2)],
+    ['0', '10', '--chunk', '0'],
+    ['0', '10', '--workers', '0'],
+])
+def test_build_options_outside_what_the_game_takes_are_refused(argv):
+    with pytest.raises(SystemExit):
+        seedindex.parse_args(argv)
+
+
+# The last seeds the game can save: every seed of the index deals and saves
+def test_an_index_at_the_seed_limit_gives_savable_deals(tmp_path):
+    path = str(tmp_path / 'winnable.idx')
+    start = savegame.SEED_LIMIT + 1 - 6
+    seedindex.main([str(start), str(savegame.SEED_LIMIT + 1), '--index', path, '--workers', '1', '--chunk', '3',
+                    '--node-budget', '20000'])
+    entries, ranges = seedindex.read_index(path)
+    assert ranges == [(start, savegame.SEED_LIMIT + 1)] and entries
+    for seed, moves, nodes in entries:
+        state = engine.KlondikeState.deal(engine.shuffled_codes(seed))
+        assert savegame.unpack(savegame.pack(state, seed, 0))[1] == seed
+
+
+def test_the_game_refuses_an_empty_index(tmp_path):
+    import main
+    path = str(tmp_path / 'winnable.idx')
+    seedindex.write_index(path, [], [(0, 100)])
+    with pytest.raises(SystemExit, match='no winnable seeds'):
+        main.main(['--winnable', path, '--no-save'])
+
+
+# The seeds checked before an error are kept in the index
+def test_an_error_keeps_the_seeds_checked_so_far(tmp_path, monkeypatch, terminable_workers):
+    class Clock(object):
+        calls = 0
+
+        # The third look at the clock comes after the second chunk is in
+        def time(self):
+            Clock.calls += 1
+            if Clock.calls == 3:
+                raise RuntimeError('clock failed')
+            return 0.0
+    monkeypatch.setattr(seedindex, 'time', Clock())
+    path = str(tmp_path / 'winnable.idx')
+    with pytest.raises(RuntimeError, match='clock failed'):
+        seedindex.main(['0', '12', '--index', path, '--workers', '1', '--chunk', '3', '--node-budget', '2000'])
+    assert seedindex.read_index(path)[1] == [(0, 6)]
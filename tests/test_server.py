@@ -0,0 +1,93 @@
+import asyncio
+import json
+
+import pytest
+
+import engine
+import server
+
+
+def ask(game, request):
+    line = request if isinstance(request, (bytes, str)) else json.dumps(request)
+    answer = game.handle_line(line)
+    assert answer.endswith(b'\n') and answer.count(b'\n') == 1
+    return json.loads(answer)
+
+
+@pytest.fixture
+def game():
+    return server.GameServer()
+
+
+def test_a_game_is_dealt_played_and_undone(game):
+    dealt = ask(game, {'op': 'deal', 'seed': 5, 'id': 'a'})
+    assert dealt == {'ok': True, 'session': 1, 'seed': 5, 'id': 'a'}
+    state = ask(game, {'op': 'state', 'session': 1})
+    expected = engine.KlondikeState.deal(engine.shuffled_codes(5))
+    assert state['piles'][6] == [None] * 6 + [expected.piles[6][-1]]
+    assert state['piles'][engine.STOCK] == [None] * len(expected.piles[engine.STOCK])
+
+    drawn = ask(game, {'op': 'draw', 'session': 1})
+    assert drawn['ok'] and drawn['move'][:2] == [engine.STOCK, engine.WASTE]
+    expected.apply(tuple(drawn['move']))
+    moves = ask(game, {'op': 'moves', 'session': 1})['moves']
+    assert sorted(map(tuple, moves)) == sorted(expected.legal_moves())
+    assert ask(game, {'op': 'undo', 'session': 1})['move'] == drawn['move']
+    assert ask(game, {'op': 'redo', 'session': 1})['move'] == drawn['move']
+    assert ask(game, {'op': 'close', 'session': 1}) == {'ok': True}
+    assert ask(game, {'op': 'stats'})['sessions'] == 0
+
+
+def test_illegal_moves_are_refused(game):
+    ask(game, {'op': 'deal', 'seed': 5})
+    answer = ask(game, {'op': 'move', 'session': 1, 'src': 0, 'dst': 0, 'count': 3})
+    assert not answer['ok'] and 'illegal move' in answer['error']
+    answer = ask(game, {'op': 'move', 'session': 1, 'src': 99, 'dst': 0, 'count': 1})
+    assert not answer['ok']
+
+
+@pytest.mark.parametrize('line', [
+    b'not json',
+    b'[1, 2]',
+    b'{"op": "fly"}',
+    b'{"op": [1]}',
+    b'{"op": {"a": 1}}',
+    b'{"op": "move", "session": [1]}',
+    b'{"op": "move", "session": "1"}',
+    b'{"op": "state", "session": 7}',
+    b'{"op": "move", "session": 1, "src": 8.5, "dst": 2, "count": 1}',
+    b'{"op": "move", "session": 1, "src": 8, "dst": true, "count": 1}',
+    b'{"op": "move", "session": 1, "src": 8, "dst": 2, "count": [1]}',
+    b'{"op": "move", "session": 1, "src": 8, "dst": 2}',
+    b'{"op": "deal", "seed": 1.5}',
+    b'{"op": "deal", "seed": "5"}',
+    b'[' * 50000,
+    b'{"op": "stats", "id": ' + b'{"a": ' * 50000,
+])
+def test_bad_requests_get_an_error_answer(game, line):
+    ask(game, {'op': 'deal', 'seed': 5})
+    answer = ask(game, line)
+    assert answer['ok'] is False and answer['error']
+    assert ask(game, {'op': 'state', 'session': 1})['history'] == 0
+
+
+def test_a_line_too_long_is_answered_and_skipped(game):
+    async def talk():
+        reader = asyncio.StreamReader(limit=64)
+        reader.feed_data(b'{"op": "stats", "id": "' + b'x' * 200 + b'"}\n')
+        reader.feed_data(b'{"op": "deal", "seed": 1}\n')
+        reader.feed_data(b'x' * 300)
+        reader.feed_eof()
+        lines = []
+        while True:
+            line = await server.read_line(reader)
+            if line is None:
+                lines.append(None)
+            elif not line:
+                return lines
+            else:
+                lines.append(json.loads(game.handle_line(line)))
+
+    lines = asyncio.run(talk())
+    assert lines[0] is None and lines[2] is None and len(lines) == 3
+    assert lines[1]['ok'] and lines[1]['seed'] == 1
@@ -0,0 +1,117 @@
+import random
+
+import engine
+import solver
+from engine import FOUNDATION, PILE_COUNT, STOCK, TABLEAU_COUNT, WASTE
+
+
+# Every (src, dst, count) a board could be asked about
+ALL_MOVES = [(src, dst, count) for src in range(PILE_COUNT) for dst in range(PILE_COUNT)
+             for count in range(engine.CARD_COUNT - sum(range(1, TABLEAU_COUNT + 1)) + 1)]
+
+
+def swapped(state, suits):
+    state = state.copy()
+    for cards in state.piles:
+        cards[:] = bytes(code & ~3 | suits[code & 3] for code in cards)
+    return state
+
+
+def shuffled_piles(state, rng):
+    state = state.copy()
+    order = list(range(TABLEAU_COUNT))
+    rng.shuffle(order)
+    state.piles[:TABLEAU_COUNT] = [state.piles[pile] for pile in order]
+    state.hidden[:] = bytes(state.hidden[pile] for pile in order)
+    foundations = state.piles[FOUNDATION:]
+    rng.shuffle(foundations)
+    state.piles[FOUNDATION:] = foundations
+    return state
+
+
+def test_suit_swaps_only_swap_suits_of_one_color():
+    for suits in solver.SUIT_SWAPS:
+        assert sorted(suits) == list(range(4))
+        for suit, into in enumerate(suits):
+            assert (suit in engine.RED_SUITS) == (into in engine.RED_SUITS)
+
+
+def test_suit_swaps_keep_every_move_legal_or_illegal(boards):
+    for state in boards:
+        legal = [state.is_legal(move) for move in ALL_MOVES]
+        for suits in solver.SUIT_SWAPS:
+            other = swapped(state, suits)
+            assert [other.is_legal(move) for move in ALL_MOVES] == legal
+
+
+def test_symmetric_keys_match_swapped_and_reordered_boards(boards):
+    rng = random.Random(1)
+    for state in boards:
+        for suits in solver.SUIT_SWAPS:
+            other = shuffled_piles(swapped(state, suits), rng)
+            assert solver.symmetric_hash(other) == solver.symmetric_hash(state)
+            assert solver.canonical_board(other) == solver.canonical_board(state)
+
+
+# A red card and a black card of the same rank do not play the same
+def test_symmetric_keys_tell_colors_apart():
+    state = engine.KlondikeState()
+    seven_diamonds = engine.CARD_CODES['07d']
+    state.piles[0][:] = bytes((seven_diamonds,))
+    clubs, hearts = state.copy(), state.copy()
+    clubs.piles[WASTE][:] = bytes((engine.CARD_CODES['06c'],))
+    hearts.piles[WASTE][:] = bytes((engine.CARD_CODES['06h'],))
+    assert clubs.is_legal((WASTE, 0, 1)) and not hearts.is_legal((WASTE, 0, 1))
+    assert solver.symmetric_hash(clubs) != solver.symmetric_hash(hearts)
+    assert solver.canonical_board(clubs) != solver.canonical_board(hearts)
+
+
+def test_incremental_symmetric_key_follows_the_moves():
+    state = engine.KlondikeState.deal(engine.shuffled_codes(3))
+    search = solver.Solver(state, symmetric=True)
+    rng = random.Random(2)
+    played = []
+    for _ in range(200):
+        moves = search.state.legal_moves()
+        if not moves:
+            break
+        move = rng.choice(moves)
+        search.play(move)
+        played.append(move)
+        assert search.key() == solver.symmetric_hash(search.state)
+    for move in reversed(played):
+        search.play(move, True)
+    assert search.state == state and search.key() == solver.symmetric_hash(state)
+
+
+def test_winning_line_replays_to_a_win():
+    state = engine.KlondikeState.deal(engine.shuffled_codes(8334))
+    result = solver.solve_state(state, 20000)
+    assert result.status == solver.WINNABLE
+    for move in result.moves:
+        state.play(move)
+    assert state.won()
+
+
+# Two piles that block each other: each ace lies under the two of the suit buried in the other pile
+def blocked_board():
+    state = engine.KlondikeState()
+    state.piles[0][:] = bytes((engine.CARD_CODES['01d'], engine.CARD_CODES['02c']))
+    state.piles[1][:] = bytes((engine.CARD_CODES['01c'], engine.CARD_CODES['02d']))
+    state.hidden[:2] = b'\x01\x01'
+    return state
+
+
+def test_search_without_pruned_moves_proves_a_loss():
+    result = solver.solve_state(blocked_board(), 20000)
+    assert result.status == solver.NOT_WINNABLE and result.moves == []
+
+
+# Moving the whole 3 of hearts onto the 4 of spades is legal but left out, so the search proves nothing
+def test_search_with_pruned_moves_finds_no_win():
+    state = blocked_board()
+    state.piles[2][:] = bytes((engine.CARD_CODES['03h'],))
+    state.piles[3][:] = bytes((engine.CARD_CODES['04s'],))
+    assert state.is_legal((2, 3, 1))
+    result = solver.solve_state(state, 20000)
+    assert result.status == solver.NO_WIN_FOUND and result.moves == []
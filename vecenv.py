@@ -0,0 +1,268 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+
+import engine
+from engine import CARD_COUNT, FOUNDATION, KING, PILE_COUNT, STOCK, TABLEAU_COUNT, WASTE
+
+# Many Klondike games stepped together, every step works on whole NumPy arrays instead of looping over the games
+# Needs NumPy (the game itself does not)
+# Usage: python vecenv.py [--games 4096] [--steps 500] runs random legal moves and reports the steps per second
+#
+# The boards are the engine states as arrays: cards[game, pile] holds the codes of a pile bottom first, padded
+# with EMPTY, heights[game, pile] their number and hidden[game, pile] the face down cards of the tableau piles
+# An action is src * PILE_COUNT + dst with the engine pile indices, the number of cards it moves follows from the
+# board (a face up run is always in sequence, so only one of its cards can go on a given pile):
+#   src == dst turns the top card of that tableau pile, STOCK -> WASTE draws one card, WASTE -> STOCK recycles,
+#   anything else moves the cards that fit dst, with the rules of engine.KlondikeState.is_legal
+
+ACTION_COUNT = PILE_COUNT * PILE_COUNT
+NOOP = STOCK * PILE_COUNT + STOCK  # Never legal, a game given it stays as it is
+EMPTY = -1
+HIDDEN = CARD_COUNT  # A face down card in the observations
+TALON_SIZE = CARD_COUNT - sum(range(1, TABLEAU_COUNT + 1))  # Most cards a single move can carry (a recycle)
+
+# The engine tables with one more entry at the end, so looking up EMPTY (-1) is valid and never matches
+RANKS = np.append(np.frombuffer(engine.RANKS, dtype=np.uint8), 0).astype(np.int16)
+SUCCESSOR = np.append(np.frombuffer(engine.SUCCESSOR, dtype=np.uint8), engine.NO_CARD).astype(np.int16)
+RED = np.append(np.frombuffer(engine.RED, dtype=np.uint8), 0).astype(np.int16)
+
+PILES = np.arange(PILE_COUNT)
+TABLEAU = np.arange(TABLEAU_COUNT)
+# Size of every pile in a new deal: 1 to 7 tableau cards, the rest on the draw pile
+DEAL_HEIGHTS = np.array([i + 1 for i in range(TABLEAU_COUNT)] + [TALON_SIZE] + [0] * (PILE_COUNT - STOCK - 1))
+# Cards of a new deal that are face up: the top card of every tableau pile
+DEAL_VISIBLE = np.zeros((PILE_COUNT, CARD_COUNT), dtype=bool)
+DEAL_VISIBLE[TABLEAU, TABLEAU] = True
+
+
+def action(src, dst):
+    return src * PILE_COUNT + dst
+
+
+class VectorKlondike(object):
+    # Games are dealt with engine.shuffled_codes of seed, seed + 1, ... (so the same deals as the game and the solver)
+    # A game that is won, stuck or reaches max_steps is dealt again with the next seed by step (unless auto_reset
+    # is off, then it stays as it is until it is dealt or loaded again)
+    def __init__(self, count, seed=0, max_steps=1000, auto_reset=True):
+        self.count = count
+        self.max_steps = max_steps
+        self.auto_reset = auto_reset
+        self.next_seed = seed
+        self.rows = np.arange(count)
+        self.cards = np.full((count, PILE_COUNT, CARD_COUNT), EMPTY, dtype=np.int8)
+        self.visible = self.cards.copy()  # The cards as the player sees them, face down cards are HIDDEN
+        self.heights = np.zeros((count, PILE_COUNT), dtype=np.int32)
+        self.hidden = np.zeros((count, TABLEAU_COUNT), dtype=np.int32)
+        self.steps = np.zeros(count, dtype=np.int32)
+        self.seeds = np.zeros(count, dtype=np.int64)
+        self.mask = None  # Legal actions of the current boards, (legal, counts) until the boards change
+        self.reset()
+
+    def reset(self):
+        self.deal(self.rows)
+        return self.observation()
+
+    def deal(self, games):
+        seeds = np.arange(self.next_seed, self.next_seed + len(games))
+        self.next_seed += len(games)
+        codes = np.array([engine.shuffled_codes(int(seed)) for seed in seeds], dtype=np.int8).reshape(-1, CARD_COUNT)
+        self.cards[games] = EMPTY
+        marker = 0
+        for pile, height in enumerate(DEAL_HEIGHTS):
+            self.cards[games, pile, :height] = codes[:, marker: marker + height]
+            marker += height
+        self.visible[games] = np.where(DEAL_VISIBLE | (self.cards[games] == EMPTY), self.cards[games], HIDDEN)
+        self.heights[games] = DEAL_HEIGHTS
+        self.hidden[games] = TABLEAU
+        self.steps[games] = 0
+        self.seeds[games] = seeds
+        self.mask = None
+
+    # Put engine states on the boards of games (their seeds become -1)
+    def load(self, games, states):
+        rows = []
+        for state in states:
+            row = bytearray(b'\xff' * (PILE_COUNT * CARD_COUNT))
+            for pile, cards in enumerate(state.piles):
+                row[pile * CARD_COUNT: pile * CARD_COUNT + len(cards)] = cards
+            rows.append(row)
+        cards = np.frombuffer(b''.join(rows), dtype=np.int8).reshape(-1, PILE_COUNT, CARD_COUNT)
+        self.cards[games] = cards
+        self.heights[games] = [[len(pile) for pile in state.piles] for state in states]
+        self.hidden[games] = np.frombuffer(b''.join(bytes(state.hidden) for state in states),
+                                           dtype=np.uint8).reshape(-1, TABLEAU_COUNT)
+        face_down = np.zeros((len(rows), PILE_COUNT), dtype=np.int32)
+        face_down[:, :TABLEAU_COUNT] = self.hidden[games]
+        face_down[:, STOCK] = self.heights[games, STOCK]
+        self.visible[games] = np.where(np.arange(CARD_COUNT) < face_down[:, :, None], HIDDEN, cards)
+        self.steps[games] = 0
+        self.seeds[games] = -1
+        self.mask = None
+
+    # The top card of every pile (EMPTY for empty piles)
+    def tops(self):
+        heights = self.heights
+        tops = self.cards[self.rows[:, None], PILES, np.maximum(heights - 1, 0)].astype(np.int16)
+        tops[heights == 0] = EMPTY
+        return tops
+
+    # legal[game, src, dst] and the number of cards each legal move carries
+    def legal_moves(self):
+        if self.mask is not None:
+            return self.mask
+        heights = self.heights
+        tops = self.tops()
+        top_ranks = RANKS[tops]
+
+        # Cards that can be picked up: the face up run of a tableau pile, the top card of the others
+        movable = np.minimum(heights, 1)
+        movable[:, :TABLEAU_COUNT] = heights[:, :TABLEAU_COUNT] - self.hidden
+        movable[:, STOCK] = 0
+
+        legal = np.zeros((self.count, PILE_COUNT, PILE_COUNT), dtype=bool)
+        counts = np.ones((self.count, PILE_COUNT, PILE_COUNT), dtype=np.int32)
+
+        # To the tableau: the card of the run that is one lower than the top of dst (a king for an empty pile)
+        # A run alternates colours, so that card is red if the top of src is red and it lies an odd number deep
+        dst_heights = heights[:, :TABLEAU_COUNT]
+        wanted = np.where(dst_heights == 0, KING,
+                          np.where(movable[:, :TABLEAU_COUNT] > 0, top_ranks[:, :TABLEAU_COUNT] - 1, -CARD_COUNT))
+        count = wanted[:, None, :] - top_ranks[:, :, None] + 1
+        fitting = (count >= 1) & (count <= movable[:, :, None])
+        top_reds = RED[tops]
+        fitting &= (dst_heights[:, None, :] == 0) | \
+            (top_reds[:, :, None] ^ (count & 1) == top_reds[:, None, :TABLEAU_COUNT])
+        fitting[:, TABLEAU, TABLEAU] = False
+        legal[:, :, :TABLEAU_COUNT] = fitting
+        counts[:, :, :TABLEAU_COUNT] = count
+
+        # To the foundations: one card, the ace of an empty foundation or the successor of its top card
+        foundation_tops = tops[:, None, FOUNDATION:]
+        moving = tops[:, :, None]
+        founded = np.where(foundation_tops == EMPTY, RANKS[moving] == 1, SUCCESSOR[foundation_tops] == moving)
+        founded &= movable[:, :, None] > 0
+        founded[:, PILES[FOUNDATION:], PILES[FOUNDATION:] - FOUNDATION] = False
+        legal[:, :, FOUNDATION:] = founded
+
+        # Turning, drawing and recycling
+        hidden = self.hidden
+        legal[:, TABLEAU, TABLEAU] = (hidden > 0) & (hidden == dst_heights)
+        counts[:, TABLEAU, TABLEAU] = 0
+        legal[:, STOCK, WASTE] = heights[:, STOCK] > 0
+        legal[:, WASTE, STOCK] = (heights[:, STOCK] == 0) & (heights[:, WASTE] > 0)
+        counts[:, WASTE, STOCK] = heights[:, WASTE]
+
+        self.mask = legal, counts
+        return self.mask
+
+    # Boolean mask of the legal actions, one row per game
+    def legal_mask(self):
+        return self.legal_moves()[0].reshape(self.count, ACTION_COUNT)
+
+    # Play one action per game, illegal actions are not played
+    # Returns the observation, the reward (cards gained on the foundations), done and an info dict
+    # Finished games are dealt again with auto_reset, the observation of such a game is its next deal
+    def step(self, actions):
+        actions = np.asarray(actions)
+        legal, counts = self.legal_moves()
+        src = actions // PILE_COUNT
+        dst = actions % PILE_COUNT
+        played = legal[self.rows, src, dst]
+        count = counts[self.rows, src, dst]
+        before = self.heights[:, FOUNDATION:].sum(axis=1)
+
+        turned = played & (src == dst)
+        turned = self.rows[turned], src[turned]
+        self.hidden[turned] -= 1
+        turned += (self.hidden[turned],)
+        self.visible[turned] = self.cards[turned]
+
+        moved = played & (src != dst)
+        games, src, dst, count = self.rows[moved], src[moved], dst[moved], count[moved]
+        # Cards to or from the draw pile are turned over, so their order is reversed
+        reverse = (src == STOCK) | (dst == STOCK)
+        offset = np.arange(TALON_SIZE)[None, :]
+        active = offset < count[:, None]
+        src_heights = self.heights[games, src][:, None]
+        src_positions = np.where(reverse[:, None], src_heights - 1 - offset, src_heights - count[:, None] + offset)
+        dst_positions = self.heights[games, dst][:, None] + offset
+        games_b = np.broadcast_to(games[:, None], active.shape)[active]
+        src_b = np.broadcast_to(src[:, None], active.shape)[active]
+        dst_b = np.broadcast_to(dst[:, None], active.shape)[active]
+        values = self.cards[games_b, src_b, src_positions[active]]
+        self.cards[games_b, src_b, src_positions[active]] = EMPTY
+        self.cards[games_b, dst_b, dst_positions[active]] = values
+        self.visible[games_b, src_b, src_positions[active]] = EMPTY
+        self.visible[games_b, dst_b, dst_positions[active]] = np.where(dst_b == STOCK, HIDDEN, values)
+        np.subtract.at(self.heights, (games, src), count)
+        np.add.at(self.heights, (games, dst), count)
+        self.mask = None
+
+        self.steps += 1
+        after = self.heights[:, FOUNDATION:].sum(axis=1)
+        won = after == CARD_COUNT
+        stuck = ~self.legal_mask().any(axis=1)
+        done = won | stuck | (self.steps >= self.max_steps)
+        info = {'played': played, 'won': won, 'seeds': self.seeds.copy()}
+        if self.auto_reset and done.any():
+            self.deal(self.rows[done])
+        return self.observation(), after - before, done, info
+
+    # The boards as the player sees them: the codes with the face down cards as HIDDEN
+    def observation(self):
+        return self.visible.copy()
+
+    # One game as an engine state
+    def state(self, game):
+        state = engine.KlondikeState()
+        for pile in PILES:
+            state.piles[pile][:] = bytes(self.cards[game, pile, :self.heights[game, pile]].astype(np.uint8))
+        state.hidden[:] = bytes(self.hidden[game].astype(np.uint8))
+        return state
+
+    # The engine move of an action of a game (None if it is illegal there)
+    def move(self, game, action_index):
+        legal, counts = self.legal_moves()
+        src, dst = divmod(int(action_index), PILE_COUNT)
+        if legal[game, src, dst]:
+            return src, dst, int(counts[game, src, dst])
+
+
+# Random legal actions for every game, weights (one per action) make some actions more likely
+def random_actions(mask, rng, weights=None):
+    keys = rng.random(mask.shape) * mask
+    if weights is not None:
+        keys *= weights
+    return np.argmax(keys, axis=1)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Step many games with random legal moves and time it')
+    parser.add_argument('--games', type=int, default=4096)
+    parser.add_argument('--steps', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(sys.argv[1:] if argv is None else argv)
+    env = VectorKlondike(options.games, options.seed)
+    rng = np.random.default_rng(options.seed)
+    finished = won = 0
+    start = time.perf_counter()
+    for _ in range(options.steps):
+        observation, reward, done, info = env.step(random_actions(env.legal_mask(), rng))
+        finished += int(done.sum())
+        won += int(info['won'].sum())
+    elapsed = time.perf_counter() - start
+    steps = options.games * options.steps
+    print('%d steps of %d games in %.2f s: %.0f steps/s, %d games finished, %d won'
+          % (steps, options.games, elapsed, steps / elapsed, finished, won))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())